@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+PaddleOCR 推理服务压测工具
+
+Runs against a local server (default http://localhost:8080) or a SageMaker
+endpoint, in closed-loop (fixed concurrency) or open-loop (fixed arrival
+rate) mode, and reports p50/p90/p99 latency and QPS as JSON.
+
+使用方法:
+  # 本地 stub 后端，只测服务框架开销 (无需 GPU/PaddleOCR)
+  python3 benchmark.py --serve-stub --concurrency 8 --duration 30
+
+  # 本地启动指定后端 (paddle / paddle-cpu / onnx / stub)，便于横向对比
+  python3 benchmark.py --serve paddle-cpu --concurrency 4 --output cpu.json
+
+  # 本地服务 (已在 8080 端口运行)
+  python3 benchmark.py --url http://localhost:8080 --concurrency 4
+
+  # SageMaker 端点，固定到达率 20 QPS
+  python3 benchmark.py --endpoint-name paddleocr-g5-endpoint-xxx --rate 20 --duration 60
+
+  # 结果写入 JSON 文件，便于回归对比
+  python3 benchmark.py --serve-stub --output bench.json
+
+  # 分别压测各流水线模式 (完整 / 仅检测 / 仅识别行图 / 不做方向分类)
+  python3 benchmark.py --url http://localhost:8080 --pipelines full,det,rec,nocls
+
+  # 容量规划输入: 对端点逐级提高并发，结果记录实例类型 (端点的实例类型和数量自动查询)
+  for c in 1 2 4 8 16; do
+    python3 benchmark.py --endpoint-name paddleocr-g5-endpoint-xxx -c $c --duration 120 --output g5_c$c.json
+  done
+  python3 one_click_deploy.py --plan g5_c*.json --peak-qps 40 --p99-ms 800
+"""
+
+import argparse
+import base64
+import glob
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_SIZES = '400x100,640x480,1280x960,2480x3508'
+DEFAULT_LINE_WIDTHS = '120,240,480,960'
+
+# Request options for each pipeline mode (X-OCR-<Name> headers / CustomAttributes)
+PIPELINES = {
+    'full': {},
+    'det': {'Mode': 'det'},
+    'rec': {'Mode': 'rec'},
+    'nocls': {'Cls': '0'},
+}
+
+
+def make_corpus(sizes):
+    """Synthetic JPEG pages of different sizes with a few text lines each"""
+    import cv2
+    import numpy as np
+
+    corpus = []
+    for size in sizes.split(','):
+        width, height = (int(v) for v in size.split('x'))
+        img = np.full((height, width, 3), 255, dtype=np.uint8)
+        line_height = max(20, min(height // 4, 48))
+        for i, y in enumerate(range(line_height, height - line_height // 2, line_height * 2)):
+            cv2.putText(img, f'Benchmark line {i} 0123456789', (10, y), cv2.FONT_HERSHEY_SIMPLEX,
+                        line_height / 40.0, (0, 0, 0), 2)
+        ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        corpus.append((size, encoded.tobytes()))
+    return corpus
+
+
+def make_line_corpus(widths):
+    """Synthetic single-line JPEG crops, the input of the rec pipeline mode"""
+    import cv2
+    import numpy as np
+
+    corpus = []
+    for width in (int(v) for v in widths.split(',')):
+        img = np.full((48, width, 3), 255, dtype=np.uint8)
+        text = ('Line 0123456789 ' * (width // 120 + 1))[:max(4, width // 16)]
+        cv2.putText(img, text, (4, 34), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+        ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        corpus.append((f'line{width}', encoded.tobytes()))
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(directory, '*'))):
+        if path.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')):
+            with open(path, 'rb') as f:
+                corpus.append((os.path.basename(path), f.read()))
+    return corpus
+
+
+def build_payloads(corpus, request_format, batch_size=1):
+    """Encode the corpus as (body, content_type) pairs in the chosen request format"""
+    payloads = []
+    if request_format == 'raw':
+        for _, data in corpus:
+            payloads.append((data, 'application/x-image'))
+    elif request_format == 'json':
+        for _, data in corpus:
+            body = json.dumps({'image': base64.b64encode(data).decode('utf-8')})
+            payloads.append((body.encode(), 'application/json'))
+    else:
+        encoded = [base64.b64encode(data).decode('utf-8') for _, data in corpus]
+        for start in range(len(encoded)):
+            group = [encoded[(start + i) % len(encoded)] for i in range(batch_size)]
+            if request_format == 'images':
+                body = json.dumps({'images': group})
+                payloads.append((body.encode(), 'application/json'))
+            else:
+                body = ''.join(json.dumps({'image': image}) + '\n' for image in group)
+                payloads.append((body.encode(), 'application/jsonlines'))
+    return payloads
+
+
+class HttpTarget:
+    """POSTs to a local /invocations with one persistent connection per thread"""
+
+    def __init__(self, url, headers=None):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.headers = headers or {}
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return conn
+
+    def send(self, body, content_type):
+        conn = self._connection()
+        try:
+            conn.request('POST', '/invocations', body=body,
+                         headers=dict(self.headers, **{'Content-Type': content_type}))
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def ping(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=5)
+        try:
+            conn.request('GET', '/ping')
+            return conn.getresponse().status
+        finally:
+            conn.close()
+
+    def backend(self):
+        """Backend name reported by the server's ocr_backend_info metric"""
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=5)
+        try:
+            conn.request('GET', '/metrics')
+            text = conn.getresponse().read().decode()
+        except (OSError, http.client.HTTPException):
+            return None
+        finally:
+            conn.close()
+        for line in text.splitlines():
+            if line.startswith('ocr_backend_info{'):
+                for pair in line[line.index('{') + 1:line.index('}')].split(','):
+                    key, _, value = pair.partition('=')
+                    if key == 'backend':
+                        return value.strip('"')
+        return None
+
+
+class EndpointTarget:
+    """Calls a SageMaker endpoint through invoke_endpoint"""
+
+    def __init__(self, endpoint_name, region, concurrency, custom_attributes=None):
+        import boto3
+        from botocore.config import Config
+        self.endpoint_name = endpoint_name
+        self.custom_attributes = custom_attributes
+        self.runtime = boto3.client('sagemaker-runtime', region_name=region,
+                                    config=Config(max_pool_connections=max(10, concurrency),
+                                                  retries={'max_attempts': 0}))
+
+    def send(self, body, content_type):
+        kwargs = {'EndpointName': self.endpoint_name, 'ContentType': content_type, 'Body': body}
+        if self.custom_attributes:
+            kwargs['CustomAttributes'] = self.custom_attributes
+        try:
+            response = self.runtime.invoke_endpoint(**kwargs)
+        except self.runtime.exceptions.ModelError as e:
+            return e.response.get('OriginalStatusCode', 500)
+        response['Body'].read()
+        return 200
+
+
+def endpoint_instances(endpoint_name, region):
+    """(instance type, current instance count) of the endpoint's first production variant"""
+    import boto3
+    sagemaker = boto3.client('sagemaker', region_name=region)
+    endpoint = sagemaker.describe_endpoint(EndpointName=endpoint_name)
+    config = sagemaker.describe_endpoint_config(EndpointConfigName=endpoint['EndpointConfigName'])
+    variant = config['ProductionVariants'][0]
+    current = next((v.get('CurrentInstanceCount') for v in endpoint.get('ProductionVariants', [])
+                    if v['VariantName'] == variant['VariantName']), None)
+    return variant.get('InstanceType'), current or variant.get('InitialInstanceCount', 1)
+
+
+def percentile(sorted_values, p):
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = (len(sorted_values) - 1) * p / 100.0
+    low = int(index)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (index - low)
+
+
+def summarize(records, started, warmup, finished):
+    """Latency and throughput stats for requests issued after the warmup period"""
+    measured = [r for r in records if r[0] >= started + warmup]
+    window = max(1e-9, finished - (started + warmup))
+    ok = sorted(latency for _, latency, status in measured if status == 200)
+    statuses = {}
+    for _, _, status in measured:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(measured),
+        'successful': len(ok),
+        'errors': len(measured) - len(ok),
+        'status_counts': statuses,
+        'duration_s': window,
+        'qps': len(ok) / window,
+        'latency_ms': {
+            'mean': 1000 * sum(ok) / len(ok) if ok else None,
+            'min': 1000 * ok[0] if ok else None,
+            'p50': 1000 * percentile(ok, 50) if ok else None,
+            'p90': 1000 * percentile(ok, 90) if ok else None,
+            'p99': 1000 * percentile(ok, 99) if ok else None,
+            'max': 1000 * ok[-1] if ok else None,
+        },
+    }
+
+
+def _timed_send(target, payload, scheduled):
+    try:
+        status = target.send(*payload)
+    except Exception:
+        status = 'exception'
+    return scheduled, time.perf_counter() - scheduled, status
+
+
+def run_closed_loop(target, payloads, concurrency, duration, max_requests=None):
+    """Each of `concurrency` workers sends its next request as soon as the last returns"""
+    records = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    stop_at = started + duration
+    counter = iter(range(max_requests)) if max_requests else None
+
+    def worker(index):
+        i = index
+        while time.perf_counter() < stop_at:
+            if counter is not None and next(counter, None) is None:
+                break
+            record = _timed_send(target, payloads[i % len(payloads)], time.perf_counter())
+            with lock:
+                records.append(record)
+            i += concurrency
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, started, time.perf_counter()
+
+
+def run_open_loop(target, payloads, rate, duration, max_in_flight):
+    """Issue requests at a fixed arrival rate regardless of response times
+
+    Latency is measured from each request's scheduled start, so time spent
+    waiting for a free client slot counts (no coordinated omission).
+    """
+    interval = 1.0 / rate
+    futures = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        i = 0
+        while True:
+            scheduled = started + i * interval
+            if scheduled >= started + duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(_timed_send, target, payloads[i % len(payloads)], scheduled))
+            i += 1
+    records = [future.result() for future in futures]
+    return records, started, time.perf_counter()
+
+
+def start_local_server(port, server_mode, backend, extra_env=None):
+    """Launch inference_gpu.py with the given OCR backend and wait until /ping is 200"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, OCR_BACKEND=backend, OCR_SERVER=server_mode, OCR_PORT=str(port),
+               **(extra_env or {}))
+    proc = subprocess.Popen([sys.executable, os.path.join(here, 'inference_gpu.py')], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    target = HttpTarget(f'http://127.0.0.1:{port}')
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('Local server exited during startup')
+        try:
+            if target.ping() == 200:
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError('Local server did not become ready')
+
+
+def run(target, payloads, concurrency=1, rate=None, duration=30, warmup=5,
+        max_requests=None, max_in_flight=64):
+    """Run one benchmark and return its summary dict"""
+    if rate:
+        records, started, finished = run_open_loop(target, payloads, rate, duration + warmup, max_in_flight)
+    else:
+        records, started, finished = run_closed_loop(target, payloads, concurrency, duration + warmup,
+                                                     max_requests)
+    return summarize(records, started, warmup, finished)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PaddleOCR 推理服务压测')
+    target_group = parser.add_mutually_exclusive_group()
+    target_group.add_argument('--url', default='http://localhost:8080', help='本地服务地址')
+    target_group.add_argument('--endpoint-name', help='SageMaker 端点名称')
+    target_group.add_argument('--serve-stub', action='store_true',
+                              help='启动使用 stub OCR 后端的本地服务，只测服务开销')
+    target_group.add_argument('--serve', metavar='BACKEND',
+                              help='启动使用指定 OCR 后端的本地服务 (paddle/paddle-cpu/onnx/stub)')
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--server', default='flask', choices=['flask', 'gunicorn'],
+                        help='--serve/--serve-stub 使用的服务模式')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--stub-det-ms', type=float, default=0.0, help='stub 每次检测的模拟耗时')
+    parser.add_argument('--stub-rec-ms', type=float, default=0.0, help='stub 每行识别的模拟耗时')
+    parser.add_argument('--concurrency', '-c', type=int, default=1, help='闭环模式并发数')
+    parser.add_argument('--rate', type=float, help='开环模式固定到达率 (请求/秒)')
+    parser.add_argument('--max-in-flight', type=int, default=64, help='开环模式最大在途请求数')
+    parser.add_argument('--duration', type=float, default=30, help='计入统计的压测时长 (秒)')
+    parser.add_argument('--warmup', type=float, default=5, help='预热时长 (秒)，不计入统计')
+    parser.add_argument('--requests', type=int, help='闭环模式最多发送的请求数')
+    parser.add_argument('--corpus', help='图片目录，默认使用合成图片')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='合成图片尺寸 WxH，逗号分隔')
+    parser.add_argument('--format', default='raw', choices=['raw', 'json', 'images', 'jsonlines'],
+                        help='请求格式')
+    parser.add_argument('--batch', type=int, default=4, help='images/jsonlines 格式每个请求的图片数')
+    parser.add_argument('--pipelines', default='full',
+                        help='流水线模式，逗号分隔依次压测: full/det/rec (行图识别)/nocls (不做方向分类)')
+    parser.add_argument('--line-corpus', help='rec 模式使用的文本行图片目录，默认使用合成行图')
+    parser.add_argument('--line-widths', default=DEFAULT_LINE_WIDTHS, help='合成行图宽度，逗号分隔')
+    parser.add_argument('--header', action='append', default=[], help='附加请求头 Name:Value')
+    parser.add_argument('--custom-attributes', help='SageMaker CustomAttributes')
+    parser.add_argument('--instance-type', help='记录到结果中的实例类型 (容量规划用，端点可自动查询)')
+    parser.add_argument('--instance-count', type=int, help='压测目标的实例数，默认 1 (端点可自动查询)')
+    parser.add_argument('--output', help='结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    pipelines = [name.strip() for name in args.pipelines.split(',') if name.strip()]
+    for name in pipelines:
+        if name not in PIPELINES:
+            sys.exit(f"Unknown pipeline '{name}' (choose from {', '.join(PIPELINES)})")
+    corpus = load_corpus(args.corpus) if args.corpus else make_corpus(args.sizes)
+    line_corpus = None
+    if 'rec' in pipelines:
+        line_corpus = load_corpus(args.line_corpus) if args.line_corpus else make_line_corpus(args.line_widths)
+    if not corpus or line_corpus == []:
+        sys.exit('Corpus is empty')
+
+    server = None
+    backend = 'stub' if args.serve_stub else args.serve
+    if backend:
+        server = start_local_server(args.port, args.server, backend,
+                                    {'OCR_STUB_DET_MS': str(args.stub_det_ms),
+                                     'OCR_STUB_REC_MS': str(args.stub_rec_ms)})
+        url = f'http://127.0.0.1:{args.port}'
+    else:
+        url = args.url
+    headers = dict(h.split(':', 1) for h in args.header)
+
+    instance_type, instance_count = args.instance_type, args.instance_count
+    if args.endpoint_name and not (instance_type and instance_count):
+        try:
+            found_type, found_count = endpoint_instances(args.endpoint_name, args.region)
+            instance_type, instance_count = instance_type or found_type, instance_count or found_count
+        except Exception as e:
+            print(f"Could not look up endpoint instances: {e}", file=sys.stderr)
+
+    reports = []
+    try:
+        if not args.endpoint_name:
+            backend = HttpTarget(url).backend() or backend
+        for name in pipelines:
+            options = PIPELINES[name]
+            if args.endpoint_name:
+                attributes = [args.custom_attributes] if args.custom_attributes else []
+                attributes += [f'{key.lower()}={value}' for key, value in options.items()]
+                target = EndpointTarget(args.endpoint_name, args.region, args.concurrency,
+                                        ';'.join(attributes) or None)
+            else:
+                pipeline_headers = {k.strip(): v.strip() for k, v in headers.items()}
+                pipeline_headers.update(('X-OCR-' + key, value) for key, value in options.items())
+                target = HttpTarget(url, pipeline_headers)
+            pipeline_corpus = line_corpus if name == 'rec' else corpus
+            payloads = build_payloads(pipeline_corpus, args.format, args.batch)
+            summary = run(target, payloads, args.concurrency, args.rate, args.duration, args.warmup,
+                          args.requests, args.max_in_flight)
+            reports.append({
+                'target': args.endpoint_name or url,
+                'backend': backend,
+                'server': args.server if server is not None else None,
+                'instance_type': instance_type,
+                'instance_count': instance_count or 1,
+                'pipeline': name,
+                'mode': 'open' if args.rate else 'closed',
+                'concurrency': None if args.rate else args.concurrency,
+                'rate': args.rate,
+                'format': args.format,
+                'batch': args.batch if args.format in ('images', 'jsonlines') else 1,
+                'corpus': [corpus_name for corpus_name, _ in pipeline_corpus],
+                'warmup_s': args.warmup,
+                **summary,
+            })
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    for report in reports:
+        latency = report['latency_ms']
+        if latency['p50'] is not None:
+            print(f"[{report['pipeline']}] QPS {report['qps']:.1f}  p50 {latency['p50']:.1f}ms  "
+                  f"p90 {latency['p90']:.1f}ms  p99 {latency['p99']:.1f}ms  "
+                  f"errors {report['errors']}/{report['requests']}")
+        else:
+            print(f"[{report['pipeline']}] No successful requests ({report['status_counts']})")
+    # A single pipeline keeps the flat report shape; several are written as a list
+    result = reports[0] if len(reports) == 1 else reports
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
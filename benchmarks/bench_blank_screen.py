@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Blank page pre-screen on a mixed corpus of scanned-looking pages.
+
+Pages are A4 at 200 DPI, JPEG compressed as a scanner would. Pages with
+text range from full pages down to a lone page number, faint and barely
+visible grey lines and white-on-dark text. Blank pages are plain, noisy,
+unevenly lit and colored separator sheets, plus dust specks, punch
+holes, faint show-through from the back side and a scanner shadow along
+one edge.
+
+Reports, per kind of page, how many the screen skipped and its time per
+page, and overall the false-skip rate (pages with text that were
+skipped) and the share of blank pages skipped. With --ocr every page is
+also run through the backend (OCR_BACKEND, PaddleOCR on GPU by default):
+a page counts as having text when the model returns a line, and the
+model time of the skipped blank pages is what the screen saves.
+
+Usage:
+  python3 benchmarks/bench_blank_screen.py
+  python3 benchmarks/bench_blank_screen.py --pages 20 --max-std 16 --ocr --output blank.json
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from ocr_screen import BlankScreen
+
+PAGE_SIZE = (1654, 2339)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def words(rng, count):
+    return ' '.join(''.join(rng.choice(string.ascii_letters) for _ in range(rng.randint(2, 9)))
+                    for _ in range(count))
+
+
+def page(rng, background=255):
+    width, height = PAGE_SIZE
+    return np.full((height, width, 3), background, dtype=np.uint8)
+
+
+def text_lines(img, rng, color=(20, 20, 20), scale=0.9, lines=40):
+    for i in range(lines):
+        cv2.putText(img, words(rng, rng.randint(5, 11)), (120, 160 + i * 52), FONT, scale, color, 2, cv2.LINE_AA)
+    return img
+
+
+def full_page(rng):
+    return text_lines(page(rng), rng)
+
+
+def sparse(rng):
+    img = page(rng)
+    cv2.putText(img, words(rng, 3), (rng.randint(120, 900), rng.randint(300, 2000)), FONT, 0.9,
+                (20, 20, 20), 2, cv2.LINE_AA)
+    return img
+
+
+def page_number(rng):
+    img = page(rng)
+    cv2.putText(img, str(rng.randint(2, 99)), (800, 2250), FONT, 0.8, (30, 30, 30), 2, cv2.LINE_AA)
+    return img
+
+
+def faint(rng):
+    return text_lines(page(rng), rng, color=(175, 175, 175), lines=12)
+
+
+def very_faint(rng):
+    return text_lines(page(rng), rng, color=(228, 228, 228), lines=12)
+
+
+def inverted(rng):
+    return text_lines(page(rng, 40), rng, color=(235, 235, 235), lines=12)
+
+
+def white(rng):
+    return page(rng)
+
+
+def noise(rng, img=None, sigma=8):
+    img = page(rng) if img is None else img
+    generator = np.random.default_rng(rng.randint(0, 2 ** 31))
+    return np.clip(img + generator.normal(0, sigma, img.shape), 0, 255).astype(np.uint8)
+
+
+def gradient(rng):
+    width, height = PAGE_SIZE
+    ramp = np.linspace(rng.uniform(235, 255), rng.uniform(190, 215), width, dtype=np.float32)
+    img = np.repeat(np.tile(ramp, (height, 1))[:, :, None], 3, axis=2)
+    return noise(rng, img, sigma=6)
+
+
+def colored(rng):
+    img = page(rng)
+    img[:] = rng.choice([(200, 230, 250), (180, 240, 200), (240, 200, 220), (150, 200, 250)])
+    return noise(rng, img, sigma=5)
+
+
+def dust(rng):
+    img = page(rng)
+    for _ in range(rng.randint(20, 80)):
+        cv2.circle(img, (rng.randint(0, PAGE_SIZE[0]), rng.randint(0, PAGE_SIZE[1])), rng.randint(1, 2),
+                   (rng.randint(40, 140),) * 3, -1)
+    return noise(rng, img, sigma=4)
+
+
+def punched(rng):
+    img = page(rng)
+    for y in (700, 1170, 1640):
+        cv2.circle(img, (80, y), 24, (35, 35, 35), -1)
+    return noise(rng, img, sigma=4)
+
+
+def show_through(rng):
+    back = cv2.flip(text_lines(page(rng), rng, color=(0, 0, 0)), 1)
+    faded = 255 - (255 - back.astype(np.float32)) * 0.05
+    return noise(rng, cv2.GaussianBlur(faded, (9, 9), 0), sigma=3)
+
+
+def shadow(rng):
+    img = page(rng)
+    band = rng.randint(15, 40)
+    img[:, :band] = rng.randint(60, 120)
+    return noise(rng, img, sigma=4)
+
+
+KINDS = [
+    ('full page', True, full_page), ('sparse line', True, sparse), ('page number', True, page_number),
+    ('faint text', True, faint), ('very faint text', True, very_faint), ('inverted text', True, inverted),
+    ('white', False, white), ('noise', False, noise), ('uneven light', False, gradient),
+    ('separator', False, colored), ('dust', False, dust), ('punch holes', False, punched),
+    ('show-through', False, show_through), ('edge shadow', False, shadow),
+]
+
+
+def scan(img, quality=85):
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Blank page pre-screen benchmark')
+    parser.add_argument('--pages', type=int, default=10, help='Pages per kind')
+    parser.add_argument('--max-std', type=float, default=12.0)
+    parser.add_argument('--max-edge-density', type=float, default=0.005)
+    parser.add_argument('--max-ink-ratio', type=float, default=0.001)
+    parser.add_argument('--thumbnail', type=int, default=640)
+    parser.add_argument('--ocr', action='store_true', help='Also run the OCR backend on every page')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    screen = BlankScreen(args.max_std, args.max_edge_density, args.max_ink_ratio, args.thumbnail)
+    backend = None
+    if args.ocr:
+        import inference_gpu
+        backend = inference_gpu.init_ocr()
+        if backend is None:
+            sys.exit('OCR backend is not available')
+        backend.infer([scan(full_page(random.Random(0)))])  # warmup
+
+    report = []
+    print(f"{'page kind':<16} {'text':>5} {'skipped':>8} {'screen ms':>10} {'ocr lines':>10} {'ocr ms':>8}")
+    for name, has_text, make in KINDS:
+        row = {'kind': name, 'text': has_text, 'pages': args.pages, 'skipped': 0, 'screen_ms': 0.0,
+               'ocr_pages_with_text': None, 'ocr_ms': None, 'skipped_with_ocr_text': None}
+        if backend is not None:
+            row.update(ocr_pages_with_text=0, ocr_ms=0.0, skipped_with_ocr_text=0)
+        for seed in range(args.pages):
+            img = scan(make(random.Random(seed)))
+            started = time.perf_counter()
+            skipped = screen.is_blank(img)
+            row['screen_ms'] += 1000 * (time.perf_counter() - started) / args.pages
+            row['skipped'] += skipped
+            if backend is not None:
+                started = time.perf_counter()
+                lines = backend.infer([img])[0]
+                row['ocr_ms'] += 1000 * (time.perf_counter() - started) / args.pages
+                row['ocr_pages_with_text'] += bool(lines)
+                row['skipped_with_ocr_text'] += bool(lines) and skipped
+        report.append(row)
+        print(f"{name:<16} {'yes' if has_text else 'no':>5} {row['skipped']:>4}/{args.pages:<3} "
+              f"{row['screen_ms']:>10.2f} {'-' if row['ocr_ms'] is None else row['ocr_pages_with_text']:>10} "
+              f"{'-' if row['ocr_ms'] is None else format(row['ocr_ms'], '.1f'):>8}")
+
+    text_rows = [row for row in report if row['text']]
+    blank_rows = [row for row in report if not row['text']]
+    summary = {
+        'false_skip_rate': sum(row['skipped'] for row in text_rows) / sum(row['pages'] for row in text_rows),
+        'blank_skip_rate': sum(row['skipped'] for row in blank_rows) / sum(row['pages'] for row in blank_rows),
+    }
+    print(f"false skips (text pages skipped): {summary['false_skip_rate']:.1%}; "
+          f"blank pages skipped: {summary['blank_skip_rate']:.1%}")
+    if backend is not None:
+        summary['ocr_false_skips'] = sum(row['skipped_with_ocr_text'] for row in report)
+        summary['ocr_ms_saved_per_skipped_page'] = (
+            sum(row['ocr_ms'] * row['skipped'] for row in blank_rows)
+            / max(1, sum(row['skipped'] for row in blank_rows)))
+        print(f"skipped pages where the model found text: {summary['ocr_false_skips']}; "
+              f"model time saved per skipped page: {summary['ocr_ms_saved_per_skipped_page']:.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'thresholds': {'max_std': args.max_std, 'max_edge_density': args.max_edge_density,
+                                      'max_ink_ratio': args.max_ink_ratio, 'thumbnail': args.thumbnail},
+                       'summary': summary, 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
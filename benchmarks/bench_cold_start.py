@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Cold start of the inference server: process start to first successful /ping.
+
+Launches the server the way the container does, polls /ping until it
+returns 200, and reads the server's own ocr_cold_start_seconds and
+ocr_startup_seconds phases from /metrics before stopping it. Run it once
+with the local model store and once without (a fresh HOME makes PaddleOCR
+download the models again) to see what the store saves per new instance:
+
+  python3 benchmarks/bench_cold_start.py --store ./models
+  python3 benchmarks/bench_cold_start.py --download
+
+Runs the backend selected by OCR_BACKEND (PaddleOCR on GPU by default).
+
+Usage:
+  python3 benchmarks/bench_cold_start.py --runs 5 --server gunicorn --output cold_start.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import start_local_server
+
+
+def read_metrics(url):
+    """Cold start and startup phase gauges from /metrics"""
+    with urllib.request.urlopen(url + '/metrics', timeout=10) as response:
+        text = response.read().decode()
+    values = {}
+    for line in text.splitlines():
+        if line.startswith('ocr_cold_start_seconds '):
+            values['cold_start'] = float(line.split()[1])
+        elif line.startswith('ocr_startup_seconds{phase="'):
+            phase = line.split('"')[1]
+            values[phase] = float(line.split()[-1])
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inference server cold start benchmark')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--server', choices=['flask', 'gunicorn'], default='flask')
+    parser.add_argument('--port', type=int, default=8090)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--store', help='Model store directory (OCR_MODEL_STORE, offline)')
+    source.add_argument('--download', action='store_true',
+                        help='No model store: PaddleOCR downloads the models into an empty HOME each run')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    backend = os.environ.get('OCR_BACKEND', 'paddle')
+    url = f'http://127.0.0.1:{args.port}'
+    report = []
+    print(f"{'run':>4} {'to /ping s':>11} {'server cold start s':>20}  phases")
+    for run in range(args.runs):
+        env = {'OCR_WORKERS': '1'}
+        if args.store:
+            env.update(OCR_MODEL_STORE=os.path.abspath(args.store), OCR_OFFLINE='1')
+        home = tempfile.TemporaryDirectory() if args.download else None
+        if home is not None:
+            env.update(HOME=home.name, OCR_MODEL_STORE='none', OCR_OFFLINE='0')
+        started = time.time()
+        proc = start_local_server(args.port, args.server, backend, env)
+        elapsed = time.time() - started
+        try:
+            metrics = read_metrics(url)
+        finally:
+            proc.terminate()
+            proc.wait()
+            if home is not None:
+                home.cleanup()
+        phases = {k: round(v, 2) for k, v in metrics.items() if k != 'cold_start'}
+        report.append({'run': run, 'seconds_to_ping': elapsed, 'cold_start_seconds': metrics.get('cold_start'),
+                       'phases': phases})
+        print(f"{run:>4} {elapsed:>11.2f} {metrics.get('cold_start', float('nan')):>20.2f}  {json.dumps(phases)}")
+
+    times = [row['seconds_to_ping'] for row in report]
+    print(f"to /ping: min {min(times):.2f}s, median {statistics.median(times):.2f}s, max {max(times):.2f}s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'backend': backend, 'server': args.server, 'store': args.store,
+                       'download': args.download, 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
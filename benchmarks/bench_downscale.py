@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Accuracy versus latency of adaptive input downscaling.
+
+Builds a phone-photo-sized JPEG page with lines of known text, then runs
+decode + OCR with the downscale limit set to each value of --sides (max
+side in pixels) and --pixels (pixel budget), 0 meaning full resolution.
+Reports decode time, OCR time, recall (see bench_tiling.py) and how far
+the rescaled boxes are from the full-resolution ones.
+
+Runs the backend selected by OCR_BACKEND (PaddleOCR on GPU by default).
+
+Usage:
+  python3 benchmarks/bench_downscale.py
+  python3 benchmarks/bench_downscale.py --size 3024x4032 --sides 0,2048,1600,1280,960 --pixels 2000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+import inference_gpu
+from bench_tiling import make_page, recall
+
+
+def make_photo(width, height, font_scale, quality=90):
+    """Text page with sensor-like noise, JPEG encoded; returns (bytes, ground truth lines)"""
+    img, truth = make_page(width, height, font_scale)
+    rng = np.random.default_rng(0)
+    img = cv2.subtract(img, rng.integers(0, 20, size=img.shape, dtype=np.uint8))
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes(), truth
+
+
+def box_error(result, reference):
+    """Mean distance (px) from each box centre to the nearest full-resolution box centre"""
+    if not result or not reference:
+        return None
+    ref = np.array([np.mean(line[0], axis=0) for line in reference])
+    distances = [np.min(np.linalg.norm(ref - np.mean(line[0], axis=0), axis=1)) for line in result]
+    return float(np.mean(distances))
+
+
+def run(backend, image_bytes, runs):
+    """Mean decode and OCR time, and the result with boxes in original coordinates"""
+    decode_times, ocr_times = [], []
+    for i in range(runs + 1):
+        started = time.perf_counter()
+        img, scale = inference_gpu.decode_image(image_bytes)
+        decoded = time.perf_counter()
+        result = inference_gpu.rescale_boxes(backend.infer([img])[0], scale)
+        if i:  # first run is warmup
+            decode_times.append(decoded - started)
+            ocr_times.append(time.perf_counter() - decoded)
+    return result, img.shape, sum(decode_times) / runs, sum(ocr_times) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Input downscaling accuracy/latency benchmark')
+    parser.add_argument('--size', default='3000x4000', help='Page size WxH (default: 3000x4000)')
+    parser.add_argument('--font-scale', type=float, default=1.4)
+    parser.add_argument('--sides', default='0,2560,1920,1600,1280,960',
+                        help='Max side limits to test, comma separated (0 = full resolution)')
+    parser.add_argument('--pixels', default='', help='Pixel budgets to test, comma separated')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--match', type=float, default=0.8, help='Similarity needed to count a line as found')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    backend = inference_gpu.init_ocr()
+    if backend is None:
+        sys.exit('OCR backend is not available')
+
+    width, height = (int(v) for v in args.size.split('x'))
+    image_bytes, truth = make_photo(width, height, args.font_scale)
+    limits = [('side', int(v)) for v in args.sides.split(',') if v.strip()]
+    limits += [('pixels', int(v)) for v in args.pixels.split(',') if v.strip()]
+
+    report = []
+    reference = None
+    print(f"{'limit':<16} {'decoded':>10} {'decode ms':>10} {'ocr ms':>8} {'recall':>7} {'box err px':>11}")
+    for kind, value in limits:
+        inference_gpu.DOWNSCALE_MAX_SIDE = value if kind == 'side' else 0
+        inference_gpu.DOWNSCALE_MAX_PIXELS = value if kind == 'pixels' else 0
+        result, shape, decode_s, ocr_s = run(backend, image_bytes, args.runs)
+        if reference is None and value == 0:
+            reference = result
+        error = box_error(result, reference) if reference is not None else None
+        row = {'limit': kind, 'value': value, 'decoded': f'{shape[1]}x{shape[0]}',
+               'decode_ms': 1000 * decode_s, 'ocr_ms': 1000 * ocr_s,
+               'recall': recall(truth, result, args.match), 'box_error_px': error}
+        report.append(row)
+        print(f"{kind + '=' + str(value):<16} {row['decoded']:>10} {row['decode_ms']:>10.1f} "
+              f"{row['ocr_ms']:>8.1f} {row['recall']:>7.1%} "
+              f"{'-' if error is None else format(error, '.1f'):>11}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'backend': backend.name, 'size': args.size, 'lines': len(truth),
+                       'jpeg_bytes': len(image_bytes), 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
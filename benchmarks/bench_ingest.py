@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Image ingestion microbenchmark for inference_gpu.py.
+
+Compares per-request CPU time and peak memory of:
+  legacy - the original JSON path (base64 -> PIL -> np.array -> cvtColor)
+  json   - the current JSON path (base64 -> cv2.imdecode)
+  raw    - the raw-bytes path (streamed body -> cv2.imdecode)
+
+Each path runs in a fresh process so peak RSS is not shared between them.
+
+Usage:
+  python3 benchmarks/bench_ingest.py
+  python3 benchmarks/bench_ingest.py --size 3000x4000 --iterations 50
+"""
+
+import argparse
+import base64
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from PIL import Image
+
+PATHS = ('legacy', 'json', 'raw')
+
+
+def make_image(width, height, quality=90):
+    """JPEG page with text lines and sensor-like noise, similar to a phone photo"""
+    rng = np.random.default_rng(0)
+    img = np.full((height, width, 3), 235, dtype=np.uint8)
+    img = cv2.add(img, rng.integers(0, 20, size=img.shape, dtype=np.uint8))
+    for y in range(80, height - 40, 90):
+        cv2.putText(img, 'Invoice 2025-09-16 Total 1234.56 CNY', (40, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.6, (20, 20, 20), 3)
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes()
+
+
+def legacy_decode(body):
+    """The pre-optimization JSON path, kept here as the baseline"""
+    data = json.loads(body)
+    image_data = base64.b64decode(data['image'])
+    image = Image.open(io.BytesIO(image_data))
+    img_array = np.array(image)
+    return cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def run_path(path, image_bytes, iterations, results):
+    import inference_gpu
+
+    if path == 'raw':
+        body = image_bytes
+        decode = lambda: inference_gpu.decode_image(
+            inference_gpu.read_body(io.BytesIO(body), len(body)))
+    else:
+        body = json.dumps({'image': base64.b64encode(image_bytes).decode('utf-8')}).encode()
+        if path == 'legacy':
+            decode = lambda: legacy_decode(body)
+        else:
+            decode = lambda: inference_gpu.decode_base64_image(json.loads(body)['image'])
+
+    decode()  # first call loads codec libraries
+    rss_before = current_rss_mb()
+
+    cpu_times = []
+    for _ in range(iterations):
+        started = time.process_time()
+        decode()
+        cpu_times.append(time.process_time() - started)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # Python/numpy allocations of a single request
+    tracemalloc.start()
+    decode()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results[path] = {
+        'body_bytes': len(body),
+        'cpu_ms_mean': 1000 * sum(cpu_times) / len(cpu_times),
+        'cpu_ms_min': 1000 * min(cpu_times),
+        'peak_rss_over_baseline_mb': max(0.0, peak_rss - rss_before),
+        'traced_peak_mb': traced_peak / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Image ingestion microbenchmark')
+    parser.add_argument('--size', default='3000x4000', help='Image size WxH (default: 3000x4000)')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split('x'))
+    image_bytes = make_image(width, height)
+
+    ctx = multiprocessing.get_context('spawn')
+    manager = ctx.Manager()
+    results = manager.dict()
+    for path in PATHS:
+        proc = ctx.Process(target=run_path, args=(path, image_bytes, args.iterations, results))
+        proc.start()
+        proc.join()
+
+    report = {'image': {'width': width, 'height': height, 'jpeg_bytes': len(image_bytes)},
+              'iterations': args.iterations, 'paths': dict(results)}
+
+    print(f"{'path':<8} {'body MB':>8} {'CPU ms':>8} {'peak RSS+ MB':>13} {'traced MB':>10}")
+    for path in PATHS:
+        r = report['paths'][path]
+        print(f"{path:<8} {r['body_bytes'] / 1e6:>8.2f} {r['cpu_ms_mean']:>8.1f} "
+              f"{r['peak_rss_over_baseline_mb']:>13.1f} {r['traced_peak_mb']:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Line recognition cache on invoice-like pages with repeated text.
+
+Every page shares a template: company header, column headings, field
+labels and footer lines that are printed identically on each page. The
+values (invoice number, dates, line items, totals) change per page. With
+--jitter the pages are offset by a few pixels and JPEG compressed, as
+scans of the same template would be, which only the perceptual hash
+still matches.
+
+Runs the same pages with the cache off, with exact hashing and with
+perceptual hashing, and reports recognition time per page (cache lookup
++ classification + recognition), the hit rate, and how many lines came
+back with text different from the uncached run (wrong cache answers).
+
+Runs the backend selected by OCR_BACKEND (PaddleOCR on GPU by default).
+
+Usage:
+  python3 benchmarks/bench_line_cache.py
+  python3 benchmarks/bench_line_cache.py --pages 50 --jitter 2 --output line_cache.json
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+import inference_gpu
+from result_cache import LineCache
+
+TEMPLATE = [
+    'ACME INDUSTRIAL SUPPLY CO., LTD.', '1200 HARBOR BOULEVARD, SUITE 400', 'TEL 555-0100  FAX 555-0199',
+    'INVOICE', 'INVOICE NO.', 'DATE', 'CUSTOMER', 'PAYMENT TERMS', 'NET 30',
+    'ITEM', 'DESCRIPTION', 'QTY', 'UNIT PRICE', 'AMOUNT',
+    'SUBTOTAL', 'TAX', 'TOTAL', 'THANK YOU FOR YOUR BUSINESS', 'PLEASE REMIT TO ACCOUNT 00-1234-5678',
+]
+
+
+def make_invoice(seed, items, jitter):
+    """Invoice page; about half of its lines come from the shared template"""
+    rng = random.Random(seed)
+    img = np.full((2339, 1654, 3), 255, dtype=np.uint8)
+    font = cv2.FONT_HERSHEY_SIMPLEX
+
+    def text(value, x, y, scale=0.9, thickness=2):
+        cv2.putText(img, value, (x, y), font, scale, (0, 0, 0), thickness, cv2.LINE_AA)
+
+    def word(length):
+        return ''.join(rng.choice(string.ascii_uppercase) for _ in range(length))
+
+    text(TEMPLATE[0], 120, 130, 1.3, 3)
+    text(TEMPLATE[1], 120, 190)
+    text(TEMPLATE[2], 120, 240)
+    text(TEMPLATE[3], 1250, 130, 1.6, 3)
+    for i, label in enumerate(TEMPLATE[4:8]):
+        text(label, 120, 360 + i * 60)
+    text(f'INV-{seed:06d}', 520, 360)
+    text(f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}', 520, 420)
+    text(f'{word(6)} {word(8)} LLC', 520, 480)
+    text(TEMPLATE[8], 520, 540)
+    for label, x in zip(TEMPLATE[9:14], (120, 260, 900, 1080, 1340)):
+        text(label, x, 680)
+    total = 0
+    for i in range(items):
+        y = 750 + i * 60
+        qty, price = rng.randint(1, 20), rng.randint(100, 99999) / 100
+        total += qty * price
+        text(str(i + 1), 120, y)
+        text(f'{word(5)} {word(7)}', 260, y)
+        text(str(qty), 900, y)
+        text(f'{price:.2f}', 1080, y)
+        text(f'{qty * price:.2f}', 1340, y)
+    y = 750 + items * 60 + 60
+    for i, (label, value) in enumerate(zip(TEMPLATE[14:17], (total, total * 0.08, total * 1.08))):
+        text(label, 1080, y + i * 60)
+        text(f'{value:.2f}', 1340, y + i * 60)
+    text(TEMPLATE[17], 120, 2180)
+    text(TEMPLATE[18], 120, 2240)
+
+    if jitter:
+        shift = np.float32([[1, 0, rng.randint(-jitter, jitter)], [0, 1, rng.randint(-jitter, jitter)]])
+        img = cv2.warpAffine(img, shift, (img.shape[1], img.shape[0]), borderValue=(255, 255, 255))
+        ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        img = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    return img
+
+
+def run(backend, pages, cache):
+    """Per-page rec time, hits, and the recognized texts"""
+    backend.line_cache = cache
+    rec_seconds, hits, lines, texts = 0.0, 0, 0, []
+    started = time.perf_counter()
+    for page in pages:
+        timings = {}
+        result = backend.infer([page], timings)[0]
+        rec_seconds += sum(timings.get(stage, 0.0)
+                           for stage in ('line_cache_lookup', 'classification', 'recognition'))
+        for page_hits, page_lines in timings.get('line_cache', []):
+            hits += page_hits
+            lines += page_lines
+        texts.append([line[1][0] for line in result])
+    elapsed = time.perf_counter() - started
+    return rec_seconds / len(pages), elapsed / len(pages), hits / lines if lines else None, texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Line recognition cache benchmark')
+    parser.add_argument('--pages', type=int, default=30)
+    parser.add_argument('--items', type=int, default=8, help='Line items per invoice')
+    parser.add_argument('--jitter', type=int, default=0, help='Max page offset (px); also JPEG compresses pages')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    backend = inference_gpu.init_ocr()
+    if backend is None:
+        sys.exit('OCR backend is not available')
+
+    pages = [make_invoice(seed, args.items, args.jitter) for seed in range(args.pages)]
+    backend.infer(pages[:1])  # warmup
+
+    report = []
+    reference = None
+    print(f"{'cache':<12} {'rec ms/page':>12} {'total ms/page':>14} {'hit rate':>9} {'changed lines':>14}")
+    for name, cache in (('off', None), ('exact', LineCache(100000, 'exact')),
+                        ('perceptual', LineCache(100000, 'perceptual'))):
+        rec_s, total_s, hit_rate, texts = run(backend, pages, cache)
+        if reference is None:
+            reference = texts
+        changed = sum(a != b for ref, got in zip(reference, texts) for a, b in zip(ref, got))
+        changed += sum(abs(len(ref) - len(got)) for ref, got in zip(reference, texts))
+        row = {'cache': name, 'rec_ms_per_page': 1000 * rec_s, 'total_ms_per_page': 1000 * total_s,
+               'hit_rate': hit_rate, 'changed_lines': changed}
+        report.append(row)
+        print(f"{name:<12} {row['rec_ms_per_page']:>12.1f} {row['total_ms_per_page']:>14.1f} "
+              f"{'-' if hit_rate is None else format(hit_rate, '.1%'):>9} {changed:>14}")
+    backend.line_cache = None
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'backend': backend.name, 'pages': args.pages, 'items': args.items,
+                       'jitter': args.jitter, 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
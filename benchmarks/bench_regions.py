@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Region-of-interest OCR versus full-page OCR on synthetic forms.
+
+Each form is an A4 page at 200 DPI with labelled boxes holding random
+field values at fixed positions, plus unrelated body text. The same
+forms are read three ways:
+
+  page     full-page detection + recognition, then the field values are
+           looked for among all the lines
+  regions  the field boxes are sent as regions: cropped and recognized
+           together as one batch of lines (no detection)
+  detect   the field boxes are sent as regions with "detect": true, so
+           detection runs inside each box only
+
+With --warp the page is photographed slightly off-axis (a perspective
+warp) and the fields are given as quads instead of rectangles. A field
+counts as read when the text for it matches the value with a similarity
+of at least --match (see bench_tiling.py).
+
+Runs the backend selected by OCR_BACKEND (PaddleOCR on GPU by default).
+
+Usage:
+  python3 benchmarks/bench_regions.py
+  python3 benchmarks/bench_regions.py --forms 20 --fields 16 --warp 40 --output regions.json
+"""
+
+import argparse
+import difflib
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+import inference_gpu
+from bench_tiling import normalize
+
+PAGE_SIZE = (1654, 2339)
+
+
+def make_form(fields, warp, seed):
+    """Form page with labelled value boxes; returns (image, [(field id, quad, value)])"""
+    rng = random.Random(seed)
+    width, height = PAGE_SIZE
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    cv2.putText(img, f'APPLICATION FORM {seed:04d}', (120, 140), font, 1.6, (0, 0, 0), 3, cv2.LINE_AA)
+    truth = []
+    columns, box_width, box_height = 2, 640, 70
+    for i in range(fields):
+        x = 120 + (i % columns) * (box_width + 140)
+        y = 260 + (i // columns) * 170
+        value = ' '.join(''.join(rng.choice(string.ascii_uppercase + string.digits)
+                                 for _ in range(rng.randint(3, 8))) for _ in range(rng.randint(1, 3)))
+        cv2.putText(img, f'FIELD {i + 1}', (x, y - 16), font, 0.7, (60, 60, 60), 1, cv2.LINE_AA)
+        cv2.rectangle(img, (x, y), (x + box_width, y + box_height), (0, 0, 0), 2)
+        cv2.putText(img, value, (x + 14, y + 48), font, 1.1, (20, 20, 20), 2, cv2.LINE_AA)
+        quad = np.float32([[x + 4, y + 4], [x + box_width - 4, y + 4],
+                           [x + box_width - 4, y + box_height - 4], [x + 4, y + box_height - 4]])
+        truth.append((f'field_{i + 1}', quad, value))
+    # Body text below the fields that region requests never read
+    y = 260 + (fields + 1) // columns * 170 + 80
+    while y < height - 80:
+        words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9)))
+                 for _ in range(rng.randint(6, 12))]
+        cv2.putText(img, ' '.join(words), (120, y), font, 0.8, (0, 0, 0), 1, cv2.LINE_AA)
+        y += 56
+
+    if warp:
+        corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+        shifted = corners + np.float32([[rng.uniform(-warp, warp), rng.uniform(-warp, warp)]
+                                        for _ in range(4)])
+        matrix = cv2.getPerspectiveTransform(corners, shifted)
+        img = cv2.warpPerspective(img, matrix, (width, height), borderValue=(255, 255, 255))
+        truth = [(field_id, cv2.perspectiveTransform(quad.reshape(-1, 1, 2), matrix).reshape(4, 2), value)
+                 for field_id, quad, value in truth]
+    return img, truth
+
+
+def similar(a, b):
+    return difflib.SequenceMatcher(None, normalize(a), normalize(b)).ratio()
+
+
+def read_page(backend, img, truth, threshold):
+    lines = [line[1][0] for line in backend.infer([img])[0]]
+    return sum(any(similar(value, text) >= threshold for text in lines) for _, _, value in truth)
+
+
+def read_regions(backend, img, truth, threshold, detect, warp):
+    if warp:
+        spec = [{'id': field_id, 'quad': quad.tolist(), 'detect': detect} for field_id, quad, _ in truth]
+    else:
+        spec = [{'id': field_id, 'bbox': [*quad[0].tolist(), *quad[2].tolist()], 'detect': detect}
+                for field_id, quad, _ in truth]
+    regions = inference_gpu.parse_regions(spec)
+    crops = [inference_gpu.crop_region(img, region)[0] for region in regions]
+    if detect:
+        texts = [' '.join(line[1][0] for line in lines) for lines in backend.infer(crops)]
+    else:
+        texts = [text for text, _ in backend.infer(crops, mode='rec')]
+    return sum(similar(value, text) >= threshold for (_, _, value), text in zip(truth, texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Region-of-interest vs full-page OCR benchmark')
+    parser.add_argument('--forms', type=int, default=10)
+    parser.add_argument('--fields', type=int, default=12, help='Fields per form')
+    parser.add_argument('--warp', type=float, default=0,
+                        help='Max corner shift (px) of a perspective warp; fields are then sent as quads')
+    parser.add_argument('--match', type=float, default=0.8, help='Similarity needed to count a field as read')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    backend = inference_gpu.init_ocr()
+    if backend is None:
+        sys.exit('OCR backend is not available')
+
+    forms = [make_form(args.fields, args.warp, seed) for seed in range(args.forms)]
+    methods = {
+        'page': lambda img, truth: read_page(backend, img, truth, args.match),
+        'regions': lambda img, truth: read_regions(backend, img, truth, args.match, False, args.warp),
+        'detect': lambda img, truth: read_regions(backend, img, truth, args.match, True, args.warp),
+    }
+
+    report = []
+    print(f"{'method':<10} {'ms/form':>9} {'fields read':>12}")
+    for name, method in methods.items():
+        method(*forms[0])  # warmup
+        read = 0
+        started = time.perf_counter()
+        for img, truth in forms:
+            read += method(img, truth)
+        elapsed = time.perf_counter() - started
+        row = {'method': name, 'ms_per_form': 1000 * elapsed / len(forms),
+               'field_accuracy': read / (len(forms) * args.fields)}
+        report.append(row)
+        print(f"{name:<10} {row['ms_per_form']:>9.1f} {row['field_accuracy']:>12.1%}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'backend': backend.name, 'forms': args.forms, 'fields': args.fields,
+                       'warp': args.warp, 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Response serialization on a dense page (500 text lines by default).
+
+Encodes the same synthetic result with Flask's jsonify (the previous
+response path) and with ocr_response in each output layout, with and
+without gzip, and reports encode time, gzip time and bytes on the wire.
+No model is needed: the result has the shape the pipeline returns, with
+float box coordinates as produced by the detector and Chinese and Latin
+text lines.
+
+Usage:
+  python3 benchmarks/bench_serialize.py
+  python3 benchmarks/bench_serialize.py --lines 2000 --rounds 100 --output serialize.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+import ocr_response
+from ocr_response import compress, dumps, format_lines, parse_output
+
+WORDS = ['发票', '金额', '合计', '税率', '日期', '客户名称', '地址', 'Invoice', 'Total', 'Amount',
+         'Qty', 'Unit', 'Price', '2024-06-30', '1,280.00', 'No.', '规格型号', '数量', '单价']
+
+LAYOUTS = [
+    ('objects', {}),
+    ('objects int', {'coords': 'int'}),
+    ('text only', {'fields': 'text'}),
+    ('columnar', {'format': 'columnar'}),
+    ('columnar int', {'format': 'columnar', 'coords': 'int'}),
+]
+
+
+def make_result(lines, seed=0):
+    """OCR lines [[bbox, (text, confidence)], ...] for a page of the given density"""
+    rng = random.Random(seed)
+    result = []
+    for i in range(lines):
+        x, y = rng.uniform(20, 1200), 20 + i * 4.6 + rng.uniform(-1, 1)
+        w, h = rng.uniform(60, 900), rng.uniform(18, 40)
+        bbox = [[x, y], [x + w, y + rng.uniform(-2, 2)], [x + w, y + h], [x, y + h]]
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+        result.append([bbox, (text, rng.uniform(0.8, 1.0))])
+    return result
+
+
+def payload_for(result, output):
+    detections = format_lines([line[0] for line in result], [line[1][0] for line in result],
+                              [line[1][1] for line in result], output)
+    if output.format == 'columnar':
+        return dict(detections, count=len(result), status='success', gpu_enabled=True)
+    return {'detections': detections, 'count': len(result), 'status': 'success', 'gpu_enabled': True}
+
+
+def measure(encode, rounds):
+    """Best-of-rounds time of encode() in ms, and its output"""
+    best, body = None, None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        body = encode()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return 1000 * best, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Response serialization benchmark')
+    parser.add_argument('--lines', type=int, default=500, help='Text lines on the page')
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--gzip-level', type=int, default=1)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    result = make_result(args.lines)
+    app = Flask(__name__)
+    cases = []
+    # Building the layout is part of the work per request, so it is timed together with the encode
+    cases.append(('jsonify (previous)', lambda: app.json.response(payload_for(result, parse_output())).get_data()))
+    for name, options in LAYOUTS:
+        output = parse_output(**options)
+        cases.append((name, lambda output=output: dumps(payload_for(result, output))))
+
+    print(f"encoder: {'orjson' if ocr_response.orjson is not None else 'json (orjson not installed)'}, "
+          f"{args.lines} lines")
+    print(f"{'layout':<20} {'encode ms':>10} {'bytes':>9} {'gzip ms':>8} {'gzip bytes':>11}")
+    report = []
+    for name, encode in cases:
+        with app.app_context():
+            encode_ms, body = measure(encode, args.rounds)
+        gzip_ms, compressed = measure(lambda: compress(body, args.gzip_level), args.rounds)
+        row = {'layout': name, 'encode_ms': encode_ms, 'bytes': len(body),
+               'gzip_ms': gzip_ms, 'gzip_bytes': len(compressed)}
+        report.append(row)
+        print(f"{name:<20} {encode_ms:>10.2f} {len(body):>9} {gzip_ms:>8.2f} {len(compressed):>11}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'lines': args.lines, 'gzip_level': args.gzip_level,
+                       'orjson': ocr_response.orjson is not None, 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tiled versus whole-image OCR on large synthetic pages.
+
+Each page is filled with lines of known random text in a small font, so
+recall can be measured against the ground truth: a line counts as found
+when some recognized text matches it with a similarity of at least
+--match (difflib ratio, case and spaces ignored).
+
+Runs the backend selected by OCR_BACKEND (PaddleOCR on GPU by default).
+
+Usage:
+  python3 benchmarks/bench_tiling.py
+  python3 benchmarks/bench_tiling.py --sizes 1240x7000,4000x12000 --tile-size 1536 --overlap 192
+"""
+
+import argparse
+import difflib
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+import inference_gpu
+
+
+def make_page(width, height, font_scale, seed=0):
+    """White page with rows of random words; returns (image, ground truth lines)"""
+    rng = random.Random(seed)
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    (_, text_height), _ = cv2.getTextSize('Ag', cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+    line_pitch = int(text_height * 2.5)
+    lines = []
+    for y in range(line_pitch, height - line_pitch // 2, line_pitch):
+        words = [''.join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(rng.randint(3, 8)))
+                 for _ in range(rng.randint(2, 6))]
+        text = ' '.join(words)
+        x = rng.randint(10, max(11, width // 3))
+        (text_width, _), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+        if x + text_width >= width:
+            continue
+        cv2.putText(img, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), 1, cv2.LINE_AA)
+        lines.append(text)
+    return img, lines
+
+
+def normalize(text):
+    return ''.join(text.split()).upper()
+
+
+def recall(truth, result, threshold):
+    found = [normalize(line[1][0]) for line in result]
+    hits = 0
+    for line in truth:
+        target = normalize(line)
+        if any(difflib.SequenceMatcher(None, target, text).ratio() >= threshold for text in found):
+            hits += 1
+    return hits / len(truth) if truth else 1.0
+
+
+def run(backend, img, tiled, runs):
+    backend.tiling = tiled
+    result = backend.infer([img])[0]
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = backend.infer([img])[0]
+        times.append(time.perf_counter() - started)
+    return result, sum(times) / len(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tiled vs whole-image OCR benchmark')
+    parser.add_argument('--sizes', default='1240x7000,2480x3508,4000x12000',
+                        help='Page sizes WxH, comma separated')
+    parser.add_argument('--font-scale', type=float, default=0.8)
+    parser.add_argument('--tile-size', type=int, default=inference_gpu.TILE_SIZE)
+    parser.add_argument('--overlap', type=int, default=inference_gpu.TILE_OVERLAP)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--match', type=float, default=0.8, help='Similarity needed to count a line as found')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    backend = inference_gpu.init_ocr()
+    if backend is None:
+        sys.exit('OCR backend is not available')
+    backend.tile_size = args.tile_size
+    backend.tile_overlap = args.overlap
+
+    report = []
+    print(f"{'page':<12} {'lines':>6} {'mode':<6} {'latency s':>10} {'recall':>7}")
+    for size in args.sizes.split(','):
+        width, height = (int(v) for v in size.split('x'))
+        img, truth = make_page(width, height, args.font_scale)
+        for mode in ('whole', 'tiled'):
+            result, latency = run(backend, img, mode == 'tiled', args.runs)
+            row = {'size': size, 'lines': len(truth), 'mode': mode,
+                   'latency_s': latency, 'recall': recall(truth, result, args.match)}
+            report.append(row)
+            print(f"{size:<12} {len(truth):>6} {mode:<6} {latency:>10.3f} {row['recall']:>7.1%}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'backend': backend.name, 'tile_size': args.tile_size, 'overlap': args.overlap, 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Offline check of the capacity plan and the deploy requests built from it.
+
+Plans capacity from synthetic benchmark results for two instance types
+under a few fixed traffic profiles, then sends the create_model,
+create_endpoint_config, register_scalable_target and put_scaling_policy
+requests the deploy script would send through botocore Stubber clients.
+Stubber validates every request against the AWS API model and checks it
+matches expected parameters written out literally below (instance count,
+container environment, scaling range and target), so a change to the
+planner or the request builders shows up as a mismatch rather than being
+checked against itself. No credentials or network access are needed.
+
+Usage:
+  python3 benchmarks/check_deploy_plan.py
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3
+from botocore.stub import Stubber
+
+import one_click_deploy as deploy
+
+ENDPOINT = 'paddleocr-g5-endpoint-check'
+ROLE_ARN = 'arn:aws:iam::123456789012:role/SageMakerExecutionRole'
+IMAGE_URI = '123456789012.dkr.ecr.us-east-1.amazonaws.com/paddleocr-g5:latest'
+MODEL_NAME = 'paddleocr-g5-check'
+CONFIG_NAME = 'paddleocr-g5-config-check'
+MODEL_DATA = 's3://bucket/model.tar.gz'
+
+
+def report(instance_type, concurrency, qps, p99_ms, errors=0):
+    """A benchmark.py --output summary with the fields the planner reads"""
+    requests = int(qps * 120)
+    return {'instance_type': instance_type, 'instance_count': 1, 'concurrency': concurrency,
+            'pipeline': 'full', 'qps': qps, 'requests': requests, 'errors': errors,
+            'latency_ms': {'mean': 1000 * concurrency / qps, 'p99': p99_ms}}
+
+
+# Throughput rising with concurrency until p99 breaks the SLO, per instance type
+REPORTS = [
+    report('ml.g5.xlarge', 1, 6.0, 210), report('ml.g5.xlarge', 4, 19.0, 380),
+    report('ml.g5.xlarge', 8, 27.0, 690), report('ml.g5.xlarge', 16, 29.0, 1450),
+    report('ml.g4dn.xlarge', 1, 4.0, 300), report('ml.g4dn.xlarge', 4, 11.0, 610),
+    report('ml.g4dn.xlarge', 8, 13.0, 1210),
+]
+
+
+# Traffic profile and worker count -> the plan they must produce. 27 QPS at
+# concurrency 8 is the best g5 result within 800ms: 20.25 QPS/instance after
+# 25% headroom, 3 instances for 60 QPS, scaling to 5 for the 1.5x burst, and
+# 8 + 8/2 = 12 in flight per worker. Within 600ms only concurrency 4 is left:
+# 14.25 QPS/instance, 9 instances, 13 for the burst, 4 + ceil(4/3) = 6.
+SCENARIOS = [
+    {'traffic': {'peak_qps': 60, 'min_qps': 5, 'p99_ms': 800}, 'workers': 2,
+     'instance_type': 'ml.g5.xlarge', 'instance_count': 3, 'min_capacity': 1, 'max_capacity': 5,
+     'environment': {'OCR_WORKERS': '2', 'OCR_MAX_IN_FLIGHT': '12'}, 'target_value': 1215.0},
+    {'traffic': {'peak_qps': 120, 'min_qps': 5, 'p99_ms': 600}, 'workers': 3,
+     'instance_type': 'ml.g5.xlarge', 'instance_count': 9, 'min_capacity': 1, 'max_capacity': 13,
+     'environment': {'OCR_WORKERS': '3', 'OCR_MAX_IN_FLIGHT': '6'}, 'target_value': 855.0},
+]
+
+
+def client(service):
+    return boto3.client(service, region_name='us-east-1', aws_access_key_id='check',
+                        aws_secret_access_key='check')
+
+
+def expected_requests(expected):
+    """The four request parameter sets for a scenario, spelled out literally"""
+    resource = {'ServiceNamespace': 'sagemaker',
+                'ResourceId': f'endpoint/{ENDPOINT}/variant/AllTraffic',
+                'ScalableDimension': 'sagemaker:variant:DesiredInstanceCount'}
+    model = {'ModelName': MODEL_NAME, 'ExecutionRoleArn': ROLE_ARN,
+             'PrimaryContainer': {'Image': IMAGE_URI, 'Mode': 'SingleModel', 'ModelDataUrl': MODEL_DATA,
+                                  'Environment': expected['environment']}}
+    config = {'EndpointConfigName': CONFIG_NAME,
+              'ProductionVariants': [{'VariantName': 'AllTraffic', 'ModelName': MODEL_NAME,
+                                      'InitialInstanceCount': expected['instance_count'],
+                                      'InstanceType': expected['instance_type'], 'InitialVariantWeight': 1}]}
+    target = {**resource, 'MinCapacity': expected['min_capacity'], 'MaxCapacity': expected['max_capacity']}
+    policy = {**resource, 'PolicyName': f'{ENDPOINT}-invocations-per-instance', 'PolicyType': 'TargetTrackingScaling',
+              'TargetTrackingScalingPolicyConfiguration': {
+                  'TargetValue': expected['target_value'],
+                  'PredefinedMetricSpecification': {'PredefinedMetricType': 'SageMakerVariantInvocationsPerInstance'},
+                  'ScaleOutCooldown': 60, 'ScaleInCooldown': 300}}
+    return model, config, target, policy
+
+
+def check(scenario):
+    traffic = deploy.load_traffic(**scenario['traffic'])
+    plan = deploy.plan_capacity(REPORTS, traffic, workers=scenario['workers'])
+    print(f"plan: {plan['instance_type']} x {plan['instance_count']} "
+          f"(scaling {plan['min_capacity']}-{plan['max_capacity']}), {plan['target_qps']:.2f} QPS/instance, "
+          f"{plan['workers']} workers x {plan['max_in_flight']} in flight")
+    model, config, target, policy = expected_requests(scenario)
+
+    sagemaker = client('sagemaker')
+    with Stubber(sagemaker) as stub:
+        stub.add_response('create_model', {'ModelArn': 'arn:aws:sagemaker:us-east-1:123456789012:model/x'},
+                          model)
+        stub.add_response('create_endpoint_config',
+                          {'EndpointConfigArn': 'arn:aws:sagemaker:us-east-1:123456789012:endpoint-config/x'},
+                          config)
+        sagemaker.create_model(**deploy.model_request(plan, MODEL_NAME, IMAGE_URI, ROLE_ARN, MODEL_DATA))
+        sagemaker.create_endpoint_config(**deploy.endpoint_config_request(plan, CONFIG_NAME, MODEL_NAME))
+        stub.assert_no_pending_responses()
+    print('create_model, create_endpoint_config: ok')
+
+    autoscaling = client('application-autoscaling')
+    with Stubber(autoscaling) as stub:
+        stub.add_response('register_scalable_target', {}, target)
+        stub.add_response('put_scaling_policy', {'PolicyARN': 'arn:aws:autoscaling:us-east-1:123456789012:policy/x',
+                                                 'Alarms': []}, policy)
+        deploy.configure_autoscaling(autoscaling, ENDPOINT, plan)
+        stub.assert_no_pending_responses()
+    print('register_scalable_target, put_scaling_policy: ok')
+    print(json.dumps({'container_environment': model['PrimaryContainer']['Environment'],
+                      'register_scalable_target': target, 'put_scaling_policy': policy}, indent=2))
+
+
+def main():
+    for scenario in SCENARIOS:
+        check(scenario)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+PaddleOCR 离线批量识别工具
+
+Runs the inference_gpu.py pipeline (decode, downscale, batch scheduler,
+result and line caches, response layout) directly in N worker processes,
+without HTTP or an endpoint. Each worker loads and warms up its own model
+and pulls batches of images from a shared queue, so faster workers take
+more batches. Images of the next batches are read and decoded on a thread
+pool while the current batch is in the model.
+
+Results stream to one JSON Lines shard per worker (part-00000.jsonl, ...),
+one record per image: {"id": <path or S3 URI>, "detections": [...],
+"count": n, "status": "success"} or {"id": ..., "error": ..., "status":
+"error"}. Ids of finished images (written and flushed) are appended to
+checkpoint.txt in the output directory; rerunning the same command skips
+them. An image whose results were written just before a crash, but not yet
+checkpointed, is processed again, so a shard can hold a record twice: dedupe
+by id downstream. A run summary with images/s and per-worker load is
+printed and written to report.json.
+
+Inputs are a directory (searched recursively), an s3://bucket/prefix
+listing, or a manifest file with one local path or s3:// URI per line
+(JSON Lines manifests may give {"path": ...} or {"source": ...} records).
+
+使用方法:
+  python3 bulk_ocr.py images/ --output out/ --workers 2
+  python3 bulk_ocr.py s3://bucket/scans/ --output out/ --workers 4 --gpus 0,1 --format columnar --coords int
+  python3 bulk_ocr.py manifest.txt --output out/ --workers 2 --backend stub   # 无 GPU 时测试流程
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ocr_response import dumps, parse_output
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+CHECKPOINT_FILE = 'checkpoint.txt'
+REPORT_FILE = 'report.json'
+
+
+def list_s3(uri):
+    """Image object URIs under an s3://bucket/prefix"""
+    import boto3
+    bucket, _, prefix = uri[len('s3://'):].partition('/')
+    paginator = boto3.client('s3').get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].lower().endswith(IMAGE_EXTENSIONS):
+                yield f"s3://{bucket}/{obj['Key']}"
+
+
+def list_inputs(source):
+    """Image ids (local paths or s3:// URIs) for a directory, S3 prefix or manifest, in a stable order"""
+    if source.startswith('s3://'):
+        return sorted(list_s3(source))
+    if os.path.isdir(source):
+        found = []
+        for root, _, files in os.walk(source):
+            found.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+        return sorted(found)
+    ids = []
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                record = json.loads(line)
+                line = record.get('path') or record.get('source')
+            ids.append(line)
+    return ids
+
+
+def load_checkpoint(path):
+    """Ids already finished by earlier runs"""
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.rstrip('\n') for line in f if line.endswith('\n')}
+
+
+def open_shard(path):
+    """Open a worker's output shard for appending, dropping a partial last line from a crash"""
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.seek(0)
+                data = f.read()
+                f.truncate(data.rfind(b'\n') + 1)
+    return open(path, 'ab')
+
+
+class ImageReader:
+    """Reads image bytes from local paths or S3 (one boto3 client per worker, shared by the threads)"""
+
+    def __init__(self):
+        self._s3 = None
+
+    def read(self, source):
+        if source.startswith('s3://'):
+            if self._s3 is None:
+                import boto3
+                self._s3 = boto3.client('s3')
+            bucket, _, key = source[len('s3://'):].partition('/')
+            return self._s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        with open(source, 'rb') as f:
+            return f.read()
+
+
+def worker_main(index, tasks, events, config):
+    """Worker process: load the model, then OCR batches from tasks until the sentinel"""
+    # Ctrl+C reaches the whole process group; the parent stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if config['gpus']:
+        # Must be set before paddle is imported by the backend
+        os.environ['CUDA_VISIBLE_DEVICES'] = config['gpus'][index % len(config['gpus'])]
+    import inference_gpu
+
+    started = time.monotonic()
+    if not inference_gpu.startup():
+        events.put(('failed', index, 'model could not be loaded'))
+        return
+    events.put(('ready', index, time.monotonic() - started))
+
+    options = dict(config['options'], lang=config['options']['lang'] or inference_gpu.OCR_LANG,
+                   version=config['options']['version'] or inference_gpu.OCR_MODEL_VERSION)
+    output = parse_output(config['fields'], config['format'], config['coords'], config['options']['mode'])
+    reader = ImageReader()
+    downscale = options['mode'] != 'rec'
+    stats = {'images': 0, 'errors': 0, 'decode_seconds': 0.0, 'model_seconds': 0.0, 'wait_seconds': 0.0}
+
+    def load(source):
+        """(decoded image or exception, decode seconds) for one input"""
+        load_started = time.perf_counter()
+        try:
+            decoded = inference_gpu.decode_image(reader.read(source), downscale=downscale)
+        except Exception as e:
+            decoded = e
+        return decoded, time.perf_counter() - load_started
+
+    pending = deque()
+    exhausted = False
+    with ThreadPoolExecutor(config['decode_threads'], thread_name_prefix='bulk-decode') as pool, \
+            open_shard(os.path.join(config['output'], f'part-{index:05d}.jsonl')) as shard:
+        active_started = time.monotonic()
+        while True:
+            # Keep `prefetch` batches reading/decoding ahead of the model
+            while not exhausted and len(pending) <= config['prefetch']:
+                batch = tasks.get()
+                if batch is None:
+                    exhausted = True
+                else:
+                    pending.append([(source, pool.submit(load, source)) for source in batch])
+            if not pending:
+                break
+
+            batch = pending.popleft()
+            wait_started = time.perf_counter()
+            loaded = [(source, *future.result()) for source, future in batch]
+            stats['wait_seconds'] += time.perf_counter() - wait_started
+            stats['decode_seconds'] += sum(seconds for _, _, seconds in loaded)
+
+            good = [decoded for _, decoded, _ in loaded if not isinstance(decoded, Exception)]
+            model_started = time.perf_counter()
+            try:
+                outputs = iter(inference_gpu.ocr_images([img for img, _ in good], options=options) if good else [])
+            except Exception as e:
+                outputs = iter([e] * len(good))
+            stats['model_seconds'] += time.perf_counter() - model_started
+
+            lines = []
+            for source, decoded, _ in loaded:
+                result = decoded if isinstance(decoded, Exception) else next(outputs)
+                if isinstance(result, Exception):
+                    stats['errors'] += 1
+                    record = {'id': source, 'error': str(result), 'status': 'error'}
+                else:
+                    result = inference_gpu.rescale_boxes(result, decoded[1], options['mode'])
+                    record = {'id': source, **inference_gpu.format_result(result, options['mode'], output),
+                              'status': 'success'}
+                lines.append(dumps(record) + b'\n')
+            shard.write(b''.join(lines))
+            shard.flush()
+            stats['images'] += len(batch)
+            events.put(('done', index, [source for source, _ in batch]))
+        stats['active_seconds'] = time.monotonic() - active_started
+    events.put(('exit', index, stats))
+
+
+def summarize(workers, started, ready_at, finished, remaining):
+    """Throughput and per-worker load balance for a run"""
+    images = sum(w['images'] for w in workers.values())
+    steady = max(1e-9, finished - ready_at) if ready_at is not None else None
+    counts = [w['images'] for w in workers.values()]
+    mean = sum(counts) / len(counts) if counts else 0
+    per_worker = []
+    for index in sorted(workers):
+        w = workers[index]
+        active = w.get('active_seconds') or 0.0
+        per_worker.append({
+            'worker': index,
+            'images': w['images'],
+            'errors': w['errors'],
+            'share': w['images'] / images if images else None,
+            'images_per_s': w['images'] / active if active else None,
+            'model_busy': w['model_seconds'] / active if active else None,
+            'decode_wait_s': w['wait_seconds'],
+            'load_seconds': w.get('load_seconds'),
+        })
+    return {
+        'images': images,
+        'errors': sum(w['errors'] for w in workers.values()),
+        'remaining': remaining,
+        'wall_s': finished - started,
+        'images_per_s': images / steady if steady else None,
+        # max / mean images per worker: 1.0 is perfectly even
+        'imbalance': max(counts) / mean if mean else None,
+        'workers': per_worker,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PaddleOCR 离线批量识别')
+    parser.add_argument('source', help='图片目录、s3://bucket/prefix 或清单文件 (每行一个路径或 S3 URI)')
+    parser.add_argument('--output', '-o', required=True, help='输出目录 (JSONL 分片、checkpoint、report)')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='工作进程数，每个进程加载一份模型')
+    parser.add_argument('--gpus', help='按进程轮流分配的 GPU 编号，例如 0,1')
+    parser.add_argument('--backend', help='OCR 引擎 (默认取 OCR_BACKEND，未设置为 paddle)')
+    parser.add_argument('--batch', type=int, default=8, help='每批送入模型的图片数')
+    parser.add_argument('--prefetch', type=int, default=2, help='每个进程提前读取解码的批数')
+    parser.add_argument('--decode-threads', type=int, default=4, help='每个进程的读取/解码线程数')
+    parser.add_argument('--lang', help='语言 (默认 OCR_LANG)')
+    parser.add_argument('--version', help='模型版本 (默认 OCR_MODEL_VERSION)')
+    parser.add_argument('--mode', default='full', choices=['full', 'det', 'rec'], help='流水线模式')
+    parser.add_argument('--no-cls', action='store_true', help='不做方向分类')
+    parser.add_argument('--fields', help='只输出这些字段 (bbox,text,confidence)')
+    parser.add_argument('--format', default='objects', choices=['objects', 'columnar'], help='输出格式')
+    parser.add_argument('--coords', default='float', choices=['float', 'int'], help='坐标取整')
+    args = parser.parse_args()
+    try:
+        parse_output(args.fields, args.format, args.coords, args.mode)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.backend:
+        os.environ['OCR_BACKEND'] = args.backend
+    # The model thread batches whatever a worker submits; no need to wait for more
+    os.environ.setdefault('OCR_MAX_BATCH_SIZE', str(args.batch))
+    os.environ.setdefault('OCR_MAX_BATCH_WAIT_MS', '0')
+    os.makedirs(args.output, exist_ok=True)
+
+    checkpoint_path = os.path.join(args.output, CHECKPOINT_FILE)
+    finished_before = load_checkpoint(checkpoint_path)
+    inputs = list_inputs(args.source)
+    todo = [source for source in inputs if source not in finished_before]
+    print(f"{len(inputs)} images, {len(inputs) - len(todo)} already done, {len(todo)} to process")
+    if not todo:
+        return
+
+    config = {
+        'output': args.output,
+        'gpus': [gpu.strip() for gpu in args.gpus.split(',')] if args.gpus else [],
+        'options': {'lang': args.lang, 'version': args.version, 'mode': args.mode, 'use_cls': not args.no_cls},
+        'fields': args.fields, 'format': args.format, 'coords': args.coords,
+        'prefetch': max(0, args.prefetch), 'decode_threads': max(1, args.decode_threads),
+    }
+    # CUDA contexts do not survive fork; each worker starts a fresh interpreter
+    context = multiprocessing.get_context('spawn')
+    tasks, events = context.Queue(), context.Queue()
+    # Batches left behind by a dead worker must not block this process from exiting
+    tasks.cancel_join_thread()
+    for i in range(0, len(todo), args.batch):
+        tasks.put(todo[i:i + args.batch])
+    workers = max(1, args.workers)
+    for _ in range(workers):
+        tasks.put(None)
+
+    started = time.monotonic()
+    processes = [context.Process(target=worker_main, args=(index, tasks, events, config), name=f'bulk-ocr-{index}')
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    stats = {index: {'images': 0, 'errors': 0, 'model_seconds': 0.0, 'wait_seconds': 0.0}
+             for index in range(workers)}
+    ready_at, done, exited, last_progress = None, 0, set(), time.monotonic()
+    with open(checkpoint_path, 'a') as checkpoint:
+        try:
+            while len(exited) < workers:
+                try:
+                    event, index, value = events.get(timeout=1.0)
+                except queue.Empty:
+                    # A worker killed without its exit event (e.g. out of memory)
+                    for i, process in enumerate(processes):
+                        if i not in exited and not process.is_alive() and events.empty():
+                            print(f"Worker {i} died (exit code {process.exitcode})", file=sys.stderr)
+                            exited.add(i)
+                    continue
+                if event == 'ready':
+                    stats[index]['load_seconds'] = value
+                    ready_at = ready_at or time.monotonic()
+                elif event == 'done':
+                    checkpoint.write(''.join(source + '\n' for source in value))
+                    checkpoint.flush()
+                    done += len(value)
+                    stats[index]['images'] += len(value)
+                    if time.monotonic() - last_progress >= 10:
+                        last_progress = time.monotonic()
+                        rate = done / max(1e-9, last_progress - (ready_at or started))
+                        print(f"{done}/{len(todo)} images ({rate:.1f} images/s)")
+                elif event == 'exit':
+                    # Images are counted from the checkpointed batches above
+                    value.pop('images')
+                    stats[index].update(value)
+                    exited.add(index)
+                elif event == 'failed':
+                    print(f"Worker {index} failed: {value}", file=sys.stderr)
+                    exited.add(index)
+        except KeyboardInterrupt:
+            # Shut down cleanly even if Ctrl+C is pressed again
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            print("Interrupted; rerun the same command to resume", file=sys.stderr)
+            for process in processes:
+                process.terminate()
+        finally:
+            os.fsync(checkpoint.fileno())
+    for process in processes:
+        process.join()
+
+    report = summarize(stats, started, ready_at, time.monotonic(), len(todo) - done)
+    report.update(source=args.source, workers_requested=workers, batch=args.batch,
+                  backend=os.environ.get('OCR_BACKEND', 'paddle'))
+    with open(os.path.join(args.output, REPORT_FILE), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    rate = f"{report['images_per_s']:.1f}" if report['images_per_s'] else '-'
+    imbalance = f"{report['imbalance']:.2f}" if report['imbalance'] else '-'
+    print(f"Processed {report['images']} images ({report['errors']} errors) in {report['wall_s']:.1f}s: "
+          f"{rate} images/s after model load, load imbalance (max/mean) {imbalance}")
+    print(f"{'worker':>6} {'images':>8} {'share':>7} {'img/s':>8} {'model busy':>11} {'decode wait s':>14}")
+    for w in report['workers']:
+        print(f"{w['worker']:>6} {w['images']:>8} "
+              f"{'-' if w['share'] is None else format(w['share'], '.1%'):>7} "
+              f"{'-' if w['images_per_s'] is None else format(w['images_per_s'], '.1f'):>8} "
+              f"{'-' if w['model_busy'] is None else format(w['model_busy'], '.0%'):>11} "
+              f"{w['decode_wait_s']:>14.1f}")
+    if report['remaining']:
+        print(f"{report['remaining']} images not processed; rerun the same command to resume")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
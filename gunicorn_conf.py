@@ -0,0 +1,58 @@
+"""
+Gunicorn settings for the production serving mode (OCR_SERVER=gunicorn).
+
+Each pre-forked worker builds and warms up its own PaddleOCR pipeline in
+post_worker_init, before it starts accepting connections. The app is not preloaded in the
+master: CUDA contexts do not survive fork, so every worker initializes the
+GPU itself.
+"""
+
+import os
+import sys
+import threading
+import time
+
+bind = '0.0.0.0:' + os.environ.get('OCR_PORT', '8080')
+workers = int(os.environ.get('OCR_WORKERS', '2'))
+threads = int(os.environ.get('OCR_THREADS', '8'))
+worker_class = 'gthread'
+
+# SageMaker aborts an invocation after 60s, so a request running longer is
+# already lost. Idle connections are kept open longer than that so the
+# platform's pooled connections are not closed under it mid-request.
+timeout = int(os.environ.get('OCR_TIMEOUT', '60'))
+graceful_timeout = timeout
+keepalive = int(os.environ.get('OCR_KEEPALIVE', '75'))
+
+# Model load and warmup run before the worker's heartbeat loop starts, and
+# the arbiter kills a worker that has not notified it for `timeout` seconds.
+# post_worker_init keeps notifying while startup runs, bounded by its own
+# limit instead (0 = no limit): preloaded models and replicas can take
+# several minutes on a cold GPU.
+boot_timeout = int(os.environ.get('OCR_BOOT_TIMEOUT', '900'))
+
+accesslog = None
+errorlog = '-'
+loglevel = os.environ.get('OCR_LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    """Load and warm up the model in the worker before it serves traffic"""
+    module = sys.modules[worker.wsgi.import_name]
+    result = []
+    thread = threading.Thread(target=lambda: result.append(module.startup()), name='ocr-startup', daemon=True)
+    thread.start()
+    started = time.monotonic()
+    while thread.is_alive():
+        worker.notify()
+        if boot_timeout and time.monotonic() - started > boot_timeout:
+            worker.log.error('Worker startup did not finish within OCR_BOOT_TIMEOUT=%ss', boot_timeout)
+            raise SystemExit(1)
+        thread.join(1.0)
+    if not (result and result[0]):
+        if module.startup_fatal:
+            # A model store that fails its check fails in every worker: exit
+            # with gunicorn's boot error code, which stops the arbiter
+            raise SystemExit(3)
+        # Exit so the arbiter restarts the worker instead of serving 500s
+        raise SystemExit(1)
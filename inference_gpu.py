@@ -1,118 +1,1448 @@
+import time
+IMPORT_STARTED = time.monotonic()
+
 import os
 import json
 import base64
 import io
-from flask import Flask, request, jsonify
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import partial
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
 from PIL import Image
 import numpy as np
 import cv2
 
+from ocr_metrics import REGISTRY, process_start_time
+from ocr_backends import MODES, create_backend, crop_quad, quad_transform
+from ocr_documents import PDF_TYPES, TIFF_TYPES, DocumentError, is_multipage_tiff, open_document
+from ocr_model_store import ModelStoreError, find_store
+from ocr_models import ModelBudgetError, ModelLoadError, ModelPool, ReplicaPool, ReplicaTimeoutError
+from ocr_response import DEFAULT_OUTPUT, accepts_gzip, compress, dumps, format_lines, parse_output
+from ocr_screen import BlankPage, BlankScreen
+from result_cache import LineCache, ResultCache, image_key
+
+IMPORT_SECONDS = time.monotonic() - IMPORT_STARTED
+
 app = Flask(__name__)
 
-# Global OCR instance
+# Global OCR instance (the default language and model version) and the
+# pool holding it together with the other pipelines loaded on demand
 ocr = None
+model_pool = None
+
+# OCR engine: 'paddle' (GPU), 'paddle-cpu', 'onnx' or 'stub' (see ocr_backends.py)
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'paddle')
+CPU_THREADS = int(os.environ.get('OCR_CPU_THREADS', '4'))
+ENABLE_MKLDNN = os.environ.get('OCR_ENABLE_MKLDNN', '1') == '1'
+ONNX_DET_MODEL = os.environ.get('OCR_ONNX_DET_MODEL', '')
+ONNX_REC_MODEL = os.environ.get('OCR_ONNX_REC_MODEL', '')
+ONNX_CLS_MODEL = os.environ.get('OCR_ONNX_CLS_MODEL', '')
+ONNX_USE_GPU = os.environ.get('OCR_ONNX_USE_GPU', '0') == '1'
+STUB_DET_MS = float(os.environ.get('OCR_STUB_DET_MS', '0'))
+STUB_REC_MS = float(os.environ.get('OCR_STUB_REC_MS', '0'))
+
+# Pipeline settings; also part of the result cache key
+OCR_SETTINGS = {'use_angle_cls': True}
+
+# Languages and model versions (PaddleOCR lang / ocr_version). Requests pick
+# one with the Lang and Version options; pipelines other than the default
+# are loaded on first use and evicted LRU under the memory budget and model
+# count (0 = unlimited). OCR_PRELOAD_MODELS ("en,japan:PP-OCRv3") are
+# loaded at startup and kept. Model memory is measured with NVML (RSS on
+# CPU); OCR_MODEL_SIZE_MB is the estimate used for a model whose load could
+# not be measured.
+OCR_LANG = os.environ.get('OCR_LANG', 'ch')
+OCR_MODEL_VERSION = os.environ.get('OCR_MODEL_VERSION', 'PP-OCRv4')
+LANGS = [lang.strip() for lang in os.environ.get('OCR_LANGS', 'ch,en,japan,korean,chinese_cht').split(',')
+         if lang.strip()]
+MODEL_VERSIONS = [version.strip() for version in os.environ.get('OCR_MODEL_VERSIONS', 'PP-OCRv4,PP-OCRv3').split(',')
+                  if version.strip()]
+PRELOAD_MODELS = [model.strip() for model in os.environ.get('OCR_PRELOAD_MODELS', '').split(',') if model.strip()]
+MODEL_MEMORY_MB = int(os.environ.get('OCR_MODEL_MEMORY_MB', '0'))
+MAX_MODELS = int(os.environ.get('OCR_MAX_MODELS', '4'))
+MODEL_SIZE_MB = int(os.environ.get('OCR_MODEL_SIZE_MB', '512'))
+
+# Model replicas: every model is loaded OCR_MODEL_REPLICAS times and the
+# batch scheduler runs as many model threads, so batches run concurrently
+# on one GPU (or, with paddle-cpu, on separate groups of OCR_CPU_THREADS
+# threads each). A batch waits up to OCR_REPLICA_TIMEOUT_MS for a free
+# replica. Each replica takes a model's memory again (counted by the
+# model budget).
+MODEL_REPLICAS = max(1, int(os.environ.get('OCR_MODEL_REPLICAS', '1')))
+REPLICA_TIMEOUT_MS = float(os.environ.get('OCR_REPLICA_TIMEOUT_MS', '30000'))
+
+# Local model store (see ocr_model_store.py) holding the PaddleOCR weights
+# with a checksummed manifest. Empty OCR_MODEL_STORE uses /opt/ml/model
+# (SageMaker ModelDataUrl) or else /opt/ml/code/models (baked into the
+# image), whichever has a manifest; 'none' disables the store. With
+# OCR_OFFLINE=1 a model that is not in the store fails instead of being
+# downloaded by PaddleOCR.
+MODEL_STORE_PATH = os.environ.get('OCR_MODEL_STORE', '')
+OFFLINE = os.environ.get('OCR_OFFLINE', '0') == '1'
+
+# Tiled detection for oversized images (off unless OCR_TILING_ENABLED=1).
+# When enabled the 4096x4096 limit is replaced by a total pixel budget.
+TILING_ENABLED = os.environ.get('OCR_TILING_ENABLED', '0') == '1'
+TILE_SIZE = int(os.environ.get('OCR_TILE_SIZE', '1536'))
+TILE_OVERLAP = int(os.environ.get('OCR_TILE_OVERLAP', '192'))
+MAX_TOTAL_PIXELS = int(os.environ.get('OCR_MAX_TOTAL_PIXELS', str(64 * 1024 * 1024)))
+
+# Downscale large inputs right after decode (0 disables a limit). JPEGs are
+# decoded at 1/2, 1/4 or 1/8 size by libjpeg where possible; returned boxes are mapped back to
+# the original resolution. When on, the 4096x4096 limit is replaced by
+# OCR_MAX_TOTAL_PIXELS as with tiling.
+DOWNSCALE_MAX_SIDE = int(os.environ.get('OCR_DOWNSCALE_MAX_SIDE', '0'))
+DOWNSCALE_MAX_PIXELS = int(os.environ.get('OCR_DOWNSCALE_MAX_PIXELS', '0'))
+
+SETTINGS_KEY = json.dumps(dict(OCR_SETTINGS, backend=OCR_BACKEND,
+                               tiling=[TILE_SIZE, TILE_OVERLAP] if TILING_ENABLED else None),
+                          sort_keys=True)
+
+# Serving mode: 'flask' (single-process dev server) or 'gunicorn' (pre-forked workers)
+SERVER_MODE = os.environ.get('OCR_SERVER', 'flask')
+
+# Input validation and size limits
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB limit
+MAX_IMAGE_SIDE = 4096
+MAX_IMAGES_PER_REQUEST = int(os.environ.get('OCR_MAX_IMAGES_PER_REQUEST', '64'))
+JSONLINES_TYPES = ('application/jsonlines', 'application/x-jsonlines', 'application/jsonl')
+MAX_REGIONS_PER_REQUEST = int(os.environ.get('OCR_MAX_REGIONS', '256'))
+
+# Multi-page documents (PDF, multi-frame TIFF), streamed back one NDJSON line per page
+PDF_DPI = int(os.environ.get('OCR_PDF_DPI', '200'))
+MAX_PAGES = int(os.environ.get('OCR_MAX_PAGES', '500'))
+MAX_DOCUMENT_SIZE = int(os.environ.get('OCR_MAX_DOCUMENT_MB', '50')) * 1024 * 1024
+
+# Micro-batching settings
+MAX_BATCH_SIZE = int(os.environ.get('OCR_MAX_BATCH_SIZE', '8'))
+MAX_BATCH_WAIT_MS = float(os.environ.get('OCR_MAX_BATCH_WAIT_MS', '10'))
+MAX_QUEUE_SIZE = int(os.environ.get('OCR_MAX_QUEUE_SIZE', '64'))
+
+# Admission control: invocations beyond OCR_MAX_IN_FLIGHT are rejected with
+# 429 before their body is read (0 disables). Each invocation gets a
+# deadline from the Deadline option (ms) or OCR_REQUEST_TIMEOUT_MS; work
+# whose deadline has passed is dropped before decode and before the model,
+# since SageMaker has given up on the invocation after 60s anyway. Streamed
+# documents apply the deadline to each page (see stream_document).
+MAX_IN_FLIGHT = int(os.environ.get('OCR_MAX_IN_FLIGHT', '64'))
+REQUEST_TIMEOUT_MS = float(os.environ.get('OCR_REQUEST_TIMEOUT_MS', '55000'))
+
+# Staged execution: image decoding and response serialization run on fixed
+# worker pools fed by bounded queues, so CPU work for the next requests
+# overlaps with the model thread instead of competing with it
+DECODE_WORKERS = int(os.environ.get('OCR_DECODE_WORKERS', str(min(4, os.cpu_count() or 1))))
+SERIALIZE_WORKERS = int(os.environ.get('OCR_SERIALIZE_WORKERS', '2'))
+STAGE_QUEUE_SIZE = int(os.environ.get('OCR_STAGE_QUEUE_SIZE', '128'))
+
+# Warmup: synthetic pages run through the pipeline before /ping reports ready
+WARMUP_SIZES = [tuple(int(v) for v in size.split('x'))
+                for size in os.environ.get('OCR_WARMUP_SIZES', '640x480,1280x960,960x1920').split(',')
+                if size.strip()]
+WARMUP_ROUNDS = int(os.environ.get('OCR_WARMUP_ROUNDS', '2'))
+
+# Result cache for repeated images (off unless OCR_CACHE_ENABLED=1)
+CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', '0') == '1'
+CACHE_MAX_MB = int(os.environ.get('OCR_CACHE_MAX_MB', '256'))
+CACHE_TTL = int(os.environ.get('OCR_CACHE_TTL', '3600'))
+CACHE_DIR = os.environ.get('OCR_CACHE_DIR', '')  # e.g. /tmp/ocr_cache, empty disables the disk tier
+CACHE_DISK_MAX_MB = int(os.environ.get('OCR_CACHE_DISK_MAX_MB', '1024'))
+
+# Response compression: bodies of at least OCR_GZIP_MIN_BYTES are gzipped
+# at OCR_GZIP_LEVEL (0 disables) for clients sending Accept-Encoding: gzip
+GZIP_LEVEL = int(os.environ.get('OCR_GZIP_LEVEL', '1'))
+GZIP_MIN_BYTES = int(os.environ.get('OCR_GZIP_MIN_BYTES', '1024'))
+
+# Line recognition cache for text crops repeated across pages (off unless
+# OCR_LINE_CACHE_ENABLED=1); OCR_LINE_CACHE_HASH is exact or perceptual
+LINE_CACHE_ENABLED = os.environ.get('OCR_LINE_CACHE_ENABLED', '0') == '1'
+LINE_CACHE_SIZE = int(os.environ.get('OCR_LINE_CACHE_SIZE', '100000'))
+LINE_CACHE_HASH = os.environ.get('OCR_LINE_CACHE_HASH', 'exact')
+
+# Blank page pre-screen after decode (off unless OCR_BLANK_SCREEN_ENABLED=1).
+# Images whose thumbnail tile std, edge density and ink ratio are all
+# within the limits get an empty result marked "skipped": "blank" without
+# running the model (see ocr_screen.py); the Screen=0 option turns it off
+# per request
+BLANK_SCREEN_ENABLED = os.environ.get('OCR_BLANK_SCREEN_ENABLED', '0') == '1'
+BLANK_MAX_STD = float(os.environ.get('OCR_BLANK_MAX_STD', '12'))
+BLANK_MAX_EDGE_DENSITY = float(os.environ.get('OCR_BLANK_MAX_EDGE_DENSITY', '0.005'))
+BLANK_MAX_INK_RATIO = float(os.environ.get('OCR_BLANK_MAX_INK_RATIO', '0.001'))
+
+# Metrics
+BATCH_SIZE = REGISTRY.histogram(
+    'ocr_batch_size', 'Number of images per model batch',
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+BATCH_WAIT = REGISTRY.histogram(
+    'ocr_batch_wait_seconds', 'Time a request waits in the queue before its batch starts',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+BATCH_DURATION = REGISTRY.histogram(
+    'ocr_batch_duration_seconds', 'Model time per batch')
+QUEUE_DEPTH = REGISTRY.gauge(
+    'ocr_queue_depth', 'Requests waiting for the batch scheduler')
+QUEUE_REJECTED = REGISTRY.counter(
+    'ocr_queue_rejected_total', 'Requests rejected because the batch queue was full')
+ADMISSION_REJECTED = REGISTRY.counter(
+    'ocr_admission_rejected_total', 'Requests rejected by a full limit (in_flight, or the decode/model/serialize queue)')
+DEADLINE_EXPIRED = REGISTRY.counter(
+    'ocr_deadline_expired_total', 'Requests dropped because their deadline passed, by the stage they were waiting for')
+STAGE_BUSY = REGISTRY.counter(
+    'ocr_stage_busy_seconds_total', 'Worker time spent busy per execution stage (decode, model, serialize)')
+STAGE_WORKERS = REGISTRY.gauge(
+    'ocr_stage_workers', 'Worker threads per execution stage; utilization = rate(busy seconds) / workers')
+STAGE_QUEUE_DEPTH = REGISTRY.gauge(
+    'ocr_stage_queue_depth', 'Jobs waiting per execution stage (model counts requests)')
+STAGE_SECONDS = REGISTRY.histogram(
+    'ocr_stage_seconds', 'Time per pipeline stage (model stages are per batch)',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+REQUESTS = REGISTRY.counter(
+    'ocr_requests_total', 'Invocations by input format, pipeline mode and HTTP status')
+IN_FLIGHT = REGISTRY.gauge(
+    'ocr_requests_in_flight', 'Invocations currently being processed')
+ERRORS = REGISTRY.counter(
+    'ocr_errors_total', 'Errors by reason, for whole requests and single images of batch requests')
+IMAGE_BYTES = REGISTRY.histogram(
+    'ocr_image_bytes', 'Encoded input image size in bytes',
+    buckets=(16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 6e6, 8e6, 10.5e6))
+IMAGE_MEGAPIXELS = REGISTRY.histogram(
+    'ocr_image_megapixels', 'Input image size in megapixels',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 12, 16, 32, 64))
+DOWNSCALED = REGISTRY.counter(
+    'ocr_images_downscaled_total', 'Images decoded at reduced size, by method (reduced JPEG decode or resize)')
+STARTUP_SECONDS = REGISTRY.gauge(
+    'ocr_startup_seconds', 'Startup time by phase (import, model_verify, paddleocr_import, model_load, warmup, preload, total)')
+COLD_START_SECONDS = REGISTRY.gauge(
+    'ocr_cold_start_seconds', 'Time from process start to the first successful /ping')
+BACKEND_INFO = REGISTRY.gauge(
+    'ocr_backend_info', 'OCR backend in use (value is always 1)')
+READY = REGISTRY.gauge(
+    'ocr_ready', '1 once the model is loaded and warmed up')
+
+# Startup state; /ping and /invocations return 503 until ready is set.
+# startup_fatal marks failures a restart cannot fix (a bad model store).
+ready = threading.Event()
+startup_lock = threading.Lock()
+startup_timings = {'import': IMPORT_SECONDS}
+startup_fatal = False
+
+# Cold start is measured from the start of the serving process; under
+# gunicorn, from the start of the process that exec'd into the master
+PROCESS_STARTED = float(os.environ.get('OCR_PROCESS_STARTED') or process_start_time())
+cold_start_seconds = None
+
+# Model store, opened at startup (None: PaddleOCR downloads models itself)
+model_store = None
+
+def backend_options(lang=OCR_LANG, version=OCR_MODEL_VERSION):
+    """Constructor options for the configured backend"""
+    if OCR_BACKEND == 'stub':
+        return {'det_ms': STUB_DET_MS, 'rec_ms': STUB_REC_MS}
+    options = dict(OCR_SETTINGS, lang=lang, ocr_version=version)
+    if OCR_BACKEND in ('paddle', 'paddle-cpu'):
+        if model_store is not None and (OFFLINE or f'{lang}:{version}' in model_store):
+            options.update(model_store.model_dirs(lang, version))
+        elif OFFLINE:
+            raise ModelStoreError(f'Model {lang}:{version} is not available offline (no model store)')
+    if OCR_BACKEND == 'paddle-cpu':
+        options.update(cpu_threads=CPU_THREADS, enable_mkldnn=ENABLE_MKLDNN)
+    elif OCR_BACKEND == 'onnx':
+        options.update(det_model=ONNX_DET_MODEL, rec_model=ONNX_REC_MODEL,
+                       cls_model=ONNX_CLS_MODEL or None, use_gpu=ONNX_USE_GPU)
+    return options
+
+@contextmanager
+def timed(stage, timings=None):
+    """Time a block into the stage histogram and a timings dict
+
+    Without an explicit dict, the current request's timings are used when
+    called from a request thread.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is None and has_request_context():
+            timings = g.setdefault('timings', {})
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def load_model(lang, version):
+    """Build the pipeline for a language and model version (the model pool's factory)
+
+    Models loaded while serving are warmed up before the waiting requests
+    use them; startup warms up its models itself.
+    """
+    if OCR_BACKEND == 'onnx' and (lang, version) != (OCR_LANG, OCR_MODEL_VERSION):
+        raise ValueError('the onnx backend only serves its configured models')
+    replicas = []
+    for _ in range(MODEL_REPLICAS):
+        backend = create_backend(OCR_BACKEND, tiling=TILING_ENABLED, tile_size=TILE_SIZE,
+                                 tile_overlap=TILE_OVERLAP, **backend_options(lang, version))
+        backend.line_cache = line_cache
+        backend.line_cache_namespace = f'{OCR_BACKEND}:{lang}:{version}'
+        replicas.append(backend)
+    pool = ReplicaPool(replicas, f'{lang}:{version}', REPLICA_TIMEOUT_MS / 1000.0)
+    if ready.is_set():
+        warmup(pool)
+    return pool
+
+def get_model_pool():
+    """Return the model pool, creating it if needed"""
+    global model_pool
+    with scheduler_lock:
+        if model_pool is None:
+            gpu = OCR_BACKEND == 'paddle' or (OCR_BACKEND == 'onnx' and ONNX_USE_GPU)
+            # A load builds every replica, so its estimated size does too
+            model_pool = ModelPool(load_model, MODEL_MEMORY_MB * 1024 * 1024, MAX_MODELS, gpu=gpu,
+                                   default_model_bytes=MODEL_SIZE_MB * 1024 * 1024 * MODEL_REPLICAS)
+    return model_pool
 
 def init_ocr():
-    """Initialize PaddleOCR with GPU"""
+    """Initialize the default OCR pipeline (PaddleOCR on GPU by default)"""
     global ocr
     if ocr is None:
         try:
-            from paddleocr import PaddleOCR
-            ocr = PaddleOCR(
-                use_angle_cls=True, 
-                lang='ch', 
-                det=True, 
-                rec=True, 
-                use_gpu=True,
-                show_log=False
-            )
-            print("PaddleOCR initialized successfully with GPU")
+            ocr = get_model_pool().get(OCR_LANG, OCR_MODEL_VERSION, resident=True)
+            startup_timings['paddleocr_import'] = getattr(ocr, 'import_seconds', 0.0)
+            BACKEND_INFO.set(1, backend=ocr.name, gpu=str(ocr.use_gpu).lower())
+            print(f"OCR backend '{ocr.name}' initialized (GPU: {ocr.use_gpu})")
         except Exception as e:
-            print(f"Failed to initialize PaddleOCR: {e}")
+            print(f"Failed to initialize OCR backend '{OCR_BACKEND}': {e}")
             ocr = None
     return ocr
 
+class QueueFullError(Exception):
+    """Raised when the batch queue has no room for another request"""
+
+class DeadlineExceededError(Exception):
+    """Raised when a request's deadline passes before its work has started"""
+
+class ImageError(Exception):
+    """Raised when an input image cannot be decoded or fails validation"""
+
+def check_deadline(deadline, stage):
+    """Raise DeadlineExceededError if deadline (monotonic time) has passed"""
+    if deadline is not None and time.monotonic() > deadline:
+        DEADLINE_EXPIRED.inc(stage=stage)
+        raise DeadlineExceededError(f'Request deadline exceeded before {stage}')
+
+class BatchScheduler:
+    """Collects concurrent requests into batches for one or more model threads
+
+    Each queued request may carry several images. A batch is dispatched as
+    soon as it holds max_batch_size images or the oldest queued request has
+    waited max_wait_ms, whichever comes first. Requests with different
+    pipeline options (language, model version, mode, angle classification)
+    share the queue but run as separate model calls within the batch. Requests whose deadline has
+    passed by the time their batch starts are failed without running.
+    With several workers (one per model replica) each thread collects and
+    runs its own batches from the shared queue.
+    """
+    
+    def __init__(self, run_batch, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait_ms=MAX_BATCH_WAIT_MS, max_queue_size=MAX_QUEUE_SIZE, workers=1):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._threads = [threading.Thread(target=self._loop, name=f'ocr-batcher-{i}', daemon=True)
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+        STAGE_WORKERS.set(len(self._threads), stage='model')
+    
+    def submit(self, images, timings=None, deadline=None, **options):
+        """Queue one request's images and block until they are processed
+
+        Returns one entry per image: its OCR lines, or the exception raised
+        while processing that image. If timings is given, the queue wait and
+        the stage durations of the batch the request ran in are added to it.
+        Raises DeadlineExceededError if deadline (monotonic time) passes
+        before the batch starts. options are passed on to run_batch.
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((images, future, time.monotonic(), timings, options, deadline))
+        except queue.Full:
+            QUEUE_REJECTED.inc()
+            ADMISSION_REJECTED.inc(limit='model')
+            raise QueueFullError('Server busy, batch queue is full')
+        QUEUE_DEPTH.set(self._queue.qsize())
+        STAGE_QUEUE_DEPTH.set(self._queue.qsize(), stage='model')
+        return future.result()
+    
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = batch[0][2] + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        QUEUE_DEPTH.set(self._queue.qsize())
+        STAGE_QUEUE_DEPTH.set(self._queue.qsize(), stage='model')
+        return batch
+    
+    def _run(self, images, timings, options):
+        """Run a batch, isolating a failure to the image that caused it"""
+        try:
+            return self.run_batch(images, timings, **options)
+        except ReplicaTimeoutError as e:
+            # Not the images' fault; rerunning them one by one would wait again
+            return [e] * len(images)
+        except Exception as e:
+            if len(images) == 1:
+                return [e]
+        results = []
+        for img in images:
+            try:
+                results.extend(self.run_batch([img], timings, **options))
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for item in batch:
+                try:
+                    check_deadline(item[5], 'model')
+                except DeadlineExceededError as e:
+                    item[1].set_exception(e)
+                    continue
+                groups.setdefault(tuple(sorted(item[4].items())), []).append(item)
+            for group in groups.values():
+                self._run_group(group)
+    
+    def _run_group(self, group):
+        """Run the requests of a batch that share the same pipeline options"""
+        images = [img for item in group for img in item[0]]
+        started = time.monotonic()
+        for item in group:
+            BATCH_WAIT.observe(started - item[2])
+        BATCH_SIZE.observe(len(images))
+        batch_timings = {}
+        results = self._run(images, batch_timings, group[0][4])
+        BATCH_DURATION.observe(time.monotonic() - started)
+        STAGE_BUSY.inc(time.monotonic() - started, stage='model')
+        # Per-image line cache counts; misaligned if a failed batch was rerun image by image
+        line_counts = batch_timings.pop('line_cache', None)
+        if line_counts is not None and len(line_counts) != len(images):
+            line_counts = None
+        for stage, seconds in batch_timings.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        offset = 0
+        for item_images, future, enqueued, timings, _, _ in group:
+            if timings is not None:
+                timings['queue_wait'] = started - enqueued
+                timings.update(batch_timings)
+                if line_counts is not None:
+                    counts = timings.setdefault('line_cache', {'hits': 0, 'lines': 0})
+                    for hits, lines in line_counts[offset:offset + len(item_images)]:
+                        counts['hits'] += hits
+                        counts['lines'] += lines
+            future.set_result(results[offset:offset + len(item_images)])
+            offset += len(item_images)
+
+class StagePool:
+    """Fixed set of worker threads for one CPU stage, fed by a bounded queue
+
+    submit() raises QueueFullError instead of blocking when the stage is
+    saturated, so overload turns into 503s rather than unbounded backlog.
+    Jobs still queued when their deadline passes fail without running, and
+    jobs whose future was cancelled are skipped.
+    """
+    
+    def __init__(self, stage, workers, max_queue_size=STAGE_QUEUE_SIZE):
+        self.stage = stage
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._work, name=f'ocr-{stage}-{i}', daemon=True).start()
+        STAGE_WORKERS.set(max(1, workers), stage=stage)
+    
+    def submit(self, fn, *args, deadline=None):
+        """Queue fn(*args) and return a Future for its result"""
+        future = Future()
+        try:
+            self._queue.put_nowait((fn, args, future, deadline))
+        except queue.Full:
+            ADMISSION_REJECTED.inc(limit=self.stage)
+            raise QueueFullError(f'Server busy, {self.stage} queue is full')
+        STAGE_QUEUE_DEPTH.set(self._queue.qsize(), stage=self.stage)
+        return future
+    
+    def _work(self):
+        while True:
+            fn, args, future, deadline = self._queue.get()
+            STAGE_QUEUE_DEPTH.set(self._queue.qsize(), stage=self.stage)
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.monotonic()
+            try:
+                check_deadline(deadline, self.stage)
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                STAGE_BUSY.inc(time.monotonic() - started, stage=self.stage)
+
+# Global stage pools, created on first use like the batch scheduler
+stage_pools = {}
+
+def get_stage_pool(stage):
+    """Return the worker pool for the decode or serialize stage"""
+    with scheduler_lock:
+        if stage not in stage_pools:
+            workers = DECODE_WORKERS if stage == 'decode' else SERIALIZE_WORKERS
+            stage_pools[stage] = StagePool(stage, workers)
+    return stage_pools[stage]
+
+def run_stage(stage, fn, values):
+    """Run fn(value, timings) for each value on a stage pool and wait for all
+
+    Each job times itself into its own dict; the dicts are summed into the
+    current request's timings. ImageErrors are returned in place of the
+    result, other exceptions propagate (DeadlineExceededError when a
+    decode job's request expired while it was queued). When the request
+    fails, its jobs that have not started yet are cancelled rather than
+    left to run for a response that is never sent.
+    """
+    pool = get_stage_pool(stage)
+    # Expired work is dropped before decode, not after the model has already run
+    deadline = g.get('deadline') if stage == 'decode' else None
+    jobs = []
+    results = []
+    timings = g.setdefault('timings', {})
+    try:
+        for value in values:
+            job_timings = {}
+            jobs.append((pool.submit(fn, value, job_timings, deadline=deadline), job_timings))
+        for future, job_timings in jobs:
+            try:
+                results.append(future.result())
+            except ImageError as e:
+                results.append(e)
+            for name, seconds in job_timings.items():
+                timings[name] = timings.get(name, 0.0) + seconds
+    except Exception:
+        for future, _ in jobs:
+            future.cancel()
+        raise
+    return results
+
+line_cache = LineCache(LINE_CACHE_SIZE, LINE_CACHE_HASH) if LINE_CACHE_ENABLED else None
+
+blank_screen = BlankScreen(BLANK_MAX_STD, BLANK_MAX_EDGE_DENSITY,
+                           BLANK_MAX_INK_RATIO) if BLANK_SCREEN_ENABLED else None
+
+result_cache = ResultCache(CACHE_MAX_MB * 1024 * 1024, CACHE_TTL, CACHE_DIR or None,
+                           CACHE_DISK_MAX_MB * 1024 * 1024) if CACHE_ENABLED else None
+
+# Global batch scheduler, created on first use so it starts in the serving process
+scheduler = None
+scheduler_lock = threading.Lock()
+
+def run_batch(images, timings=None, lang=OCR_LANG, version=OCR_MODEL_VERSION, **options):
+    """Run a batch on the pipeline for its language and model version"""
+    # Already acquired by the requests in the batch, so this is not counted as a hit
+    return get_model_pool().get(lang, version, record=False).infer(images, timings, **options)
+
+def get_scheduler():
+    """Return the batch scheduler, starting it if needed"""
+    global scheduler
+    with scheduler_lock:
+        if scheduler is None:
+            scheduler = BatchScheduler(run_batch, workers=MODEL_REPLICAS)
+    return scheduler
+
+def request_option(name):
+    """Read a per-request option from an X-OCR-<Name> header or SageMaker CustomAttributes
+
+    invoke_endpoint only forwards CustomAttributes, which arrive as
+    X-Amzn-SageMaker-Custom-Attributes: "cache=bypass;timings=1".
+    """
+    value = request.headers.get('X-OCR-' + name)
+    if value is not None:
+        return value.strip()
+    attributes = request.headers.get('X-Amzn-SageMaker-Custom-Attributes', '')
+    for part in attributes.replace(',', ';').split(';'):
+        key, _, value = part.partition('=')
+        if key.strip().lower() == name.lower():
+            return value.strip()
+    return None
+
+def request_deadline():
+    """Monotonic deadline from the Deadline option (ms from arrival) or the default timeout
+
+    Raises ValueError for a malformed value; 0 or less disables the deadline.
+    """
+    value = request_option('Deadline')
+    try:
+        timeout_ms = float(value) if value else REQUEST_TIMEOUT_MS
+    except ValueError:
+        raise ValueError(f"Invalid deadline '{value}' (milliseconds)")
+    if timeout_ms <= 0:
+        return None
+    return g.arrived + timeout_ms / 1000.0
+
+def pipeline_options():
+    """Per-request pipeline from the Lang, Version, Mode and Cls options
+
+    Lang and Version select the model (OCR_LANG / OCR_MODEL_VERSION by
+    default, limited to OCR_LANGS / OCR_MODEL_VERSIONS). Mode is full
+    (default), det (boxes only) or rec (each image is one pre-cropped text
+    line); Cls=0 skips angle classification. Raises ValueError for an
+    unknown value.
+    """
+    lang = request_option('Lang') or OCR_LANG
+    if lang not in LANGS and lang != OCR_LANG:
+        raise ValueError(f"Unsupported lang '{lang}' (choose from {', '.join(LANGS)})")
+    version = request_option('Version') or OCR_MODEL_VERSION
+    versions = {v.lower(): v for v in MODEL_VERSIONS + [OCR_MODEL_VERSION]}
+    if version.lower() not in versions:
+        raise ValueError(f"Unsupported version '{version}' (choose from {', '.join(MODEL_VERSIONS)})")
+    mode = (request_option('Mode') or 'full').lower()
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}' (choose from {', '.join(MODES)})")
+    use_cls = (request_option('Cls') or '1').lower() not in ('0', 'false', 'no')
+    return {'lang': lang, 'version': versions[version.lower()], 'mode': mode, 'use_cls': use_cls}
+
+def output_options(mode='full'):
+    """Response layout from the Fields, Format and Coords options
+
+    Fields (bbox, text, confidence; ',' or '+' separated) drops the others,
+    Format=columnar returns flat arrays per image and Coords=int rounds box
+    coordinates. Raises ValueError for an unknown value or a field the
+    pipeline mode does not produce.
+    """
+    return parse_output(request_option('Fields'), request_option('Format'), request_option('Coords'), mode)
+
+def ocr_images(images, bypass_cache=False, options=None):
+    """Run OCR on decoded images through the result cache and the batch scheduler
+
+    Returns one entry per image: its OCR lines (or boxes / line text for
+    the det and rec modes in options), or the exception raised for it.
+    Images the blank pre-screen rejects get an empty BlankPage without
+    reaching the cache or the model. With bypass_cache the cache is not
+    read but still refreshed. The model for the options' language and
+    version is loaded here if needed and held until the batch has run.
+    """
+    options = options or {'lang': OCR_LANG, 'version': OCR_MODEL_VERSION, 'mode': 'full', 'use_cls': True}
+    settings = SETTINGS_KEY + json.dumps(options, sort_keys=True)
+    # Line crops (rec mode) are not screened: a blank crop still gets its empty text from the model
+    screen = (blank_screen is not None and options['mode'] != 'rec'
+              and not (has_request_context() and g.get('screen') is False))
+    results = [None] * len(images)
+    keys = [None] * len(images)
+    pending = []
+    for i, img in enumerate(images):
+        if screen:
+            with timed('blank_screen'):
+                blank = blank_screen.is_blank(img)
+            if blank:
+                results[i] = BlankPage()
+                continue
+        if result_cache is not None:
+            keys[i] = image_key(img, settings)
+            if not bypass_cache:
+                results[i] = result_cache.get(keys[i])
+        if results[i] is None:
+            pending.append(i)
+    
+    if pending:
+        timings = g.setdefault('timings', {}) if has_request_context() else None
+        deadline = g.get('deadline') if has_request_context() else None
+        with get_model_pool().use(options['lang'], options['version']):
+            outputs = get_scheduler().submit([images[i] for i in pending], timings, deadline, **options)
+        for i, output in zip(pending, outputs):
+            results[i] = output
+            if result_cache is not None and not isinstance(output, Exception):
+                result_cache.put(keys[i], output)
+    return results
+
+def read_body(stream, content_length, limit=MAX_IMAGE_SIZE, chunk_size=64 * 1024):
+    """Read a raw request body in chunks, failing as soon as it exceeds limit
+
+    Returns a single bytes object so the decoders below can wrap it without
+    copying it again.
+    """
+    message = f'Image too large (max {limit // (1024 * 1024)}MB)'
+    if content_length is not None and content_length > limit:
+        raise ImageError(message)
+    chunks = []
+    total = 0
+    with timed('read_body'):
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > limit:
+                raise ImageError(message)
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+def downscale_size(width, height):
+    """Target size under the downscale limits, or None if the image already fits"""
+    scale = 1.0
+    if DOWNSCALE_MAX_SIDE:
+        scale = min(scale, DOWNSCALE_MAX_SIDE / max(width, height))
+    if DOWNSCALE_MAX_PIXELS:
+        scale = min(scale, (DOWNSCALE_MAX_PIXELS / (width * height)) ** 0.5)
+    if scale >= 1.0:
+        return None
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def decode_image(image_data, timings=None, downscale=True):
+    """Validate encoded image bytes and decode them straight to a BGR array
+
+    OpenCV decodes directly from the request buffer. Formats it cannot read
+    fall back to the PIL conversion path. Returns (img_array, scale) where
+    scale is the (x, y) factor from the decoded array back to the original
+    image, or None when it was decoded at full size.
+    """
+    IMAGE_BYTES.observe(len(image_data))
+    if len(image_data) > MAX_IMAGE_SIZE:
+        raise ImageError('Image too large (max 10MB)')
+    
+    with timed('image_decode', timings):
+        return _decode_image(image_data, downscale)
+
+def _decode_image(image_data, downscale=True):
+    # Validate image dimensions from the header before decoding any pixels
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            width, height = image.size
+            image_format = image.format
+    except Exception:
+        raise ImageError('Invalid image format')
+    IMAGE_MEGAPIXELS.observe(width * height / 1e6)
+    if TILING_ENABLED or DOWNSCALE_MAX_SIDE or DOWNSCALE_MAX_PIXELS:
+        if width * height > MAX_TOTAL_PIXELS:
+            raise ImageError(f'Image too large (max {MAX_TOTAL_PIXELS} pixels)')
+    elif width > MAX_IMAGE_SIDE or height > MAX_IMAGE_SIDE:
+        raise ImageError('Image dimensions too large (max 4096x4096)')
+    
+    size = downscale_size(width, height) if downscale else None
+    reduced = cv2.IMREAD_COLOR
+    if size is not None and image_format == 'JPEG':
+        reduced = jpeg_reduced_flag(width / size[0])
+    
+    # EXIF orientation is ignored so boxes match the stored pixel layout
+    img_array = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8),
+                             reduced | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img_array is None:
+        img_array = decode_image_pil(image_data)
+    if size is None:
+        return img_array, None
+    
+    DOWNSCALED.inc(method='resize' if reduced == cv2.IMREAD_COLOR else 'reduced')
+    if (img_array.shape[1], img_array.shape[0]) != size:
+        # Bilinear is enough for the < 2x left after a reduced decode; area
+        # averaging avoids aliasing for larger factors
+        factor = img_array.shape[1] / size[0]
+        img_array = cv2.resize(img_array, size,
+                               interpolation=cv2.INTER_LINEAR if factor < 2 else cv2.INTER_AREA)
+    return img_array, (width / size[0], height / size[1])
+
+def jpeg_reduced_flag(factor):
+    """Largest libjpeg DCT scaling (1/8, 1/4, 1/2) that stays at or above the target size
+
+    Same reduced decoding as PIL's draft mode, but OpenCV decodes straight
+    to BGR without the extra RGB conversion copy.
+    """
+    for divisor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                          (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if factor >= divisor:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def rescale_boxes(result, scale, mode='full'):
+    """Map the boxes of one image's result from the decoded array back to the original image"""
+    if scale is None or mode == 'rec' or not result:
+        return result
+    sx, sy = scale
+    if mode == 'det':
+        return [[[x * sx, y * sy] for x, y in bbox] for bbox in result]
+    return [[[[x * sx, y * sy] for x, y in line[0]], line[1]] for line in result]
+
+def decode_image_pil(image_data):
+    """Convert image bytes to a BGR array through PIL (formats OpenCV cannot read)"""
+    try:
+        img_array = np.array(Image.open(io.BytesIO(image_data)))
+    except Exception:
+        raise ImageError('Invalid image data')
+    if len(img_array.shape) == 3 and img_array.shape[2] == 3:
+        return cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+    elif len(img_array.shape) == 2:
+        return cv2.cvtColor(img_array, cv2.COLOR_GRAY2BGR)
+    raise ImageError('Unsupported image format')
+
+def decode_base64_image(value, timings=None, downscale=True):
+    """Decode a base64 image string from a JSON request"""
+    if not isinstance(value, str):
+        raise ImageError('Invalid image data')
+    # Reject oversized payloads before spending time decoding them
+    if len(value) // 4 * 3 > MAX_IMAGE_SIZE + 3:
+        raise ImageError('Image too large (max 10MB)')
+    try:
+        with timed('base64_decode', timings):
+            image_data = base64.b64decode(value)
+    except Exception:
+        raise ImageError('Invalid image data')
+    return decode_image(image_data, timings, downscale)
+
+def format_result(result, mode='full', output=DEFAULT_OUTPUT):
+    """Response fields for one image's result in the given pipeline mode and output layout"""
+    if mode == 'rec':
+        text, confidence = result
+        line = {'text': text, 'confidence': confidence}
+        return {name: line[name] for name in output.fields if name in line}
+    if mode == 'det':
+        detections = format_lines(result, None, None, output)
+    else:
+        detections = format_detections(result, output)
+    count = len(result) if result else 0
+    if output.format == 'columnar':
+        formatted = dict(detections, count=count)
+    else:
+        formatted = {'detections': detections, 'count': count}
+    if isinstance(result, BlankPage):
+        formatted['skipped'] = 'blank'
+    return formatted
+
+def format_detections(result, output=DEFAULT_OUTPUT):
+    """Convert OCR lines into the response detections (dicts, or columns for the columnar format)"""
+    result = result or []
+    bboxes = [detection[0] for detection in result]
+    texts = [detection[1][0] if detection[1] else "" for detection in result]
+    confidences = [detection[1][1] if detection[1] else 0.0 for detection in result]
+    return format_lines(bboxes, texts, confidences, output)
+
+def parse_jsonline(line, timings=None, downscale=True):
+    """Decode one JSON Lines record into an image array"""
+    try:
+        with timed('parse', timings):
+            record = json.loads(line)
+    except ValueError:
+        raise ImageError('Invalid JSON line')
+    if not isinstance(record, dict) or 'image' not in record:
+        raise ImageError('No image provided')
+    return decode_base64_image(record['image'], timings, downscale)
+
+def parse_regions(value):
+    """Validate the regions of a region request
+
+    Each region is {"id": ..., "bbox": [x1, y1, x2, y2]} or {"id": ...,
+    "quad": [[x, y] x 4]} (clockwise from top-left), with "detect": true to
+    run detection inside it instead of reading it as a single line. Ids
+    default to the region's index. Returns dicts with the id, the quad as
+    a float32 array, whether it is an axis-aligned rectangle and detect.
+    Raises ValueError for a malformed list.
+    """
+    if not isinstance(value, list) or not value:
+        raise ValueError('regions must be a non-empty list')
+    if len(value) > MAX_REGIONS_PER_REQUEST:
+        raise ValueError(f'Too many regions (max {MAX_REGIONS_PER_REQUEST})')
+    regions = []
+    ids = set()
+    for index, region in enumerate(value):
+        if not isinstance(region, dict):
+            raise ValueError(f'Region {index} must be an object')
+        region_id = str(region.get('id', index))
+        if region_id in ids:
+            raise ValueError(f"Duplicate region id '{region_id}'")
+        ids.add(region_id)
+        try:
+            if 'bbox' in region:
+                x1, y1, x2, y2 = (float(v) for v in region['bbox'])
+                if x2 <= x1 or y2 <= y1:
+                    raise ValueError
+                quad = np.float32([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+            else:
+                quad = np.asarray(region['quad'], dtype=np.float32)
+                if quad.shape != (4, 2):
+                    raise ValueError
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Region '{region_id}' needs a bbox [x1, y1, x2, y2] or a quad of 4 [x, y] points")
+        regions.append({'id': region_id, 'quad': quad, 'rect': 'bbox' in region,
+                        'detect': bool(region.get('detect', False))})
+    return regions
+
+def crop_region(img, region):
+    """Cut one region out of the page
+
+    Rectangles are sliced, quads are perspective-rectified. Returns (crop,
+    matrix) where matrix maps crop coordinates back to the page, or raises
+    ImageError if the region does not overlap the image.
+    """
+    height, width = img.shape[:2]
+    quad = region['quad']
+    x1, y1 = np.floor(quad.min(axis=0)).astype(int)
+    x2, y2 = np.ceil(quad.max(axis=0)).astype(int)
+    if x2 <= 0 or y2 <= 0 or x1 >= width or y1 >= height:
+        raise ImageError(f"Region '{region['id']}' is outside the image")
+    if region['rect']:
+        x1, y1 = max(x1, 0), max(y1, 0)
+        crop = img[y1:min(y2, height), x1:min(x2, width)]
+        matrix = np.float32([[1, 0, x1], [0, 1, y1], [0, 0, 1]])
+        if not region['detect'] and crop.shape[0] / crop.shape[1] >= 1.5:
+            crop = np.rot90(crop)  # vertical line, as crop_quad does
+        return crop, matrix
+    crop = crop_quad(img, quad, rotate_vertical=not region['detect'])
+    return crop, np.linalg.inv(quad_transform(quad)[0])
+
+def decode_regions(value, timings=None, regions=()):
+    """Decode a base64 page and cut out its regions; a region error is returned in its place"""
+    img_array, _ = decode_base64_image(value, timings, downscale=False)
+    crops = []
+    with timed('crop_regions', timings):
+        for region in regions:
+            try:
+                crops.append(crop_region(img_array, region))
+            except ImageError as e:
+                crops.append(e)
+    return crops
+
+def map_region_lines(result, matrix):
+    """Map the boxes detected in a region crop back to page coordinates"""
+    if not result:
+        return result
+    points = np.float32([line[0] for line in result]).reshape(-1, 1, 2)
+    mapped = cv2.perspectiveTransform(points, matrix).reshape(-1, 4, 2).tolist()
+    return [[bbox, line[1]] for bbox, line in zip(mapped, result)]
+
+def ocr_regions(regions, crops, bypass_cache=False, options=None, output=DEFAULT_OUTPUT):
+    """OCR region crops, returning one result dict per region
+
+    Line regions are recognized together as one rec batch; detect regions
+    go through the full pipeline with their boxes mapped back to page
+    coordinates.
+    """
+    options = options or {'lang': OCR_LANG, 'version': OCR_MODEL_VERSION, 'mode': 'full', 'use_cls': True}
+    outputs = {}
+    for detect, mode in ((False, 'rec'), (True, 'full')):
+        indexes = [i for i, region in enumerate(regions)
+                   if region['detect'] == detect and not isinstance(crops[i], Exception)]
+        if indexes:
+            results = ocr_images([crops[i][0] for i in indexes], bypass_cache, dict(options, mode=mode))
+            outputs.update(zip(indexes, results))
+    
+    results = {}
+    for i, region in enumerate(regions):
+        item = crops[i] if isinstance(crops[i], Exception) else outputs[i]
+        if isinstance(item, Exception):
+            ERRORS.inc(reason='image' if isinstance(item, ImageError) else 'model')
+            results[region['id']] = {'error': str(item), 'status': 'error'}
+        elif region['detect']:
+            results[region['id']] = dict(format_result(map_region_lines(item, crops[i][1]), 'full', output),
+                                         status='success')
+        else:
+            results[region['id']] = dict(format_result(item, 'rec', output), status='success')
+    return results
+
+def run_items(items, bypass_cache=False, options=None, output=DEFAULT_OUTPUT):
+    """OCR a multi-image request, returning one result dict per input in order
+
+    Items are (img_array, scale) pairs from decode_image or the ImageError
+    raised decoding them. Failed items are passed through as per-item
+    errors; the rest go to the batch scheduler together.
+    """
+    mode = (options or {}).get('mode', 'full')
+    images = [item[0] for item in items if not isinstance(item, Exception)]
+    outputs = iter(ocr_images(images, bypass_cache, options) if images else [])
+    results = []
+    for item in items:
+        if not isinstance(item, Exception):
+            scale = item[1]
+            item = next(outputs)
+        if isinstance(item, Exception):
+            ERRORS.inc(reason='image' if isinstance(item, ImageError) else 'model')
+            results.append({'error': str(item), 'status': 'error'})
+        else:
+            results.append(dict(format_result(rescale_boxes(item, scale, mode), mode, output), status='success'))
+    return results
+
+def page_render_size(width, height, downscale=True):
+    """Render size for a document page
+
+    Pages larger than the image limits are rendered smaller instead of
+    being rejected; the downscale limits apply as for single images.
+    """
+    scale = 1.0
+    if TILING_ENABLED or DOWNSCALE_MAX_SIDE or DOWNSCALE_MAX_PIXELS:
+        scale = min(scale, (MAX_TOTAL_PIXELS / (width * height)) ** 0.5)
+    else:
+        scale = min(scale, MAX_IMAGE_SIDE / max(width, height))
+    size = downscale_size(width, height) if downscale else None
+    if size is not None:
+        scale = min(scale, size[0] / width)
+    if scale >= 1.0:
+        return width, height
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def render_page(document, index, downscale=True, timings=None):
+    """Rasterize one page; returns (img_array, scale, page size at the document DPI)"""
+    with timed('rasterize', timings):
+        width, height = document.page_size(index)
+        img_array = document.render(index, page_render_size(width, height, downscale))
+    IMAGE_MEGAPIXELS.observe(img_array.shape[0] * img_array.shape[1] / 1e6)
+    scale = None
+    if (img_array.shape[1], img_array.shape[0]) != (width, height):
+        scale = (width / img_array.shape[1], height / img_array.shape[0])
+    return img_array, scale, (width, height)
+
+def stream_document(document, options, bypass_cache=False, output=DEFAULT_OUTPUT):
+    """Yield one NDJSON result line per page, then a summary line
+
+    Page N+1 is rasterized on the decode stage while page N is in OCR, so
+    at most two pages are in memory and the first page's results go out
+    before the rest of the document is rasterized.
+    
+    The request deadline bounds each page rather than the whole document:
+    the first page must finish within it from arrival, and every later page
+    within the same budget from when it is started, so a 500-page document
+    is not cut off by a timeout meant for a single invocation.
+    """
+    pool = get_stage_pool('decode')
+    timings = g.setdefault('timings', {})
+    downscale = options['mode'] != 'rec'
+    budget = g.deadline - g.arrived if g.get('deadline') is not None else None
+    
+    def page_deadline():
+        return time.monotonic() + budget if budget is not None else None
+    
+    def prefetch(index):
+        job_timings = {}
+        try:
+            future = pool.submit(render_page, document, index, downscale, job_timings,
+                                 deadline=g.get('deadline') if index == 0 else page_deadline())
+        except QueueFullError as e:
+            future = Future()
+            future.set_exception(e)
+        return future, job_timings
+    
+    errors = 0
+    pending = prefetch(0)
+    try:
+        for index in range(document.page_count):
+            future, job_timings = pending
+            try:
+                page = future.result()
+            except Exception as e:
+                page = e
+            for name, seconds in job_timings.items():
+                timings[name] = timings.get(name, 0.0) + seconds
+            if index:
+                g.deadline = page_deadline()
+            pending = prefetch(index + 1) if index + 1 < document.page_count else None
+            
+            line = {'page': index + 1}
+            reason = 'image'
+            if not isinstance(page, Exception):
+                img_array, scale, (width, height) = page
+                line.update(width=width, height=height)
+                try:
+                    page = ocr_images([img_array], bypass_cache, options)[0]
+                except (QueueFullError, DeadlineExceededError, ModelLoadError, ReplicaTimeoutError) as e:
+                    page = e
+                reason = 'model'
+                del img_array
+            if isinstance(page, DeadlineExceededError):
+                # Later pages would expire too; end the stream instead of rendering them
+                ERRORS.inc(reason='expired')
+                line.update(error=str(page), status='error')
+                yield dumps(line) + b'\n'
+                yield dumps({'status': 'expired', 'pages': document.page_count,
+                             'completed': index, 'errors': errors + 1}) + b'\n'
+                return
+            if isinstance(page, Exception):
+                errors += 1
+                ERRORS.inc(reason='busy' if isinstance(page, (QueueFullError, ModelBudgetError, ReplicaTimeoutError))
+                           else reason)
+                line.update(error=str(page), status='error')
+            else:
+                line.update(format_result(rescale_boxes(page, scale, options['mode']), options['mode'], output),
+                            status='success')
+            yield dumps(line) + b'\n'
+        yield dumps({'status': 'complete', 'pages': document.page_count, 'errors': errors}) + b'\n'
+    finally:
+        # A client disconnect stops the generator early; let the
+        # in-flight render finish before closing the document under it
+        if pending is not None:
+            pending[0].exception()
+        document.close()
+
+def document_response(data, options, bypass_cache=False, output=DEFAULT_OUTPUT):
+    """Open a PDF / multi-frame TIFF body and stream its per-page results"""
+    g.input_format = 'document'
+    try:
+        dpi = min(600, max(50, int(request_option('Dpi') or PDF_DPI)))
+    except ValueError:
+        return error_response('Invalid DPI', 400, 'bad_request')
+    try:
+        document = open_document(data, request.mimetype, dpi)
+    except DocumentError as e:
+        return error_response(str(e), 400, 'image')
+    if not 0 < document.page_count <= MAX_PAGES:
+        document.close()
+        return error_response(f'Document must have 1 to {MAX_PAGES} pages', 400, 'bad_request')
+    response = Response(stream_with_context(stream_document(document, options, bypass_cache, output)),
+                        mimetype='application/x-ndjson')
+    # The document holds its in-flight slot until the last page is sent or the client goes away
+    g.streaming = True
+    response.call_on_close(partial(release_request, g._get_current_object()))
+    return response
+
+def make_warmup_image(width, height):
+    """Synthetic white page with dark text lines so every stage has work"""
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    line_height = max(24, height // 16)
+    for i, y in enumerate(range(line_height, height - line_height // 2, line_height * 2)):
+        cv2.putText(img, f'Warmup {i} 0123456789 ABCDEFG', (16, y), cv2.FONT_HERSHEY_SIMPLEX,
+                    line_height / 32.0, (0, 0, 0), 2)
+    return img
+
+def warmup(ocr_instance):
+    """Run warmup inferences at each configured size, single and batched, on every replica"""
+    images = [make_warmup_image(width, height) for width, height in WARMUP_SIZES]
+    for replica in getattr(ocr_instance, 'replicas', [ocr_instance]):
+        for _ in range(WARMUP_ROUNDS):
+            for img in images:
+                replica.infer([img])
+        if len(images) > 1:
+            replica.infer(images)
+
+def open_model_store():
+    """Find the model store and verify the default and preloaded models against its manifest
+
+    Raises ModelStoreError on a checksum mismatch, a missing file, or a
+    required model missing from the store.
+    """
+    global model_store
+    if OCR_BACKEND not in ('paddle', 'paddle-cpu'):
+        return
+    model_store = find_store(MODEL_STORE_PATH)
+    if model_store is None:
+        if OFFLINE:
+            raise ModelStoreError('OCR_OFFLINE=1 but no model store was found (set OCR_MODEL_STORE)')
+        print("No model store found; PaddleOCR downloads models on first use")
+        return
+    models = [(OCR_LANG, OCR_MODEL_VERSION)]
+    for model in PRELOAD_MODELS:
+        lang, _, version = model.partition(':')
+        models.append((lang, version or OCR_MODEL_VERSION))
+    for lang, version in models:
+        if OFFLINE or f'{lang}:{version}' in model_store:
+            model_store.verify(lang, version)
+    print(f"Model store {model_store.root}: {', '.join(sorted(model_store.models))}")
+
+def startup():
+    """Load the model, warm it up and mark the server ready
+
+    Returns False if the model could not be loaded or warmed up, and also
+    sets startup_fatal if the model store failed its check.
+    """
+    global startup_fatal
+    with startup_lock:
+        if ready.is_set():
+            return True
+        
+        started = time.monotonic()
+        try:
+            open_model_store()
+        except ModelStoreError as e:
+            startup_fatal = True
+            print(f"Model store check failed: {e}")
+            return False
+        startup_timings['model_verify'] = time.monotonic() - started
+        
+        started = time.monotonic()
+        ocr_instance = init_ocr()
+        startup_timings['model_load'] = time.monotonic() - started - startup_timings.get('paddleocr_import', 0.0)
+        if ocr_instance is None:
+            return False
+        
+        started = time.monotonic()
+        try:
+            warmup(ocr_instance)
+        except Exception as e:
+            print(f"Warmup failed: {e}")
+            return False
+        startup_timings['warmup'] = time.monotonic() - started
+        
+        # Extra languages / versions; a model that fails to load is logged
+        # and loaded again on demand rather than blocking startup
+        started = time.monotonic()
+        for model in PRELOAD_MODELS:
+            lang, _, version = model.partition(':')
+            try:
+                warmup(get_model_pool().get(lang, version or OCR_MODEL_VERSION, resident=True))
+            except Exception as e:
+                print(f"Preloading model {model} failed: {e}")
+        if PRELOAD_MODELS:
+            startup_timings['preload'] = time.monotonic() - started
+        startup_timings['total'] = time.monotonic() - IMPORT_STARTED
+        
+        for phase, seconds in startup_timings.items():
+            STARTUP_SECONDS.set(seconds, phase=phase)
+        READY.set(1)
+        ready.set()
+        print("Startup complete: " + json.dumps({k: round(v, 3) for k, v in startup_timings.items()}))
+        return True
+
 @app.route('/ping', methods=['GET'])
 def ping():
-    """Health check endpoint"""
+    """Health check endpoint, 200 only after the model is loaded and warmed up"""
+    global cold_start_seconds
+    if not ready.is_set():
+        return jsonify({'status': 'loading'}), 503
+    if cold_start_seconds is None:
+        cold_start_seconds = time.time() - PROCESS_STARTED
+        COLD_START_SECONDS.set(cold_start_seconds)
+        print(f"First successful /ping {cold_start_seconds:.2f}s after process start")
     return '', 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Invocation slots for admission control; None when OCR_MAX_IN_FLIGHT=0
+admission = threading.BoundedSemaphore(MAX_IN_FLIGHT) if MAX_IN_FLIGHT > 0 else None
+
+@app.route('/models', methods=['GET'])
+def models():
+    """Per-model load time, hit rate and memory of the model pool"""
+    if model_pool is None:
+        return jsonify({'models': []})
+    return jsonify(model_pool.stats())
+
+@app.before_request
+def start_request():
+    if request.endpoint == 'predict':
+        # Rejected before the body is read, so a spike costs no decode or memory
+        if admission is not None and not admission.acquire(blocking=False):
+            ADMISSION_REJECTED.inc(limit='in_flight')
+            response = error_response('Server busy, too many requests in flight', 429, 'busy')
+            REQUESTS.inc(format='unknown', mode='full', status='429')
+            return response
+        g.admitted = True
+        g.arrived = time.monotonic()
+        g.started = time.perf_counter()
+        g.timings = {}
+        g.counted = True
+        IN_FLIGHT.inc()
+
+@app.after_request
+def count_request(response):
+    if request.endpoint == 'predict' and 'started' in g:
+        STAGE_SECONDS.observe(time.perf_counter() - g.started, stage='total')
+        REQUESTS.inc(format=g.get('input_format', 'unknown'), mode=g.get('mode', 'full'),
+                     status=str(response.status_code))
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    # Teardown runs before a streamed document has rendered its first page
+    # (and again when it ends); its slot is released when the stream closes
+    if not g.get('streaming'):
+        release_request(g)
+
+def release_request(state):
+    """Give back a request's in-flight count and admission slot, once
+
+    state is the request's g, passed explicitly so a streamed response can
+    release it from call_on_close, outside the request context.
+    """
+    if state.pop('counted', False):
+        IN_FLIGHT.dec()
+    if state.pop('admitted', False) and admission is not None:
+        admission.release()
+
+def error_response(message, status, reason):
+    """Count an error by reason and build its JSON response"""
+    ERRORS.inc(reason=reason)
+    return jsonify({'error': message}), status
+
+def body_response(body, mimetype, gzip=False):
+    """Response for an encoded body, gzipped when negotiated and large enough to gain from it"""
+    if gzip and len(body) >= GZIP_MIN_BYTES:
+        response = Response(compress(body, GZIP_LEVEL), mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def serialize_json(payload, timings=None, gzip=False):
+    with timed('serialization', timings):
+        return body_response(dumps(payload), 'application/json', gzip)
+
+def serialize_jsonlines(results, timings=None, gzip=False):
+    with timed('serialization', timings):
+        body = b''.join(dumps(result) + b'\n' for result in results)
+        return body_response(body, 'application/jsonlines', gzip)
+
+def wants_gzip():
+    """True if the client accepts a gzipped response and compression is enabled"""
+    return GZIP_LEVEL > 0 and accepts_gzip(request.headers.get('Accept-Encoding'))
+
+def json_response(payload):
+    """Serialize a response, adding the timings block (ms) when the caller asked for it
+
+    Entries that are not durations (the line_cache hit counts) are passed
+    through as they are.
+    """
+    if (request_option('Timings') or '').lower() in ('1', 'true', 'yes'):
+        timings = {stage: round(value * 1000, 3) if isinstance(value, float) else value
+                   for stage, value in g.timings.items()}
+        timings['total'] = round((time.perf_counter() - g.started) * 1000, 3)
+        payload['timings'] = timings
+    return run_stage('serialize', partial(serialize_json, gzip=wants_gzip()), [payload])[0]
+
 @app.route('/invocations', methods=['POST'])
 def predict():
     """Main inference endpoint"""
     try:
-        # Initialize OCR if needed
+        if not ready.is_set():
+            return error_response('Model is not ready', 503, 'not_ready')
         ocr_instance = init_ocr()
-        if ocr_instance is None:
-            return jsonify({'error': 'PaddleOCR not available'}), 500
+        bypass_cache = (request_option('Cache') or '').lower() == 'bypass'
+        try:
+            options = pipeline_options()
+            output = output_options(options['mode'])
+            g.deadline = request_deadline()
+        except ValueError as e:
+            return error_response(str(e), 400, 'bad_request')
+        g.mode = options['mode']
+        g.screen = (request_option('Screen') or '1').lower() not in ('0', 'false', 'no')
+        # Line crops for rec mode are already small and must keep their height
+        downscale = options['mode'] != 'rec'
         
-        # Input validation and size limits
-        MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB limit
+        # JSON Lines: one {"image": ...} record per line, one result line per record
+        if request.mimetype in JSONLINES_TYPES:
+            g.input_format = 'jsonlines'
+            lines = [line for line in request.get_data().splitlines() if line.strip()]
+            if not lines:
+                return error_response('No image provided', 400, 'bad_request')
+            if len(lines) > MAX_IMAGES_PER_REQUEST:
+                return error_response(f'Too many images (max {MAX_IMAGES_PER_REQUEST})', 400, 'bad_request')
+            items = run_stage('decode', partial(parse_jsonline, downscale=downscale), lines)
+            results = run_items(items, bypass_cache, options, output)
+            return run_stage('serialize', partial(serialize_jsonlines, gzip=wants_gzip()), [results])[0]
         
         # Parse input
-        if request.content_type == 'application/json':
-            data = request.get_json()
-            if not data or 'image' not in data:
-                return jsonify({'error': 'No image provided'}), 400
+        if request.mimetype == 'application/json':
+            with timed('parse'):
+                data = request.get_json(silent=True)
             
-            try:
-                image_data = base64.b64decode(data['image'])
-                if len(image_data) > MAX_IMAGE_SIZE:
-                    return jsonify({'error': 'Image too large (max 10MB)'}), 400
-                image = Image.open(io.BytesIO(image_data))
-            except Exception as e:
-                return jsonify({'error': 'Invalid image data'}), 400
+            # Multi-image request: {"images": [base64, ...]}
+            if isinstance(data, dict) and 'images' in data:
+                g.input_format = 'images'
+                if not isinstance(data['images'], list) or not data['images']:
+                    return error_response('No image provided', 400, 'bad_request')
+                if len(data['images']) > MAX_IMAGES_PER_REQUEST:
+                    return error_response(f'Too many images (max {MAX_IMAGES_PER_REQUEST})', 400, 'bad_request')
+                items = run_stage('decode', partial(decode_base64_image, downscale=downscale), data['images'])
+                results = run_items(items, bypass_cache, options, output)
+                return json_response({
+                    'results': results,
+                    'count': len(results),
+                    'status': 'success',
+                    'gpu_enabled': ocr_instance.use_gpu
+                })
+            
+            g.input_format = 'json'
+            if not isinstance(data, dict) or 'image' not in data:
+                return error_response('No image provided', 400, 'bad_request')
+            
+            # Region request: {"image": base64, "regions": [...]}, one result per region id
+            if 'regions' in data:
+                g.input_format = 'regions'
+                if options['mode'] != 'full':
+                    return error_response('Region requests choose det/rec per region (use mode=full)',
+                                          400, 'bad_request')
+                try:
+                    regions = parse_regions(data['regions'])
+                except ValueError as e:
+                    return error_response(str(e), 400, 'bad_request')
+                crops = run_stage('decode', partial(decode_regions, regions=regions), [data['image']])[0]
+                if isinstance(crops, ImageError):
+                    return error_response(str(crops), 400, 'image')
+                results = ocr_regions(regions, crops, bypass_cache, options, output)
+                return json_response({
+                    'regions': results,
+                    'count': len(results),
+                    'status': 'success',
+                    'gpu_enabled': ocr_instance.use_gpu
+                })
+            decoded = run_stage('decode', partial(decode_base64_image, downscale=downscale), [data['image']])[0]
         else:
-            image_data = request.data
-            if len(image_data) > MAX_IMAGE_SIZE:
-                return jsonify({'error': 'Image too large (max 10MB)'}), 400
+            # Raw image body (application/x-image, image/*): streamed in with the
+            # size cap enforced as it arrives, then decoded without base64/PIL
+            g.input_format = 'raw'
+            is_document = request.mimetype in PDF_TYPES or request.mimetype in TIFF_TYPES
             try:
-                image = Image.open(io.BytesIO(image_data))
-            except Exception as e:
-                return jsonify({'error': 'Invalid image format'}), 400
-        
-        # Validate image dimensions
-        if image.size[0] > 4096 or image.size[1] > 4096:
-            return jsonify({'error': 'Image dimensions too large (max 4096x4096)'}), 400
+                image_data = read_body(request.stream, request.content_length,
+                                       MAX_DOCUMENT_SIZE if is_document else MAX_IMAGE_SIZE)
+            except ImageError as e:
+                return error_response(str(e), 400, 'image')
+            if request.mimetype in PDF_TYPES or (is_document and is_multipage_tiff(image_data)):
+                return document_response(image_data, options, bypass_cache, output)
+            decoded = run_stage('decode', partial(decode_image, downscale=downscale), [image_data])[0]
         
-        # Convert PIL to numpy array safely
-        img_array = np.array(image)
-        if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        elif len(img_array.shape) == 2:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2BGR)
-        else:
-            return jsonify({'error': 'Unsupported image format'}), 400
+        if isinstance(decoded, ImageError):
+            return error_response(str(decoded), 400, 'image')
+        img_array, scale = decoded
         
-        # Run OCR
-        result = ocr_instance.ocr(img_array, det=True, rec=True)
-        
-        # Format results
-        detections = []
-        if result and result[0]:
-            for detection in result[0]:
-                bbox = detection[0]
-                text_info = detection[1]
-                text = text_info[0] if text_info else ""
-                confidence = text_info[1] if text_info else 0.0
-                
-                detections.append({
-                    'bbox': bbox,
-                    'text': text,
-                    'confidence': confidence
-                })
+        # Run OCR through the batch scheduler
+        result = ocr_images([img_array], bypass_cache, options)[0]
+        if isinstance(result, Exception):
+            raise result
         
-        return jsonify({
-            'detections': detections,
-            'count': len(detections),
-            'status': 'success',
-            'gpu_enabled': True
-        })
+        payload = format_result(rescale_boxes(result, scale, options['mode']), options['mode'], output)
+        payload.update(status='success', gpu_enabled=ocr_instance.use_gpu)
+        return json_response(payload)
         
+    except QueueFullError as e:
+        return error_response(str(e), 503, 'busy')
+    except DeadlineExceededError as e:
+        return error_response(str(e), 504, 'expired')
+    except (ModelBudgetError, ReplicaTimeoutError) as e:
+        return error_response(str(e), 503, 'busy')
+    except ModelLoadError as e:
+        return error_response(str(e), 500, 'model_load')
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(str(e), 500, 'internal')
 
 if __name__ == '__main__':
-    # Pre-initialize OCR
-    init_ocr()
-    app.run(host='0.0.0.0', port=8080)
+    if SERVER_MODE == 'gunicorn':
+        # Replace this process with gunicorn; each worker loads the model itself
+        here = os.path.dirname(os.path.abspath(__file__))
+        module = os.path.splitext(os.path.basename(__file__))[0]
+        # Workers measure cold start from the start of this process, not their fork
+        os.environ['OCR_PROCESS_STARTED'] = repr(PROCESS_STARTED)
+        os.execvp('gunicorn', ['gunicorn', '-c', os.path.join(here, 'gunicorn_conf.py'),
+                               '--chdir', here, f'{module}:app'])
+    
+    def start_or_exit():
+        # A bad model store will not fix itself; exit so the platform reports it
+        if not startup() and startup_fatal:
+            os._exit(3)
+    
+    # Load and warm up in the background; /ping returns 503 until done
+    threading.Thread(target=start_or_exit, name='ocr-startup', daemon=True).start()
+    app.run(host='0.0.0.0', port=int(os.environ.get('OCR_PORT', '8080')), threaded=True)
@@ -0,0 +1,398 @@
+"""
+OCR engine backends for the inference server.
+
+Every backend implements the same contract, infer(images) -> one list of
+[bbox, (text, confidence)] per image, by providing three model stages
+(detect, classify, recognize). The shared pipeline in OCRBackend handles
+box sorting, line cropping, tiling of oversized images and batching
+recognition across all images of a call. It can also run a subset of the
+stages (see MODES): detection only, or recognition only on images that
+are already single text lines. With a line cache set, crops recognized
+before skip classification and recognition.
+
+Backends:
+  paddle      PaddleOCR on GPU (default)
+  paddle-cpu  PaddleOCR on CPU with MKLDNN and a configurable intra-op thread count
+  onnx        Exported det/cls/rec ONNX models through PaddleOCR's ONNX Runtime path
+  stub        Deterministic fake engine for tests and offline benchmarks
+"""
+
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from ocr_metrics import REGISTRY
+
+TILES = REGISTRY.counter('ocr_tiles_total', 'Detection tiles run for oversized images')
+
+# Pipeline modes: full OCR, boxes only, or text of pre-cropped line images
+MODES = ('full', 'det', 'rec')
+
+
+@contextmanager
+def _stage(name, timings):
+    """Add the duration of a block to timings[name] if timings is given"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def sort_boxes(dt_boxes):
+    """Sort text boxes top-to-bottom, left-to-right (same order as PaddleOCR)"""
+    boxes = sorted(dt_boxes, key=lambda b: (b[0][1], b[0][0]))
+    for i in range(len(boxes) - 1):
+        for j in range(i, -1, -1):
+            if abs(boxes[j + 1][0][1] - boxes[j][0][1]) < 10 and boxes[j + 1][0][0] < boxes[j][0][0]:
+                boxes[j], boxes[j + 1] = boxes[j + 1], boxes[j]
+            else:
+                break
+    return boxes
+
+
+def quad_transform(points):
+    """Perspective matrix mapping a quad (clockwise from top-left) onto an upright rectangle
+
+    Returns (matrix, width, height) of the rectified rectangle.
+    """
+    points = np.asarray(points, dtype=np.float32)
+    width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    height = int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])))
+    width, height = max(width, 1), max(height, 1)
+    target = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    return cv2.getPerspectiveTransform(points, target), width, height
+
+
+def crop_quad(img, points, rotate_vertical=True):
+    """Perspective-crop a text quad into an upright line image
+
+    Crops at least 1.5 times taller than wide are rotated so the recognizer
+    sees vertical lines horizontally, unless rotate_vertical is False (for
+    regions that are detected again rather than recognized directly).
+    """
+    matrix, width, height = quad_transform(points)
+    crop = cv2.warpPerspective(img, matrix, (width, height),
+                               borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    if rotate_vertical and height / width >= 1.5:
+        crop = np.rot90(crop)
+    return crop
+
+
+def tile_origins(length, tile, overlap):
+    """Start offsets of overlapping tiles covering [0, length)"""
+    if length <= tile:
+        return [0]
+    step = max(1, tile - overlap)
+    origins = list(range(0, length - tile, step))
+    origins.append(length - tile)
+    return origins
+
+
+def merge_tile_boxes(candidates):
+    """Merge boxes detected twice in tile overlaps
+
+    candidates are (quad, tile_index) in global coordinates. Boxes from
+    different tiles that overlap on the same text line are merged: if one
+    essentially contains the other the larger quad is kept, otherwise the
+    two fragments of a line cut by a tile edge are joined into their
+    bounding rectangle.
+    """
+    merged = []  # [quad, rect, tile_indexes]
+    for quad, tile_index in sorted(candidates, key=lambda c: float(c[0][:, 0].min())):
+        rect = (quad[:, 0].min(), quad[:, 1].min(), quad[:, 0].max(), quad[:, 1].max())
+        for entry in merged:
+            if tile_index in entry[2]:
+                continue
+            other = entry[1]
+            ix = min(rect[2], other[2]) - max(rect[0], other[0])
+            iy = min(rect[3], other[3]) - max(rect[1], other[1])
+            if ix <= 0 or iy <= 0:
+                continue
+            min_height = min(rect[3] - rect[1], other[3] - other[1])
+            if iy < 0.6 * min_height:
+                continue
+            area = (rect[2] - rect[0]) * (rect[3] - rect[1])
+            other_area = (other[2] - other[0]) * (other[3] - other[1])
+            if ix * iy >= 0.9 * min(area, other_area):
+                if area > other_area:
+                    entry[0], entry[1] = quad, rect
+            else:
+                union = (min(rect[0], other[0]), min(rect[1], other[1]),
+                         max(rect[2], other[2]), max(rect[3], other[3]))
+                entry[0] = np.array([[union[0], union[1]], [union[2], union[1]],
+                                     [union[2], union[3]], [union[0], union[3]]], dtype=np.float32)
+                entry[1] = union
+            entry[2].add(tile_index)
+            break
+        else:
+            merged.append([quad, rect, {tile_index}])
+    return [entry[0] for entry in merged]
+
+
+class OCRBackend:
+    """Shared OCR pipeline; subclasses implement detect, classify and recognize"""
+
+    name = None
+    use_gpu = False
+    use_angle_cls = False
+    drop_score = 0.5
+
+    # Tiled detection for oversized images, configured by the server
+    tiling = False
+    tile_size = 1536
+    tile_overlap = 192
+
+    # Line recognition cache (result_cache.LineCache), set by the server;
+    # the namespace keeps models that share one cache apart
+    line_cache = None
+    line_cache_namespace = ''
+
+    def detect(self, img):
+        """Return text quads as an (N, 4, 2) array, or None"""
+        raise NotImplementedError
+
+    def classify(self, crops):
+        """Return the line crops, rotated upright where needed"""
+        return crops
+
+    def recognize(self, crops):
+        """Return one (text, confidence) per line crop"""
+        raise NotImplementedError
+
+    def needs_tiling(self, img):
+        return self.tiling and max(img.shape[:2]) > self.tile_size
+
+    def detect_tiled(self, img):
+        """Detect text on overlapping tiles and map the boxes back to image coordinates"""
+        height, width = img.shape[:2]
+        candidates = []
+        tile_index = 0
+        for y in tile_origins(height, self.tile_size, self.tile_overlap):
+            for x in tile_origins(width, self.tile_size, self.tile_overlap):
+                dt_boxes = self.detect(img[y:y + self.tile_size, x:x + self.tile_size])
+                if dt_boxes is not None:
+                    offset = np.array([x, y], dtype=np.float32)
+                    candidates.extend((np.asarray(box, dtype=np.float32) + offset, tile_index)
+                                      for box in dt_boxes)
+                tile_index += 1
+        TILES.inc(tile_index)
+        return merge_tile_boxes(candidates)
+
+    def infer(self, images, timings=None, mode='full', use_cls=True):
+        """Run detection per image, then classification and recognition over all crops at once
+
+        Oversized images are detected tile by tile; their line crops are
+        still cut from the full image. Returns one list of
+        [bbox, (text, confidence)] per input image, the same shape as
+        PaddleOCR.ocr()[0]. Stage durations for the whole call are added to
+        timings if given.
+
+        mode='det' stops after detection and returns one list of boxes per
+        image; mode='rec' treats every image as a line crop (see
+        recognize_lines). use_cls=False skips angle classification even if
+        the backend has it enabled. With a line cache, per-image
+        (hits, lines) counts are appended to timings['line_cache'].
+        """
+        if mode == 'rec':
+            return self.recognize_lines(images, timings, use_cls)
+
+        boxes_per_image = []
+        for img in images:
+            with _stage('detection', timings):
+                dt_boxes = self.detect_tiled(img) if self.needs_tiling(img) else self.detect(img)
+            boxes_per_image.append(sort_boxes(dt_boxes) if dt_boxes is not None else [])
+        if mode == 'det':
+            return [[np.asarray(box).tolist() for box in dt_boxes] for dt_boxes in boxes_per_image]
+
+        crops = []
+        with _stage('crop', timings):
+            for img, dt_boxes in zip(images, boxes_per_image):
+                crops.extend(crop_quad(img, box) for box in dt_boxes)
+
+        rec_res, hits = self.recognize_crops(crops, timings, use_cls)
+        self._count_line_hits(hits, [len(dt_boxes) for dt_boxes in boxes_per_image], timings)
+
+        results = []
+        offset = 0
+        for dt_boxes in boxes_per_image:
+            lines = []
+            for box, (text, score) in zip(dt_boxes, rec_res[offset:offset + len(dt_boxes)]):
+                if score >= self.drop_score:
+                    lines.append([np.asarray(box).tolist(), (text, float(score))])
+            offset += len(dt_boxes)
+            results.append(lines)
+        return results
+
+    def recognize_lines(self, images, timings=None, use_cls=True):
+        """Recognize images that each hold a single text line, in one batch
+
+        Returns one (text, confidence) per image. Nothing is dropped by
+        drop_score; the caller gets the confidence to decide.
+        """
+        if not images:
+            return []
+        rec_res, hits = self.recognize_crops(list(images), timings, use_cls)
+        self._count_line_hits(hits, [1] * len(images), timings)
+        return [(text, float(score)) for text, score in rec_res]
+
+    def recognize_crops(self, crops, timings=None, use_cls=True):
+        """Classify and recognize line crops, answering repeated lines from the line cache
+
+        Returns (one (text, confidence) per crop, a hit flag per crop or
+        None without a cache). Identical crops within the call are
+        recognized once and count as hits after the first.
+        """
+        if self.line_cache is None:
+            return (self._classify_recognize(crops, timings, use_cls) if crops else []), None
+        if not crops:
+            return [], []
+
+        use_cls = bool(self.use_angle_cls and use_cls)
+        namespace = f'{self.line_cache_namespace}:cls={int(use_cls)}'
+        with _stage('line_cache_lookup', timings):
+            keys = [self.line_cache.key(crop, namespace) for crop in crops]
+            rec_res = [self.line_cache.get(key) for key in keys]
+        hits = [res is not None for res in rec_res]
+        pending = {}
+        for i, res in enumerate(rec_res):
+            if res is None:
+                pending.setdefault(keys[i], []).append(i)
+        if pending:
+            firsts = [indexes[0] for indexes in pending.values()]
+            results = self._classify_recognize([crops[i] for i in firsts], timings, use_cls)
+            for (key, indexes), (text, score) in zip(pending.items(), results):
+                res = (text, float(score))
+                self.line_cache.put(key, res)
+                for n, i in enumerate(indexes):
+                    rec_res[i] = res
+                    hits[i] = n > 0
+        return rec_res, hits
+
+    def _classify_recognize(self, crops, timings, use_cls):
+        if self.use_angle_cls and use_cls:
+            with _stage('classification', timings):
+                crops = self.classify(crops)
+        with _stage('recognition', timings):
+            return self.recognize(crops)
+
+    @staticmethod
+    def _count_line_hits(hits, lines_per_image, timings):
+        """Append per-image (cache hits, lines) to timings['line_cache']"""
+        if hits is None or timings is None:
+            return
+        counts = timings.setdefault('line_cache', [])
+        offset = 0
+        for lines in lines_per_image:
+            counts.append((sum(hits[offset:offset + lines]), lines))
+            offset += lines
+
+
+class PaddleBackend(OCRBackend):
+    """PaddleOCR pipeline on GPU"""
+
+    name = 'paddle'
+
+    def __init__(self, use_gpu=True, **settings):
+        started = time.monotonic()
+        from paddleocr import PaddleOCR
+        self.import_seconds = time.monotonic() - started
+        self.use_gpu = use_gpu
+        self.use_angle_cls = settings.get('use_angle_cls', True)
+        self.ocr = PaddleOCR(det=True, rec=True, use_gpu=use_gpu, show_log=False, **settings)
+        self.drop_score = self.ocr.drop_score
+
+    def detect(self, img):
+        dt_boxes, _ = self.ocr.text_detector(img)
+        return dt_boxes
+
+    def classify(self, crops):
+        crops, _, _ = self.ocr.text_classifier(crops)
+        return crops
+
+    def recognize(self, crops):
+        rec_res, _ = self.ocr.text_recognizer(crops)
+        return rec_res
+
+
+class PaddleCPUBackend(PaddleBackend):
+    """PaddleOCR pipeline on CPU with MKLDNN kernels
+
+    cpu_threads sets Paddle Inference's intra-op (math library) thread
+    count per predictor; with several workers keep workers x cpu_threads at
+    or below the number of vCPUs.
+    """
+
+    name = 'paddle-cpu'
+
+    def __init__(self, cpu_threads=4, enable_mkldnn=True, **settings):
+        super().__init__(use_gpu=False, cpu_threads=cpu_threads, enable_mkldnn=enable_mkldnn, **settings)
+
+
+class OnnxBackend(PaddleBackend):
+    """Exported det/cls/rec ONNX models run by ONNX Runtime
+
+    Uses PaddleOCR's use_onnx mode, which keeps its pre/post-processing and
+    swaps the predictors for onnxruntime sessions (CUDA provider when
+    use_gpu, otherwise CPU). The model paths point at .onnx files.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, det_model, rec_model, cls_model=None, use_gpu=False, **settings):
+        if not det_model or not rec_model:
+            raise ValueError('ONNX backend needs det and rec model paths')
+        if settings.get('use_angle_cls', True) and not cls_model:
+            raise ValueError('ONNX backend needs a cls model path when angle classification is on')
+        paths = {'det_model_dir': det_model, 'rec_model_dir': rec_model}
+        if cls_model:
+            paths['cls_model_dir'] = cls_model
+        super().__init__(use_gpu=use_gpu, use_onnx=True, **paths, **settings)
+
+
+class StubBackend(OCRBackend):
+    """Deterministic stand-in for PaddleOCR, used for tests and offline benchmarks
+
+    Reports one text line per 48px band of the image (at most 32) and sleeps
+    det_ms per detection call and rec_ms per recognized line to emulate
+    model time.
+    """
+
+    name = 'stub'
+
+    def __init__(self, det_ms=0.0, rec_ms=0.0, **settings):
+        self.det_seconds = det_ms / 1000.0
+        self.rec_seconds = rec_ms / 1000.0
+
+    def detect(self, img):
+        time.sleep(self.det_seconds)
+        height, width = img.shape[:2]
+        boxes = [[[8, y], [width - 8, y], [width - 8, y + 32], [8, y + 32]]
+                 for y in range(8, height - 32, 48)][:32] if width > 16 else []
+        return np.array(boxes, dtype=np.float32).reshape(-1, 4, 2)
+
+    def recognize(self, crops):
+        time.sleep(self.rec_seconds * len(crops))
+        return [(f'stub {crop.shape[1]}x{crop.shape[0]}', 0.99) for crop in crops]
+
+
+BACKENDS = {
+    'paddle': PaddleBackend,
+    'paddle-cpu': PaddleCPUBackend,
+    'onnx': OnnxBackend,
+    'stub': StubBackend,
+}
+
+
+def create_backend(name, tiling=False, tile_size=1536, tile_overlap=192, **options):
+    """Build the backend registered under name with backend-specific options"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown OCR backend '{name}' (choose from {', '.join(BACKENDS)})")
+    backend = BACKENDS[name](**options)
+    backend.tiling = tiling
+    backend.tile_size = tile_size
+    backend.tile_overlap = tile_overlap
+    return backend
@@ -0,0 +1,248 @@
+"""
+Python client for the PaddleOCR endpoint.
+
+    from ocr_client import OCRClient
+
+    client = OCRClient.for_endpoint('paddleocr-g5-endpoint-xxx', region='us-east-1')
+    result = client.ocr('invoice.jpg')
+    for path, result in zip(paths, client.ocr_many(paths)):
+        print(path, result['count'])
+
+ocr() sends one image as a raw request body (no base64/JSON). ocr_many()
+packs images into {"images": [...]} batch requests under the SageMaker
+payload limit, keeps up to `concurrency` requests in flight over a pooled
+connection set, and yields one result per image in input order. Throttling
+and busy (429/503) responses are retried with exponential backoff and full
+jitter.
+
+The transport is pluggable: for_url() talks HTTP(S) directly to a server, e.g. a local one
+(python inference_gpu.py, with OCR_BACKEND=stub if no GPU) so the client can
+be exercised offline.
+"""
+
+import base64
+import gzip
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# SageMaker real-time invocations accept up to 6MB; leave room for the JSON wrapper
+MAX_PAYLOAD_BYTES = 6 * 1024 * 1024 - 16 * 1024
+RETRY_STATUSES = (429, 503)
+THROTTLING_CODES = ('ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailable')
+
+
+class OCRClientError(Exception):
+    """Raised when a request fails after retries"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class SageMakerTransport:
+    """invoke_endpoint over a boto3 client with a connection pool sized for the fan-out"""
+
+    def __init__(self, endpoint_name, region=None, max_connections=16, timeout=60):
+        import boto3
+        from botocore.config import Config
+        self.endpoint_name = endpoint_name
+        # Retries are done by OCRClient so they use jitter and count per request
+        self.runtime = boto3.client('sagemaker-runtime', region_name=region,
+                                    config=Config(max_pool_connections=max_connections,
+                                                  retries={'max_attempts': 0},
+                                                  connect_timeout=5, read_timeout=timeout))
+
+    def invoke(self, body, content_type, options):
+        """Return (status, response body bytes)"""
+        from botocore.exceptions import ClientError
+        kwargs = {'EndpointName': self.endpoint_name, 'ContentType': content_type, 'Body': body}
+        if options:
+            kwargs['CustomAttributes'] = ';'.join(f'{key}={value}' for key, value in options.items())
+        try:
+            response = self.runtime.invoke_endpoint(**kwargs)
+        except self.runtime.exceptions.ModelError as e:
+            return e.response.get('OriginalStatusCode', 500), e.response.get('OriginalMessage', '').encode()
+        except ClientError as e:
+            error = e.response.get('Error', {})
+            if error.get('Code') in THROTTLING_CODES:
+                return 429, error.get('Message', '').encode()
+            raise OCRClientError(f"{error.get('Code')}: {error.get('Message')}",
+                                 e.response.get('ResponseMetadata', {}).get('HTTPStatusCode'))
+        return 200, response['Body'].read()
+
+
+class HttpTransport:
+    """POSTs to <url>/invocations with one persistent connection per thread
+
+    The URL may carry a path prefix (e.g. behind a reverse proxy) and may be
+    http or https. Responses are requested gzipped; the server compresses
+    large results.
+    """
+
+    def __init__(self, url, timeout=60):
+        parsed = urllib.parse.urlparse(url)
+        if parsed.scheme not in ('http', 'https'):
+            raise ValueError(f'Unsupported URL scheme: {url}')
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = parsed.path.rstrip('/') + '/invocations'
+        self.connection_class = (http.client.HTTPSConnection if parsed.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def invoke(self, body, content_type, options):
+        """Return (status, response body bytes); options become X-OCR-<Name> headers"""
+        headers = {'Content-Type': content_type, 'Accept-Encoding': 'gzip'}
+        headers.update(('X-OCR-' + key.capitalize(), str(value)) for key, value in (options or {}).items())
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self.connection_class(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request('POST', self.path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+            if response.getheader('Content-Encoding') == 'gzip':
+                payload = gzip.decompress(payload)
+            return response.status, payload
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+
+def read_image(image):
+    """Encoded image bytes from bytes, a file path or a binary file object"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    if isinstance(image, (str, os.PathLike)):
+        with open(image, 'rb') as f:
+            return f.read()
+    if hasattr(image, 'read'):
+        return image.read()
+    raise TypeError(f'Unsupported image type: {type(image).__name__}')
+
+
+class OCRClient:
+    """Concurrent, batching OCR client over a pluggable transport"""
+
+    def __init__(self, transport, concurrency=8, batch_size=8, max_payload_bytes=MAX_PAYLOAD_BYTES,
+                 max_retries=5, backoff_base=0.1, backoff_max=5.0):
+        self.transport = transport
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.max_payload_bytes = max_payload_bytes
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix='ocr-client')
+
+    @classmethod
+    def for_endpoint(cls, endpoint_name, region=None, concurrency=8, **kwargs):
+        """Client for a SageMaker endpoint"""
+        transport = SageMakerTransport(endpoint_name, region, max_connections=max(10, concurrency * 2))
+        return cls(transport, concurrency=concurrency, **kwargs)
+
+    @classmethod
+    def for_url(cls, url='http://localhost:8080', concurrency=8, **kwargs):
+        """Client for a server reached directly over HTTP or HTTPS (local or offline testing)"""
+        return cls(HttpTransport(url), concurrency=concurrency, **kwargs)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def ocr(self, image, **options):
+        """OCR one image and return the response dict; raises OCRClientError on failure
+
+        options are per-request server options such as mode='det', cls=0,
+        timings=1, format='columnar' or fields='text+confidence'.
+        """
+        return self._request(read_image(image), 'application/x-image', options)
+
+    def ocr_many(self, images, **options):
+        """OCR an iterable of images, yielding one result dict per image in input order
+
+        Images are read and packed lazily, so the iterable can be a
+        generator over a large directory. Each result is a per-image dict
+        with 'status' ('success' or 'error'); a failed batch request
+        yields an error result for each of its images instead of raising.
+        If the caller stops iterating early, batches not yet sent are
+        cancelled (requests already in flight still complete).
+        """
+        window = deque()
+        try:
+            for batch in self._pack(images):
+                window.append((len(batch), self._executor.submit(self._send_batch, batch, options)))
+                # Keep every worker busy plus one batch queued each; bounds memory too
+                while len(window) >= self.concurrency * 2:
+                    yield from self._results(*window.popleft())
+            while window:
+                yield from self._results(*window.popleft())
+        finally:
+            for _, future in window:
+                future.cancel()
+
+    def _pack(self, images):
+        """Group images into batches under batch_size and the payload limit (base64 size)"""
+        batch, size = [], 0
+        for image in images:
+            data = read_image(image)
+            encoded_size = (len(data) + 2) // 3 * 4 + 3
+            if batch and (len(batch) >= self.batch_size or size + encoded_size > self.max_payload_bytes):
+                yield batch
+                batch, size = [], 0
+            batch.append(data)
+            size += encoded_size
+        if batch:
+            yield batch
+
+    def _send_batch(self, batch, options):
+        if len(batch) == 1:
+            # A lone image goes as a raw body: 25% smaller and no JSON parse on the server
+            result = self._request(batch[0], 'application/x-image', options)
+            result.pop('gpu_enabled', None)
+            return [result]
+        # base64 needs no JSON escaping, so the body is assembled without json.dumps;
+        # encoding happens here, on the fan-out threads
+        body = b'{"images":["' + b'","'.join(base64.b64encode(data) for data in batch) + b'"]}'
+        return self._request(body, 'application/json', options)['results']
+
+    @staticmethod
+    def _results(count, future):
+        try:
+            return future.result()
+        except Exception as e:
+            return [{'error': str(e), 'status': 'error'} for _ in range(count)]
+
+    def _request(self, body, content_type, options):
+        """Send one request, retrying throttling and busy responses with jittered backoff"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                status, payload = self.transport.invoke(body, content_type, options)
+            except (OSError, http.client.HTTPException) as e:
+                status, payload = None, str(e).encode()
+            if status == 200:
+                return json.loads(payload)
+            if (status is None or status in RETRY_STATUSES) and attempt < self.max_retries:
+                # Full jitter: spreads retries from concurrent callers apart
+                time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+                continue
+            break
+        try:
+            message = json.loads(payload).get('error', '')
+        except (ValueError, AttributeError):
+            message = payload.decode(errors='replace')
+        raise OCRClientError(f'Request failed ({status}): {message}', status)
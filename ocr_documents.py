@@ -0,0 +1,150 @@
+"""
+Multi-page document sources for the inference server.
+
+PDFs are rasterized with PyMuPDF (installed as a PaddleOCR dependency) and
+multi-frame TIFFs are read with PIL. Both open the document once and
+produce pages one at a time on request, so only the pages being worked on
+are ever held in memory. Documents are not thread-safe: render pages of
+one document from one thread at a time. PyMuPDF is not thread-safe across
+documents either, so every call into it holds one module-level lock.
+"""
+
+import io
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+PDF_TYPES = ('application/pdf', 'application/x-pdf')
+TIFF_TYPES = ('image/tiff', 'image/tif', 'image/x-tiff')
+
+# Serializes all PyMuPDF calls: the decode pool renders pages of several
+# documents at once and MuPDF's global context is not safe to share
+_pymupdf_lock = threading.Lock()
+
+
+class DocumentError(Exception):
+    """Raised when a document cannot be opened"""
+
+
+class PdfDocument:
+    """PDF rasterized page by page at a given DPI"""
+
+    kind = 'pdf'
+
+    def __init__(self, data, dpi):
+        try:
+            import pymupdf
+        except ImportError:
+            try:
+                import fitz as pymupdf
+            except ImportError:
+                raise DocumentError('PDF support requires PyMuPDF')
+        self._pymupdf = pymupdf
+        self.dpi = dpi
+        with _pymupdf_lock:
+            try:
+                self._doc = pymupdf.open(stream=data, filetype='pdf')
+            except Exception:
+                raise DocumentError('Invalid PDF document')
+            encrypted = self._doc.needs_pass
+            self.page_count = self._doc.page_count
+        if encrypted:
+            self.close()
+            raise DocumentError('Encrypted PDF documents are not supported')
+
+    def page_size(self, index):
+        """Pixel size of the page at the document DPI"""
+        with _pymupdf_lock:
+            rect = self._doc.load_page(index).rect
+        zoom = self.dpi / 72.0
+        return max(1, round(rect.width * zoom)), max(1, round(rect.height * zoom))
+
+    def render(self, index, size):
+        """Rasterize the page directly at size (width, height) as a BGR array"""
+        with _pymupdf_lock:
+            page = self._doc.load_page(index)
+            matrix = self._pymupdf.Matrix(size[0] / page.rect.width, size[1] / page.rect.height)
+            pix = page.get_pixmap(matrix=matrix, alpha=False)
+            samples = pix.samples
+        img = np.frombuffer(samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        if pix.n == 1:
+            return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+
+    def close(self):
+        with _pymupdf_lock:
+            self._doc.close()
+
+
+class TiffDocument:
+    """Multi-frame TIFF decoded frame by frame"""
+
+    kind = 'tiff'
+
+    def __init__(self, data):
+        try:
+            self._image = Image.open(io.BytesIO(data))
+            self.page_count = getattr(self._image, 'n_frames', 1)
+        except Exception:
+            raise DocumentError('Invalid TIFF document')
+
+    def page_size(self, index):
+        self._image.seek(index)
+        return self._image.size
+
+    def render(self, index, size):
+        """Decode one frame as a BGR array, resized to size if it differs"""
+        self._image.seek(index)
+        frame = self._image
+        if frame.mode.startswith('I') or frame.mode == 'F':
+            img = _gray8(frame)
+        else:
+            if frame.mode not in ('RGB', 'L'):
+                frame = frame.convert('L' if frame.mode == '1' else 'RGB')
+            img = np.asarray(frame)
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        else:
+            img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        if (img.shape[1], img.shape[0]) != tuple(size):
+            img = cv2.resize(img, tuple(size), interpolation=cv2.INTER_AREA)
+        return img
+
+    def close(self):
+        self._image.close()
+
+
+def _gray8(frame):
+    """Scale a 16-bit, 32-bit or float grayscale frame to 8 bits
+
+    convert('L') clips these modes at 255 instead of scaling them, which
+    turns most of a 16-bit scan white.
+    """
+    img = np.asarray(frame, dtype=np.float32)
+    peak = float(img.max()) if img.size else 0.0
+    if frame.mode.startswith('I;16'):
+        depth = 65535.0
+    elif frame.mode == 'F':
+        depth = 1.0 if peak <= 1.0 else peak
+    else:
+        # 'I' frames usually hold 8- or 16-bit samples widened to 32 bits
+        depth = 255.0 if peak <= 255 else 65535.0 if peak <= 65535 else peak
+    return np.clip(img * (255.0 / depth), 0, 255).astype(np.uint8)
+
+
+def is_multipage_tiff(data):
+    """True if data is a TIFF with more than one frame"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format == 'TIFF' and getattr(image, 'n_frames', 1) > 1
+    except Exception:
+        return False
+
+
+def open_document(data, mimetype, dpi):
+    """Open a PDF or TIFF body as a page source"""
+    if mimetype in PDF_TYPES:
+        return PdfDocument(data, dpi)
+    return TiffDocument(data)
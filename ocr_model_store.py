@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Local store of PaddleOCR inference models.
+
+PaddleOCR downloads the det, rec and cls weights for a language and model
+version into ~/.paddleocr on first use. The server instead reads them
+from a store directory, baked into the image at build time or extracted
+by SageMaker from the model's ModelDataUrl into /opt/ml/model, so a new
+instance starts without network access and without download time.
+
+A store holds one directory per model part and a manifest.json:
+
+  {"version": 1,
+   "models": {"ch:PP-OCRv4": {"det": "det/ch_PP-OCRv4_det_infer",
+                              "rec": "rec/ch_PP-OCRv4_rec_infer",
+                              "cls": "cls/ch_ppocr_mobile_v2.0_cls_infer"}},
+   "files": {"det/ch_PP-OCRv4_det_infer/inference.pdmodel": {"sha256": "...", "size": 166287}, ...}}
+
+Every file of a model is checked against its size and SHA-256 before the
+model is loaded; a missing or changed file raises ModelStoreError.
+
+Usage (at image build time, with network access):
+  python3 ocr_model_store.py build /opt/ml/code/models --models ch:PP-OCRv4,en:PP-OCRv4
+  python3 ocr_model_store.py verify /opt/ml/code/models
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 1
+PARTS = ('det', 'rec', 'cls')
+DEFAULT_VERSION = 'PP-OCRv4'
+
+# Where a store is looked for when OCR_MODEL_STORE is not set: the model
+# artifact SageMaker extracts from ModelDataUrl first, so models can be
+# replaced without rebuilding the image, then the store baked into the image
+DEFAULT_LOCATIONS = ('/opt/ml/model', '/opt/ml/code/models')
+
+
+class ModelStoreError(Exception):
+    """Raised when the model store is missing, incomplete or does not match its manifest"""
+
+
+def model_key(lang, version):
+    return f'{lang}:{version}'
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """Model directories of a store, verified against its manifest on first use"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        path = os.path.join(self.root, MANIFEST)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except OSError as e:
+            raise ModelStoreError(f'Cannot read {path}: {e}')
+        except ValueError as e:
+            raise ModelStoreError(f'Invalid manifest {path}: {e}')
+        if manifest.get('version') != MANIFEST_VERSION:
+            raise ModelStoreError(f"Unsupported manifest version {manifest.get('version')!r} in {path}")
+        self.models = manifest.get('models', {})
+        self.files = manifest.get('files', {})
+        self._verified = set()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.models
+
+    def verify(self, lang, version):
+        """Check the files of a model against the manifest; returns the seconds taken
+
+        Raises ModelStoreError naming every missing or mismatched file.
+        """
+        key = model_key(lang, version)
+        if key not in self.models:
+            raise ModelStoreError(f"Model {key} is not in the model store {self.root} "
+                                  f"(it has {', '.join(sorted(self.models)) or 'no models'})")
+        with self._lock:
+            if key in self._verified:
+                return 0.0
+            started = time.monotonic()
+            problems = []
+            for part in PARTS:
+                directory = self.models[key].get(part)
+                if directory is None:
+                    problems.append(f'no {part} model')
+                    continue
+                names = [name for name in self.files if name.startswith(directory + '/')]
+                if not names:
+                    problems.append(f'no files listed for {directory}')
+                for name in names:
+                    problems.extend(self._check_file(name))
+            if problems:
+                raise ModelStoreError(f"Model {key} in {self.root} does not match the manifest: "
+                                      + '; '.join(problems))
+            self._verified.add(key)
+            return time.monotonic() - started
+
+    def _check_file(self, name):
+        expected = self.files[name]
+        path = os.path.join(self.root, name)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return [f'{name} is missing']
+        if size != expected['size']:
+            return [f"{name} has {size} bytes, expected {expected['size']}"]
+        if file_digest(path) != expected['sha256']:
+            return [f'{name} checksum mismatch']
+        return []
+
+    def model_dirs(self, lang, version):
+        """PaddleOCR det/rec/cls_model_dir options for a verified model"""
+        self.verify(lang, version)
+        dirs = self.models[model_key(lang, version)]
+        return {f'{part}_model_dir': os.path.join(self.root, dirs[part]) for part in PARTS}
+
+
+def find_store(path='', locations=DEFAULT_LOCATIONS):
+    """The store at path, or at the first default location with a manifest
+
+    Returns None if path is 'none', or if it is empty and no default
+    location has a store; raises ModelStoreError if an explicit path has
+    no valid store.
+    """
+    if path == 'none':
+        return None
+    if path:
+        return ModelStore(path)
+    for location in locations:
+        if os.path.isfile(os.path.join(location, MANIFEST)):
+            return ModelStore(location)
+    return None
+
+
+def write_manifest(root, models):
+    """Checksum the files of the given models and write the store manifest"""
+    files = {}
+    for dirs in models.values():
+        for directory in dirs.values():
+            for dirpath, _, names in os.walk(os.path.join(root, directory)):
+                for name in sorted(names):
+                    path = os.path.join(dirpath, name)
+                    files[os.path.relpath(path, root)] = {'sha256': file_digest(path),
+                                                          'size': os.path.getsize(path)}
+    manifest = {'version': MANIFEST_VERSION, 'models': models, 'files': dict(sorted(files.items()))}
+    with open(os.path.join(root, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def build(root, models):
+    """Download the det/rec/cls models for each 'lang:version' into the store
+
+    Uses PaddleOCR's own model table and downloader, so the store holds
+    exactly the weights PaddleOCR would have fetched. Parts shared between
+    models (the det model of languages using the same script, the cls
+    model) are stored once.
+    """
+    from paddleocr.paddleocr import get_model_config, parse_lang
+    from ppocr.utils.network import maybe_download
+
+    entries = {}
+    for model in models:
+        lang, _, version = model.partition(':')
+        version = version or DEFAULT_VERSION
+        rec_lang, det_lang = parse_lang(lang)
+        entry = {}
+        for part, part_lang in (('det', det_lang), ('rec', rec_lang), ('cls', 'ch')):
+            url = get_model_config('OCR', version, part, part_lang)['url']
+            directory = f"{part}/{os.path.basename(url)[:-len('.tar')]}"
+            maybe_download(os.path.join(root, directory), url)
+            entry[part] = directory
+        entries[model_key(lang, version)] = entry
+    return write_manifest(root, entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or verify a local PaddleOCR model store')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='Download models into a store and write its manifest')
+    build_parser.add_argument('root')
+    build_parser.add_argument('--models', default='ch:PP-OCRv4',
+                              help='Comma-separated lang:version list (default: ch:PP-OCRv4)')
+    verify_parser = commands.add_parser('verify', help='Check every model of a store against its manifest')
+    verify_parser.add_argument('root')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        os.makedirs(args.root, exist_ok=True)
+        models = [model.strip() for model in args.models.split(',') if model.strip()]
+        manifest = build(args.root, models)
+        size = sum(entry['size'] for entry in manifest['files'].values())
+        print(f"Stored {', '.join(manifest['models'])}: {len(manifest['files'])} files, "
+              f"{size / 1024 / 1024:.1f} MB in {args.root}")
+        return
+
+    try:
+        store = ModelStore(args.root)
+        for key in store.models:
+            lang, _, version = key.partition(':')
+            print(f'{key}: ok ({store.verify(lang, version):.2f}s)')
+    except ModelStoreError as e:
+        sys.exit(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+"""
+Pool of OCR pipelines keyed by language and model version.
+
+Pipelines are built on first use by a factory and kept in an LRU. Loading
+is deduplicated: concurrent requests for a model that is still loading
+wait for the one load in progress. Loads run one at a time, so the memory
+a model takes can be measured as the growth in the GPU memory NVML reports
+for the process (process RSS on CPU) across its load; a load that cannot
+be measured counts as default_model_bytes, an estimate. Before a load,
+least recently used models are evicted until the expected size fits the
+memory budget and the model count limit. Models that are resident (the default and
+preloaded ones) or in use by queued requests are never evicted.
+
+Per-model hits, misses, loads and load times are exported as metrics and
+returned by stats(), to decide which languages are worth preloading.
+
+A model can be loaded as several independent replicas (ReplicaPool), so
+batches for the same model run concurrently: PaddleOCR predictors are not
+safe to call from two threads at once, separate copies are.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from ocr_metrics import REGISTRY
+
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+MODEL_REQUESTS = REGISTRY.counter(
+    'ocr_model_requests_total', 'Requests per model, by result (hit: already loaded, miss: loaded or waited for a load)')
+MODEL_LOAD_SECONDS = REGISTRY.histogram(
+    'ocr_model_load_seconds', 'Model load time including warmup',
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0))
+MODEL_EVICTIONS = REGISTRY.counter('ocr_model_evictions_total', 'Models evicted from the pool')
+MODEL_MEMORY = REGISTRY.gauge('ocr_model_memory_bytes', 'Measured memory per loaded model (0 once evicted)')
+REPLICA_BUSY_SECONDS = REGISTRY.counter(
+    'ocr_replica_busy_seconds_total', 'Time each model replica spent running batches (rate = utilization)')
+REPLICA_WAIT = REGISTRY.histogram(
+    'ocr_replica_wait_seconds', 'Time a batch waited to check out a model replica',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+REPLICAS_BUSY = REGISTRY.gauge('ocr_replicas_busy', 'Model replicas currently checked out')
+
+# Default assumed size of a model whose load could not be measured (no
+# NVML, or memory reused from an evicted model): roughly a PP-OCR det + rec
+# + cls predictor set with its GPU workspace
+DEFAULT_MODEL_BYTES = 512 * 1024 * 1024
+
+# A failed load is not retried for this long; requests fail fast instead
+FAILED_LOAD_RETRY_SECONDS = 60
+
+
+class ModelLoadError(Exception):
+    """Raised when a model cannot be loaded"""
+
+
+class ModelBudgetError(ModelLoadError):
+    """Raised when a model does not fit the budget because every loaded model is in use"""
+
+
+class ReplicaTimeoutError(Exception):
+    """Raised when no replica of a model becomes free within the wait timeout"""
+
+
+def memory_in_use(gpu):
+    """(bytes used by this process, bytes used on all GPUs) for measuring a load
+
+    On GPU both come from NVML, which sees everything the process holds on
+    the device (CUDA context, Paddle Inference predictors and their
+    workspaces) where Paddle's allocator statistics do not. NVML lists
+    processes by host PID, so inside a container without the host PID
+    namespace this process is never found and the first value is None.
+    Without NVML both are None. On CPU the first value is the resident
+    set size and the second is None.
+    """
+    if gpu:
+        if pynvml is None:
+            return None, None
+        try:
+            pynvml.nvmlInit()
+            pid, process, device = os.getpid(), None, 0
+            for index in range(pynvml.nvmlDeviceGetCount()):
+                handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+                device += pynvml.nvmlDeviceGetMemoryInfo(handle).used
+                for proc in pynvml.nvmlDeviceGetComputeRunningProcesses(handle):
+                    if proc.pid == pid:
+                        process = (process or 0) + (proc.usedGpuMemory or 0)
+            return process, device
+        except pynvml.NVMLError:
+            return None, None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'), None
+    except (OSError, ValueError, IndexError):
+        return None, None
+
+
+def memory_growth(before, after):
+    """Bytes a load added between two memory_in_use() readings, or None if unknown
+
+    A process that NVML did not list before the load held no GPU memory
+    yet. When it is not listed after the load either, the growth of the
+    devices as a whole is used, which also counts other processes (e.g.
+    other gunicorn workers) loading at the same time.
+    """
+    if after[0] is not None:
+        return after[0] - (before[0] or 0)
+    if after[1] is not None and before[1] is not None:
+        return after[1] - before[1]
+    return None
+
+
+def model_name(key):
+    """Metric label for a (lang, version) key"""
+    lang, version = key
+    return f'{lang}:{version}' if version else lang
+
+
+class _ModelStats:
+    __slots__ = ('hits', 'misses', 'loads', 'load_seconds', 'last_load_seconds', 'evictions',
+                 'memory_bytes', 'memory_estimated', 'last_used', 'error')
+
+    def __init__(self):
+        self.hits = self.misses = self.loads = self.evictions = 0
+        self.load_seconds = self.last_load_seconds = 0.0
+        self.memory_bytes = 0
+        self.memory_estimated = False
+        self.last_used = None
+        self.error = None  # (monotonic time, message) of the last failed load
+
+
+class ModelPool:
+    """LRU of OCR pipelines under a memory budget, loaded lazily by factory(lang, version)"""
+
+    def __init__(self, factory, budget_bytes=0, max_models=0, gpu=False, default_model_bytes=DEFAULT_MODEL_BYTES):
+        self.factory = factory
+        self.budget_bytes = budget_bytes
+        self.max_models = max_models
+        self.gpu = gpu
+        self.default_model_bytes = default_model_bytes
+        self._models = OrderedDict()  # key -> backend, least recently used first
+        self._loading = {}  # key -> Future of the load in progress
+        self._in_use = {}  # key -> requests holding the model
+        self._resident = set()
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def get(self, lang, version, resident=False, record=True):
+        """Return the model for (lang, version), loading it if needed
+
+        resident models are never evicted. record=False leaves the lookup
+        out of the hit/miss statistics (for lookups of a model a request
+        has already acquired). Raises ModelLoadError if the load fails or
+        recently failed, and ModelBudgetError if it cannot be made to fit
+        the budget.
+        """
+        key = (lang, version)
+        with self._lock:
+            stats = self._stats.setdefault(key, _ModelStats())
+            stats.last_used = time.time()
+            if key in self._models:
+                self._models.move_to_end(key)
+                if record:
+                    stats.hits += 1
+                    MODEL_REQUESTS.inc(model=model_name(key), result='hit')
+                if resident:
+                    self._resident.add(key)
+                return self._models[key]
+            if record:
+                stats.misses += 1
+                MODEL_REQUESTS.inc(model=model_name(key), result='miss')
+            if stats.error is not None and time.monotonic() - stats.error[0] < FAILED_LOAD_RETRY_SECONDS:
+                raise ModelLoadError(stats.error[1])
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = self._loading[key] = Future()
+        if not owner:
+            backend = future.result()
+            if resident:
+                with self._lock:
+                    if key in self._models:
+                        self._resident.add(key)
+            return backend
+
+        try:
+            backend = self._load(key, stats, resident)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+        future.set_result(backend)
+        return backend
+
+    def acquire(self, lang, version):
+        """get() and mark the model in use so it is not evicted until release()"""
+        key = (lang, version)
+        with self._lock:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            return self.get(lang, version)
+        except Exception:
+            self.release(lang, version)
+            raise
+
+    def release(self, lang, version):
+        key = (lang, version)
+        with self._lock:
+            self._in_use[key] -= 1
+            if not self._in_use[key]:
+                del self._in_use[key]
+
+    @contextmanager
+    def use(self, lang, version):
+        """Hold a model for the duration of a block (e.g. while its request is queued)"""
+        backend = self.acquire(lang, version)
+        try:
+            yield backend
+        finally:
+            self.release(lang, version)
+
+    def _load(self, key, stats, resident=False):
+        """Evict to make room, then build the model and measure its size"""
+        with self._load_lock:
+            self._make_room(key)
+            before = memory_in_use(self.gpu)
+            started = time.monotonic()
+            try:
+                backend = self.factory(*key)
+            except Exception as e:
+                message = f'Failed to load model {model_name(key)}: {e}'
+                with self._lock:
+                    stats.error = (time.monotonic(), message)
+                raise ModelLoadError(message)
+            elapsed = time.monotonic() - started
+            size = memory_growth(before, memory_in_use(self.gpu))
+        MODEL_LOAD_SECONDS.observe(elapsed, model=model_name(key))
+        with self._lock:
+            stats.loads += 1
+            stats.load_seconds += elapsed
+            stats.last_load_seconds = elapsed
+            if size is not None and size > 0:
+                stats.memory_bytes, stats.memory_estimated = size, False
+            elif not stats.memory_bytes:
+                stats.memory_bytes, stats.memory_estimated = self.default_model_bytes, True
+            stats.error = None
+            MODEL_MEMORY.set(stats.memory_bytes, model=model_name(key))
+            self._models[key] = backend
+            if resident:
+                self._resident.add(key)
+        print(f"Loaded model {model_name(key)} in {elapsed:.1f}s ({stats.memory_bytes / 2**20:.0f}MB"
+              f"{' estimated' if stats.memory_estimated else ''})")
+        return backend
+
+    def _expected_bytes(self, key):
+        """Size of key from a previous load, else the mean of the measured models"""
+        stats = self._stats.get(key)
+        if stats is not None and stats.memory_bytes:
+            return stats.memory_bytes
+        sizes = [s.memory_bytes for s in self._stats.values() if s.memory_bytes]
+        return sum(sizes) // len(sizes) if sizes else self.default_model_bytes
+
+    def _make_room(self, key):
+        with self._lock:
+            expected = self._expected_bytes(key)
+            while True:
+                used = sum(self._stats[k].memory_bytes for k in self._models)
+                over_budget = self.budget_bytes and used + expected > self.budget_bytes
+                over_count = self.max_models and len(self._models) >= self.max_models
+                if not (over_budget or over_count):
+                    return
+                victim = next((k for k in self._models
+                               if k not in self._resident and k not in self._in_use), None)
+                if victim is None:
+                    raise ModelBudgetError(f'No room to load model {model_name(key)}: '
+                                           'all loaded models are resident or in use')
+                del self._models[victim]
+                self._stats[victim].evictions += 1
+                MODEL_EVICTIONS.inc(model=model_name(victim))
+                MODEL_MEMORY.set(0, model=model_name(victim))
+                print(f"Evicted model {model_name(victim)}")
+
+    def stats(self):
+        """Per-model load and hit statistics, most recently used first"""
+        with self._lock:
+            report = []
+            for key, stats in self._stats.items():
+                requests = stats.hits + stats.misses
+                report.append({
+                    'model': model_name(key),
+                    'lang': key[0],
+                    'version': key[1],
+                    'loaded': key in self._models,
+                    'resident': key in self._resident,
+                    'in_use': self._in_use.get(key, 0),
+                    'requests': requests,
+                    'hit_rate': stats.hits / requests if requests else None,
+                    'loads': stats.loads,
+                    'evictions': stats.evictions,
+                    'mean_load_seconds': stats.load_seconds / stats.loads if stats.loads else None,
+                    'last_load_seconds': stats.last_load_seconds,
+                    'memory_bytes': stats.memory_bytes if key in self._models else 0,
+                    'memory_estimated': stats.memory_estimated,
+                    'replicas': self._models[key].stats() if isinstance(self._models.get(key), ReplicaPool) else None,
+                    'last_used': stats.last_used,
+                    'error': stats.error[1] if stats.error else None,
+                })
+            report.sort(key=lambda entry: entry['last_used'] or 0, reverse=True)
+            return {'models': report, 'loaded': len(self._models),
+                    'memory_bytes': sum(self._stats[k].memory_bytes for k in self._models),
+                    'budget_bytes': self.budget_bytes, 'max_models': self.max_models}
+
+
+class ReplicaPool:
+    """Independent copies of one pipeline, each used by one thread at a time
+
+    Stands in for a single backend: infer() checks out a free replica,
+    waiting up to timeout seconds (None waits forever) and raising
+    ReplicaTimeoutError after that, runs the batch on it and checks it back
+    in. Busy time, batches and images are counted per replica.
+    """
+
+    def __init__(self, replicas, name='', timeout=None):
+        self.replicas = list(replicas)
+        if not self.replicas:
+            raise ValueError('a replica pool needs at least one replica')
+        self.label = name
+        self.timeout = timeout
+        self._idle = list(range(len(self.replicas)))
+        self._busy = set()
+        self._batches = [0] * len(self.replicas)
+        self._images = [0] * len(self.replicas)
+        self._busy_seconds = [0.0] * len(self.replicas)
+        self._created = time.monotonic()
+        self._cond = threading.Condition()
+
+    # Backend attributes read by the server, from the first replica
+    @property
+    def name(self):
+        return self.replicas[0].name
+
+    @property
+    def use_gpu(self):
+        return self.replicas[0].use_gpu
+
+    @property
+    def import_seconds(self):
+        return getattr(self.replicas[0], 'import_seconds', 0.0)
+
+    @property
+    def line_cache(self):
+        return getattr(self.replicas[0], 'line_cache', None)
+
+    @line_cache.setter
+    def line_cache(self, cache):
+        for replica in self.replicas:
+            replica.line_cache = cache
+
+    def checkout(self, timeout=None):
+        """Index of a free replica, marked busy until checkin(index)
+
+        timeout defaults to the pool's; raises ReplicaTimeoutError if no
+        replica becomes free in time.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._cond:
+            while not self._idle:
+                remaining = None if timeout is None else started + timeout - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    REPLICA_WAIT.observe(time.monotonic() - started, model=self.label)
+                    raise ReplicaTimeoutError(f'No free replica of model {self.label} '
+                                              f'after {timeout * 1000:.0f}ms ({len(self.replicas)} busy)')
+                self._cond.wait(remaining)
+            index = self._idle.pop()
+            self._busy.add(index)
+            REPLICAS_BUSY.set(len(self._busy), model=self.label)
+        REPLICA_WAIT.observe(time.monotonic() - started, model=self.label)
+        return index
+
+    def checkin(self, index):
+        with self._cond:
+            self._busy.discard(index)
+            self._idle.append(index)
+            REPLICAS_BUSY.set(len(self._busy), model=self.label)
+            self._cond.notify()
+
+    @contextmanager
+    def replica(self, timeout=None):
+        """Hold a free replica for the duration of a block"""
+        index = self.checkout(timeout)
+        try:
+            yield self.replicas[index]
+        finally:
+            self.checkin(index)
+
+    def infer(self, images, timings=None, **options):
+        index = self.checkout()
+        started = time.monotonic()
+        try:
+            return self.replicas[index].infer(images, timings, **options)
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._batches[index] += 1
+                self._images[index] += len(images)
+                self._busy_seconds[index] += elapsed
+            REPLICA_BUSY_SECONDS.inc(elapsed, model=self.label, replica=str(index))
+            self.checkin(index)
+
+    def stats(self):
+        """Per-replica batches, images, busy time and utilization since the pool was built"""
+        lifetime = max(1e-9, time.monotonic() - self._created)
+        with self._cond:
+            return [{'replica': index, 'busy': index in self._busy, 'batches': self._batches[index],
+                     'images': self._images[index], 'busy_seconds': self._busy_seconds[index],
+                     'utilization': self._busy_seconds[index] / lifetime}
+                    for index in range(len(self.replicas))]
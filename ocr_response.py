@@ -0,0 +1,138 @@
+"""
+Response encoding for the inference server.
+
+Results are encoded with orjson when it is installed (several times
+faster than the json module on result lists with hundreds of lines) and
+with the json module otherwise; both write UTF-8 without escaping and
+without whitespace. Callers can shrink a response further:
+
+  fields     keep only some of bbox, text and confidence
+  coords     'int' rounds box coordinates to whole pixels
+  format     'columnar' returns flat arrays instead of one object per line:
+             {"boxes": [x1, y1, ..., x4, y4, x1, ...], "texts": [...],
+              "confidences": [...], "count": n}, 8 numbers per box
+
+and gzip is applied when the client sends Accept-Encoding: gzip and the
+body is large enough for compression to pay off.
+"""
+
+import gzip
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FIELDS = ('bbox', 'text', 'confidence')
+FORMATS = ('objects', 'columnar')
+COORDS = ('float', 'int')
+COLUMNS = {'bbox': 'boxes', 'text': 'texts', 'confidence': 'confidences'}
+# Fields each pipeline mode produces: det returns boxes only, rec the text of a pre-cropped line
+MODE_FIELDS = {'full': FIELDS, 'det': ('bbox',), 'rec': ('text', 'confidence')}
+
+
+class OutputOptions:
+    """How result lines are laid out in a response"""
+
+    __slots__ = ('fields', 'format', 'coords')
+
+    def __init__(self, fields=FIELDS, format='objects', coords='float'):
+        self.fields = tuple(fields)
+        self.format = format
+        self.coords = coords
+
+
+DEFAULT_OUTPUT = OutputOptions()
+
+
+def parse_output(fields=None, format=None, coords=None, mode='full'):
+    """OutputOptions from the Fields, Format and Coords option values
+
+    Fields is a list separated by ',' or '+' ('+' survives SageMaker
+    CustomAttributes, which use ',' between attributes). Raises ValueError
+    for an unknown value, or for a field the pipeline mode does not
+    produce (e.g. text in det mode).
+    """
+    selected = FIELDS
+    if fields:
+        selected = tuple(name.strip().lower() for name in fields.replace('+', ',').split(',') if name.strip())
+        unknown = [name for name in selected if name not in FIELDS]
+        if unknown or not selected:
+            raise ValueError(f"Unknown field '{','.join(unknown)}' (choose from {', '.join(FIELDS)})")
+        available = MODE_FIELDS.get(mode, FIELDS)
+        missing = [name for name in selected if name not in available]
+        if missing:
+            raise ValueError(f"Field '{','.join(missing)}' is not available in mode '{mode}' "
+                             f"(choose from {', '.join(available)})")
+    format = (format or 'objects').lower()
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format '{format}' (choose from {', '.join(FORMATS)})")
+    coords = (coords or 'float').lower()
+    if coords not in COORDS:
+        raise ValueError(f"Unknown coords '{coords}' (choose from {', '.join(COORDS)})")
+    if selected == FIELDS and format == 'objects' and coords == 'float':
+        return DEFAULT_OUTPUT
+    return OutputOptions(selected, format, coords)
+
+
+def _int_boxes(bboxes):
+    """Boxes rounded to whole pixels, as nested lists of ints"""
+    if not bboxes:
+        return []
+    return np.rint(np.asarray(bboxes, dtype=np.float64)).astype(np.int64).tolist()
+
+
+def format_lines(bboxes, texts, confidences, output=DEFAULT_OUTPUT):
+    """Detections for parallel lists of boxes, texts and confidences
+
+    texts and confidences are None for det-mode results, which only have
+    boxes. Returns the detections list ('objects') or the dict of columns
+    ('columnar').
+    """
+    columns = {'bbox': bboxes, 'text': texts, 'confidence': confidences}
+    fields = [name for name in output.fields if columns[name] is not None]
+    if output.format == 'columnar':
+        formatted = {}
+        for name in fields:
+            if name == 'bbox':
+                boxes = np.asarray(bboxes, dtype=np.float64).ravel()
+                formatted['boxes'] = (np.rint(boxes).astype(np.int64) if output.coords == 'int' else boxes).tolist()
+            else:
+                formatted[COLUMNS[name]] = columns[name]
+        return formatted
+    if output.coords == 'int' and 'bbox' in fields:
+        columns['bbox'] = _int_boxes(bboxes)
+    return [{name: columns[name][i] for name in fields} for i in range(len(bboxes))]
+
+
+def dumps(payload):
+    """Encode a response payload as compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def accepts_gzip(accept_encoding):
+    """True if an Accept-Encoding header value allows gzip (q > 0)"""
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.partition(';')
+        if coding.strip().lower() not in ('gzip', '*'):
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        return q > 0
+    return False
+
+
+def compress(body, level=1):
+    """gzip a body; mtime is fixed so identical results give identical bytes"""
+    return gzip.compress(body, compresslevel=level, mtime=0)
@@ -0,0 +1,108 @@
+"""
+Blank page pre-screen ahead of text detection.
+
+Scanned batches carry blank pages, separator sheets and near-uniform
+backgrounds that would otherwise take a full detection pass to return no
+lines. The screen works on a thumbnail of the page (area-averaged, so
+scanner noise averages out while text strokes survive) and measures:
+
+  std           the largest grey-level standard deviation of a tile;
+                any dark mark the size of a page number raises it
+  edge_density  fraction of pixels with a Sobel gradient above
+                edge_threshold; catches faint text whose tiles stay
+                close to the paper colour
+  ink_ratio     fraction of pixels more than ink_delta grey levels from the
+                background, taken as the median of the thumbnail histogram
+                (so dark backgrounds work too)
+
+A page is blank only when all three are within their limits; anything
+else goes to the model as before. Thresholds err on the side of running
+the model: dust and uneven lighting are skipped, punch holes and a
+scanner shadow along an edge are not. benchmarks/bench_blank_screen.py
+reports the false-skip rate on a mixed corpus for a given setting.
+"""
+
+import cv2
+import numpy as np
+
+from ocr_metrics import REGISTRY
+
+BLANK_SCREENED = REGISTRY.counter(
+    'ocr_blank_screen_total', 'Images checked by the blank page pre-screen, by result (blank: skipped, content)')
+
+
+class BlankPage(list):
+    """Empty result for an image the pre-screen found blank; the type marks the skip"""
+
+    __slots__ = ()
+
+
+class BlankScreen:
+    """Classifies decoded images as blank from thumbnail statistics"""
+
+    def __init__(self, max_std=12.0, max_edge_density=0.005, max_ink_ratio=0.001,
+                 thumbnail=640, block=16, edge_threshold=64, ink_delta=48):
+        self.max_std = max_std
+        self.max_edge_density = max_edge_density
+        self.max_ink_ratio = max_ink_ratio
+        self.thumbnail = thumbnail
+        self.block = block
+        self.edge_threshold = edge_threshold
+        self.ink_delta = ink_delta
+
+    def thumbnail_of(self, img):
+        """Green channel halved with area averaging until it fits the thumbnail size
+
+        Halving keeps OpenCV on its fast integer-factor path, and green is
+        close to luminance for dark text on light paper without converting
+        the full-size page.
+        """
+        gray = cv2.extractChannel(img, 1) if img.ndim == 3 else img
+        while max(gray.shape) > self.thumbnail:
+            height, width = gray.shape[0] // 2, gray.shape[1] // 2
+            gray = cv2.resize(gray[:2 * height, :2 * width], (width, height), interpolation=cv2.INTER_AREA)
+        return gray
+
+    def measure(self, img, stop_early=False):
+        """std, edge_density and ink_ratio of an image (BGR or greyscale)
+
+        std is the largest standard deviation of a block x block tile of
+        the thumbnail: the whole-page variance of a page holding only a
+        page number is as low as that of a noisy blank scan, the variance
+        of the tile holding the number is not. With stop_early the
+        remaining statistics are skipped once one is over its limit.
+        """
+        gray = self.thumbnail_of(img)
+        height, width = gray.shape[0] // self.block * self.block, gray.shape[1] // self.block * self.block
+        tiles = gray[:height, :width].astype(np.float32) if height and width else gray.astype(np.float32)
+        size = (max(1, tiles.shape[1] // self.block), max(1, tiles.shape[0] // self.block))
+        mean = cv2.resize(tiles, size, interpolation=cv2.INTER_AREA)
+        mean_square = cv2.resize(tiles * tiles, size, interpolation=cv2.INTER_AREA)
+        stats = {'std': float(np.sqrt(max(0.0, float((mean_square - mean * mean).max()))))}
+        if stop_early and stats['std'] > self.max_std:
+            return stats
+
+        pixels = gray.size
+        gx = cv2.Sobel(gray, cv2.CV_16S, 1, 0)
+        gy = cv2.Sobel(gray, cv2.CV_16S, 0, 1)
+        magnitude = cv2.add(cv2.convertScaleAbs(gx), cv2.convertScaleAbs(gy))
+        stats['edge_density'] = cv2.countNonZero(cv2.threshold(magnitude, self.edge_threshold, 255,
+                                                               cv2.THRESH_BINARY)[1]) / pixels
+        if stop_early and stats['edge_density'] > self.max_edge_density:
+            return stats
+
+        histogram = np.bincount(gray.ravel(), minlength=256)
+        cumulative = np.cumsum(histogram)
+        background = int(np.searchsorted(cumulative, pixels / 2))
+        low, high = background - self.ink_delta, background + self.ink_delta
+        ink = (cumulative[low - 1] if low > 0 else 0) + (pixels - cumulative[high] if high < 255 else 0)
+        stats['ink_ratio'] = float(ink) / pixels
+        return stats
+
+    def is_blank(self, img):
+        """True if the image has no text worth running detection on"""
+        stats = self.measure(img, stop_early=True)
+        blank = (stats['std'] <= self.max_std and stats.get('edge_density', 1.0) <= self.max_edge_density
+                 and stats.get('ink_ratio', 1.0) <= self.max_ink_ratio)
+        BLANK_SCREENED.inc(result='blank' if blank else 'content')
+        return blank
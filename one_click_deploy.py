@@ -4,18 +4,62 @@ PaddleOCR SageMaker G5.xlarge 一键部署脚本
 使用方法: 
   python3 one_click_deploy.py                    # 默认部署到us-east-1
   python3 one_click_deploy.py --region eu-west-1 # 部署到指定区域
+
+  # 容量规划: 根据各实例类型的压测结果 (benchmark.py --output) 和流量画像，
+  # 选出满足 p99 SLO 且成本最低的实例类型、实例数和每实例并发，
+  # 并生成端点配置和 Application Auto Scaling 目标跟踪策略 (只打印，不部署)
+  python3 one_click_deploy.py --plan g5.json g4dn.json --traffic traffic.json
+  python3 one_click_deploy.py --plan g5.json g4dn.json --peak-qps 40 --p99-ms 800 --apply
+
+规划和部署使用的 SageMaker / Application Auto Scaling 请求参数由独立函数生成
+(model_request / endpoint_config_request / scaling_requests)，调用处接受外部传入的 boto3 客户端，
+可以用 botocore Stubber 离线验证: python3 benchmarks/check_deploy_plan.py
 """
 
 import boto3
 import time
 import subprocess
-import base64
 import json
 import argparse
+import math
 
 # 配置
 ECR_REPO_NAME = 'paddleocr-g5'
 IMAGE_TAG = 'latest'
+DEFAULT_INSTANCE_TYPE = 'ml.g5.xlarge'
+VARIANT_NAME = 'AllTraffic'
+
+# SageMaker 实时推理按需价格 (us-east-1，美元/小时)，仅用于比较实例类型；
+# 其他区域或最新价格用 --price ml.g5.xlarge=1.41 覆盖
+INSTANCE_PRICES = {
+    'ml.g4dn.xlarge': 0.736,
+    'ml.g4dn.2xlarge': 0.94,
+    'ml.g5.xlarge': 1.408,
+    'ml.g5.2xlarge': 1.515,
+    'ml.g5.4xlarge': 2.03,
+    'ml.c5.xlarge': 0.204,
+    'ml.c5.2xlarge': 0.408,
+    'ml.m5.xlarge': 0.23,
+}
+
+# 流量画像默认值 (--traffic JSON 文件中的同名字段、--peak-qps 等参数覆盖)
+DEFAULT_TRAFFIC = {
+    'peak_qps': None,        # 峰值请求速率 (每秒调用次数，必填)
+    'min_qps': 0,            # 低谷请求速率，决定自动扩缩容的最小实例数
+    'p99_ms': 1000,          # 延迟 SLO
+    'headroom': 0.25,        # 每个实例预留的容量比例，在扩容生效前吸收突增
+    'burst': 1.5,            # 自动扩缩容上限按峰值的倍数预留
+    'min_instances': 1,
+    'max_error_rate': 0.01,  # 错误 (含 429/503) 比例超过该值的压测结果视为过载，不参与规划
+    'pipeline': 'full',      # 使用哪种流水线模式的压测结果
+}
+
+# 容量规划假定的 gunicorn worker 数 (--workers 覆盖)。OCR_MAX_IN_FLIGHT 按 worker 计，
+# 因此按规划部署时 OCR_WORKERS 与 OCR_MAX_IN_FLIGHT 一起写入容器环境变量，
+# 不依赖 Dockerfile_gpu 中 OCR_WORKERS 的默认值
+SERVER_WORKERS = 2
+SCALE_OUT_COOLDOWN = 60
+SCALE_IN_COOLDOWN = 300
 
 def check_prerequisites():
     """检查部署前提条件"""
@@ -71,9 +115,184 @@ def create_iam_role(region):
     except iam.exceptions.EntityAlreadyExistsException:
         print("✅ IAM角色已存在")
 
-def deploy_paddleocr_g5(region):
+def load_benchmarks(paths):
+    """读取 benchmark.py --output 的结果文件 (单条或列表)，每条需要 instance_type"""
+    reports = []
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f)
+        for report in data if isinstance(data, list) else [data]:
+            if not report.get('instance_type'):
+                raise ValueError(f"{path}: 压测结果缺少 instance_type (压测时加 --instance-type 记录)")
+            reports.append(report)
+    return reports
+
+def load_traffic(path=None, **overrides):
+    """流量画像: 默认值 <- JSON 文件 <- 非空的命令行参数"""
+    traffic = dict(DEFAULT_TRAFFIC)
+    if path:
+        with open(path) as f:
+            traffic.update(json.load(f))
+    traffic.update((key, value) for key, value in overrides.items() if value is not None)
+    if not traffic['peak_qps'] or traffic['peak_qps'] <= 0:
+        raise ValueError('流量画像需要 peak_qps (峰值请求速率)')
+    if not 0 <= traffic['headroom'] < 1:
+        raise ValueError('headroom 需在 [0, 1) 之间')
+    return traffic
+
+def instance_capacity(report):
+    """一条压测结果的 (每实例 QPS, 每实例在途请求数)
+    
+    压测端点有多个实例时按 instance_count 平分；开环压测没有固定并发，
+    按 Little 定律 (QPS x 平均延迟) 估算在途请求数。
+    """
+    count = report.get('instance_count') or 1
+    concurrency = report.get('concurrency')
+    if concurrency is None:
+        concurrency = report['qps'] * (report['latency_ms']['mean'] or 0) / 1000
+    return report['qps'] / count, concurrency / count
+
+def plan_capacity(reports, traffic, prices=None, workers=SERVER_WORKERS):
+    """选出满足 p99 SLO 且每小时成本最低的实例类型、实例数和每实例并发
+    
+    每种实例类型取 p99 不超过 SLO、错误率不超标的压测结果中 QPS 最高的一条作为
+    单实例容量，扣除 headroom 后作为每实例目标 QPS (也是自动扩缩容的跟踪目标)，
+    按峰值 QPS 算出实例数。成本相同时选 p99 更低的。workers 为每个实例的
+    gunicorn worker 数，部署时写入 OCR_WORKERS。
+    """
+    prices = {**INSTANCE_PRICES, **(prices or {})}
+    best = {}
+    for report in reports:
+        p99 = report['latency_ms']['p99']
+        if (report.get('pipeline') or 'full') != traffic['pipeline'] or p99 is None or p99 > traffic['p99_ms']:
+            continue
+        if report['requests'] and report['errors'] / report['requests'] > traffic['max_error_rate']:
+            continue
+        qps, concurrency = instance_capacity(report)
+        current = best.get(report['instance_type'])
+        if current is None or qps > current['capacity_qps']:
+            best[report['instance_type']] = {'instance_type': report['instance_type'], 'capacity_qps': qps,
+                                             'concurrency': concurrency, 'p99_ms': p99}
+    
+    candidates = []
+    for instance_type, entry in best.items():
+        if instance_type not in prices:
+            print(f"⚠️ 缺少 {instance_type} 的价格 (用 --price {instance_type}=<美元/小时> 指定)，跳过")
+            continue
+        target_qps = entry['capacity_qps'] * (1 - traffic['headroom'])
+        if target_qps <= 0:
+            continue
+        count = max(traffic['min_instances'], math.ceil(traffic['peak_qps'] / target_qps))
+        candidates.append({**entry, 'target_qps': target_qps, 'instance_count': count,
+                           'price': prices[instance_type], 'hourly_cost': count * prices[instance_type]})
+    if not candidates:
+        raise ValueError(f"没有满足 p99 <= {traffic['p99_ms']}ms 的 {traffic['pipeline']} 压测结果")
+    candidates.sort(key=lambda c: (c['hourly_cost'], c['p99_ms']))
+    
+    plan = dict(candidates[0])
+    target_qps, count = plan['target_qps'], plan['instance_count']
+    plan['min_capacity'] = min(count, max(1, traffic['min_instances'],
+                                          math.ceil(traffic['min_qps'] / target_qps)))
+    plan['max_capacity'] = max(count, math.ceil(traffic['peak_qps'] * traffic['burst'] / target_qps))
+    # SLO 是在 concurrency 个在途请求下测得的；请求在 worker 之间并不均匀分布，
+    # 每个 worker 都要能独自容纳整个实例的 concurrency，再加上它平分到的一份突发排队，
+    # 超出后快速返回 429 让客户端退避重试，而不是让所有请求一起超时
+    plan['workers'] = max(1, workers)
+    plan['max_in_flight'] = max(1, math.ceil(plan['concurrency'] + plan['concurrency'] / plan['workers']))
+    plan['traffic'] = traffic
+    plan['candidates'] = candidates
+    return plan
+
+def default_plan():
+    """未做容量规划时的部署: 单个 ml.g5.xlarge，不配置自动扩缩容"""
+    return {'instance_type': DEFAULT_INSTANCE_TYPE, 'instance_count': 1, 'concurrency': 4,
+            'price': INSTANCE_PRICES[DEFAULT_INSTANCE_TYPE],
+            'hourly_cost': INSTANCE_PRICES[DEFAULT_INSTANCE_TYPE],
+            'min_capacity': None, 'max_capacity': None, 'workers': None, 'max_in_flight': None}
+
+def model_request(plan, model_name, image_uri, role_arn, model_data=None):
+    """create_model 参数；规划的 worker 数和每 worker 在途上限通过容器环境变量下发
+    
+    model_data 为模型库 (ocr_model_store.py build 的目录) 打包的
+    model.tar.gz 的 S3 地址，SageMaker 将其解压到 /opt/ml/model，
+    优先于镜像内置的模型库。
+    """
+    container = {'Image': image_uri, 'Mode': 'SingleModel'}
+    if model_data:
+        container['ModelDataUrl'] = model_data
+    if plan.get('max_in_flight'):
+        container['Environment'] = {'OCR_WORKERS': str(plan['workers']),
+                                    'OCR_MAX_IN_FLIGHT': str(plan['max_in_flight'])}
+    return {'ModelName': model_name, 'PrimaryContainer': container, 'ExecutionRoleArn': role_arn}
+
+def endpoint_config_request(plan, config_name, model_name):
+    """create_endpoint_config 参数"""
+    return {
+        'EndpointConfigName': config_name,
+        'ProductionVariants': [{
+            'VariantName': VARIANT_NAME,
+            'ModelName': model_name,
+            'InitialInstanceCount': plan['instance_count'],
+            'InstanceType': plan['instance_type'],
+            'InitialVariantWeight': 1
+        }]
+    }
+
+def scaling_requests(plan, endpoint_name):
+    """register_scalable_target 和 put_scaling_policy 参数
+    
+    目标跟踪 SageMakerVariantInvocationsPerInstance (每实例每分钟调用数)，
+    目标值为规划的每实例目标 QPS x 60。
+    """
+    resource = {
+        'ServiceNamespace': 'sagemaker',
+        'ResourceId': f'endpoint/{endpoint_name}/variant/{VARIANT_NAME}',
+        'ScalableDimension': 'sagemaker:variant:DesiredInstanceCount',
+    }
+    target = {**resource, 'MinCapacity': plan['min_capacity'], 'MaxCapacity': plan['max_capacity']}
+    policy = {
+        **resource,
+        'PolicyName': f'{endpoint_name}-invocations-per-instance',
+        'PolicyType': 'TargetTrackingScaling',
+        'TargetTrackingScalingPolicyConfiguration': {
+            'TargetValue': round(plan['target_qps'] * 60, 1),
+            'PredefinedMetricSpecification': {'PredefinedMetricType': 'SageMakerVariantInvocationsPerInstance'},
+            'ScaleOutCooldown': SCALE_OUT_COOLDOWN,
+            'ScaleInCooldown': SCALE_IN_COOLDOWN,
+        },
+    }
+    return target, policy
+
+def configure_autoscaling(autoscaling, endpoint_name, plan):
+    """为端点变体注册可扩缩目标并设置目标跟踪策略"""
+    print(f"📈 配置自动扩缩容: {plan['min_capacity']}-{plan['max_capacity']} 个实例，"
+          f"目标 {plan['target_qps']:.1f} QPS/实例")
+    target, policy = scaling_requests(plan, endpoint_name)
+    autoscaling.register_scalable_target(**target)
+    autoscaling.put_scaling_policy(**policy)
+
+def print_plan(plan, endpoint_name='<endpoint-name>'):
+    """打印候选实例类型对比、选中的方案和对应的请求参数"""
+    traffic = plan['traffic']
+    print(f"📐 容量规划: 峰值 {traffic['peak_qps']} QPS, p99 <= {traffic['p99_ms']}ms, "
+          f"预留 {traffic['headroom']:.0%}")
+    print(f"{'实例类型':<18} {'单实例QPS':>10} {'并发':>6} {'p99(ms)':>9} {'实例数':>6} {'$/小时':>9}")
+    for c in plan['candidates']:
+        marker = ' ✅' if c['instance_type'] == plan['instance_type'] else ''
+        print(f"{c['instance_type']:<18} {c['capacity_qps']:>10.1f} {c['concurrency']:>6.1f} "
+              f"{c['p99_ms']:>9.0f} {c['instance_count']:>6} {c['hourly_cost']:>9.2f}{marker}")
+    target, policy = scaling_requests(plan, endpoint_name)
+    print(json.dumps({
+        'create_endpoint_config': endpoint_config_request(plan, '<config-name>', '<model-name>'),
+        'container_environment': model_request(plan, '', '', '')['PrimaryContainer'].get('Environment', {}),
+        'register_scalable_target': target,
+        'put_scaling_policy': policy,
+    }, indent=2, ensure_ascii=False))
+
+def deploy_paddleocr_g5(region, plan=None, model_data=None):
     """一键部署PaddleOCR G5端点到指定区域"""
-    print(f"🚀 开始部署PaddleOCR G5.xlarge端点到 {region}...")
+    plan = plan or default_plan()
+    print(f"🚀 开始部署PaddleOCR {plan['instance_type']} x {plan['instance_count']} 端点到 {region}...")
     
     account_id = boto3.client('sts').get_caller_identity()['Account']
     
@@ -135,30 +354,14 @@ def deploy_paddleocr_g5(region):
     
     # 创建模型
     print("🤖 创建SageMaker模型...")
-    sagemaker.create_model(
-        ModelName=model_name,
-        PrimaryContainer={
-            'Image': image_uri,
-            'Mode': 'SingleModel'
-        },
-        ExecutionRoleArn=role_arn
-    )
+    sagemaker.create_model(**model_request(plan, model_name, image_uri, role_arn, model_data))
     
     # 创建端点配置
-    print("⚙️ 创建G5端点配置...")
-    sagemaker.create_endpoint_config(
-        EndpointConfigName=config_name,
-        ProductionVariants=[{
-            'VariantName': 'AllTraffic',
-            'ModelName': model_name,
-            'InitialInstanceCount': 1,
-            'InstanceType': 'ml.g5.xlarge',
-            'InitialVariantWeight': 1
-        }]
-    )
+    print("⚙️ 创建端点配置...")
+    sagemaker.create_endpoint_config(**endpoint_config_request(plan, config_name, model_name))
     
     # 创建端点
-    print("🎯 创建G5端点...")
+    print("🎯 创建端点...")
     sagemaker.create_endpoint(
         EndpointName=endpoint_name,
         EndpointConfigName=config_name
@@ -168,17 +371,21 @@ def deploy_paddleocr_g5(region):
     waiter = sagemaker.get_waiter('endpoint_in_service')
     waiter.wait(EndpointName=endpoint_name)
     
+    # 自动扩缩容只能在端点 InService 后注册
+    if plan.get('max_capacity'):
+        configure_autoscaling(boto3.client('application-autoscaling', region_name=region), endpoint_name, plan)
+    
     print("🎉 部署完成!")
     print(f"📋 端点信息:")
     print(f"   - 名称: {endpoint_name}")
     print(f"   - 区域: {region}")
-    print(f"   - 实例: ml.g5.xlarge (NVIDIA A10G, 24GB)")
+    print(f"   - 实例: {plan['instance_type']} x {plan['instance_count']}")
     print(f"   - 状态: InService")
     
     return endpoint_name, region
 
-def performance_test(endpoint_name, region):
-    """性能测试"""
+def performance_test(endpoint_name, region, concurrency=4):
+    """性能测试，返回 benchmark 汇总 (没有成功请求时返回 None)"""
     print(f"🧪 在 {region} 进行性能测试...")
     
     from PIL import Image, ImageDraw
@@ -191,53 +398,44 @@ def performance_test(endpoint_name, region):
     
     buffer = io.BytesIO()
     img.save(buffer, format='JPEG')
-    image_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    
-    # 性能测试
-    runtime = boto3.client('sagemaker-runtime', region_name=region)
-    times = []
-    
-    for i in range(3):
-        start_time = time.time()
-        response = runtime.invoke_endpoint(
-            EndpointName=endpoint_name,
-            ContentType='application/json',
-            Body=json.dumps({'image': image_data})
-        )
-        end_time = time.time()
-        times.append(end_time - start_time)
     
-    avg_time = sum(times) / len(times)
-    min_time = min(times)
+    # 压测: 闭环 20 秒，前 5 秒预热不计入
+    import benchmark
+    target = benchmark.EndpointTarget(endpoint_name, region, concurrency=concurrency)
+    payloads = benchmark.build_payloads([('test.jpg', buffer.getvalue())], 'json')
+    summary = benchmark.run(target, payloads, concurrency=concurrency, duration=20, warmup=5)
+    latency = summary['latency_ms']
+    if latency['p50'] is None:
+        print(f"❌ 性能测试没有成功的请求: {summary['status_counts']}")
+        return None
     
-    print(f"⚡ 平均推理时间: {avg_time:.3f}秒")
-    print(f"🚀 最快推理时间: {min_time:.3f}秒")
+    print(f"🚀 吞吐: {summary['qps']:.2f} QPS ({concurrency}并发)")
+    print(f"⚡ p50/p90/p99: {latency['p50']:.0f}ms / {latency['p90']:.0f}ms / {latency['p99']:.0f}ms")
+    print(f"📨 请求数: {summary['requests']} (失败 {summary['errors']})")
+    return summary
 
-def generate_usage_code(endpoint_name, region):
+def generate_usage_code(endpoint_name, region, concurrency=8):
     """生成使用代码示例"""
     code = f'''
-# PaddleOCR {region} 端点使用示例
-import boto3
-import json
-import base64
+# PaddleOCR {region} 端点使用示例 (需要与本仓库的 ocr_client.py 放在同一目录)
+import glob
 
-# 读取图片
-with open('image.jpg', 'rb') as f:
-    image_data = base64.b64encode(f.read()).decode('utf-8')
+from ocr_client import OCRClient
 
-# 调用{region}端点
-runtime = boto3.client('sagemaker-runtime', region_name='{region}')
-response = runtime.invoke_endpoint(
-    EndpointName='{endpoint_name}',
-    ContentType='application/json',
-    Body=json.dumps({{'image': image_data}})
-)
+client = OCRClient.for_endpoint('{endpoint_name}', region='{region}', concurrency={concurrency})
 
-# 解析结果
-result = json.loads(response['Body'].read().decode())
+# 单张图片
+result = client.ocr('image.jpg')
 for detection in result['detections']:
     print(f"文字: {{detection['text']}}")
     print(f"置信度: {{detection['confidence']:.1%}}")
+
+# 大量图片: 自动打包批量请求、并发发送，结果按输入顺序返回
+paths = sorted(glob.glob('images/*.jpg'))
+for path, result in zip(paths, client.ocr_many(paths)):
+    print(path, result.get('count', result.get('error')))
+
+client.close()
 '''
     
     with open(f'usage_example_{region.replace("-", "_")}.py', 'w') as f:
@@ -250,12 +448,44 @@ def main():
     parser = argparse.ArgumentParser(description='PaddleOCR SageMaker G5.xlarge 部署')
     parser.add_argument('--region', '-r', default='us-east-1',
                        help='AWS区域 (默认: us-east-1)')
+    parser.add_argument('--plan', nargs='+', metavar='BENCH_JSON',
+                       help='容量规划: 各实例类型的 benchmark.py 压测结果文件')
+    parser.add_argument('--traffic', help='流量画像 JSON 文件 (字段见 DEFAULT_TRAFFIC)')
+    parser.add_argument('--peak-qps', type=float, help='峰值请求速率 (覆盖流量画像)')
+    parser.add_argument('--min-qps', type=float, help='低谷请求速率 (覆盖流量画像)')
+    parser.add_argument('--p99-ms', type=float, help='p99 延迟 SLO (覆盖流量画像)')
+    parser.add_argument('--price', action='append', default=[], metavar='TYPE=USD',
+                       help='实例每小时价格，例如 ml.g5.xlarge=1.41')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS,
+                       help=f'每个实例的 gunicorn worker 数 (默认 {SERVER_WORKERS}，部署时写入 OCR_WORKERS)')
+    parser.add_argument('--plan-output', help='规划结果写入 JSON 文件')
+    parser.add_argument('--apply', action='store_true', help='按规划结果部署 (否则只打印规划)')
+    parser.add_argument('--model-data', metavar='S3_URI',
+                       help='模型库 model.tar.gz 的 S3 地址 (挂载到 /opt/ml/model，默认使用镜像内置模型库)')
     
     args = parser.parse_args()
     region = args.region
     
+    plan = None
+    if args.plan:
+        try:
+            prices = {name: float(value) for name, value in (p.split('=', 1) for p in args.price)}
+            traffic = load_traffic(args.traffic, peak_qps=args.peak_qps, min_qps=args.min_qps,
+                                   p99_ms=args.p99_ms)
+            plan = plan_capacity(load_benchmarks(args.plan), traffic, prices, args.workers)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ 容量规划失败: {e}")
+            return
+        print_plan(plan)
+        if args.plan_output:
+            with open(args.plan_output, 'w') as f:
+                json.dump(plan, f, indent=2, ensure_ascii=False)
+        if not args.apply:
+            return
+    plan = plan or default_plan()
+    
     print("=" * 70)
-    print(f"🚀 PaddleOCR SageMaker G5.xlarge 部署到 {region}")
+    print(f"🚀 PaddleOCR SageMaker {plan['instance_type']} x {plan['instance_count']} 部署到 {region}")
     print("=" * 70)
     
     if not check_prerequisites():
@@ -263,18 +493,23 @@ def main():
         return
     
     create_iam_role(region)
-    result = deploy_paddleocr_g5(region)
+    result = deploy_paddleocr_g5(region, plan, args.model_data)
     
     if result:
         endpoint_name, deployed_region = result
-        performance_test(endpoint_name, deployed_region)
-        generate_usage_code(endpoint_name, deployed_region)
+        # 以单实例规划并发压测 (请求会分散到所有实例)
+        concurrency = max(1, math.ceil(plan['concurrency']))
+        summary = performance_test(endpoint_name, deployed_region, concurrency)
+        generate_usage_code(endpoint_name, deployed_region, concurrency * plan['instance_count'])
         
         print(f"\n🎯 {deployed_region} 部署成功!")
         print(f"📝 端点名称: {endpoint_name}")
         print(f"🌍 部署区域: {deployed_region}")
-        print(f"💰 成本: ~$1.006/小时")
-        print(f"⚡ 性能: 0.2-0.3秒热推理")
+        print(f"💰 成本: ~${plan['hourly_cost']:.2f}/小时 ({plan['instance_type']} x {plan['instance_count']}, "
+              f"按 ${plan['price']:.3f}/小时/实例估算)")
+        if summary:
+            latency = summary['latency_ms']
+            print(f"⚡ 性能: p50 {latency['p50']:.0f}ms / p99 {latency['p99']:.0f}ms, {summary['qps']:.1f} QPS")
     else:
         print("❌ 部署失败")
 
@@ -7,7 +7,6 @@ PaddleOCR SageMaker G5.xlarge 一键部署脚本
 import boto3
 import time
 import subprocess
-import base64
 import json
 
 # 配置
@@ -190,21 +189,18 @@ def performance_test(endpoint_name):
     
     buffer = io.BytesIO()
     img.save(buffer, format='JPEG')
-    image_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
     
-    # 性能测试
-    runtime = boto3.client('sagemaker-runtime', region_name=REGION)
+    # 性能测试 (原始字节请求，连接复用)
+    from ocr_client import OCRClient
+    client = OCRClient.for_endpoint(endpoint_name, REGION)
     times = []
     
     for i in range(3):
         start_time = time.time()
-        response = runtime.invoke_endpoint(
-            EndpointName=endpoint_name,
-            ContentType='application/json',
-            Body=json.dumps({'image': image_data})
-        )
+        client.ocr(buffer.getvalue())
         end_time = time.time()
         times.append(end_time - start_time)
+    client.close()
     
     avg_time = sum(times) / len(times)
     min_time = min(times)
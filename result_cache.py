@@ -0,0 +1,218 @@
+"""
+Content-addressed OCR result cache.
+
+Results are keyed by a hash of the decoded image pixels plus the OCR
+settings, so the same page resubmitted in a different encoding still hits.
+The memory tier is an LRU bounded by an estimate of the stored result size,
+with a TTL. The optional disk tier keeps JSON files in a directory (e.g.
+under /tmp) so entries survive worker restarts and are shared between
+workers.
+
+LineCache is the finer-grained counterpart inside the pipeline: it maps
+normalized text line crops to their recognized text, so labels and
+headers repeated on every page of a form skip the recognition model.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from ocr_metrics import REGISTRY
+
+CACHE_HITS = REGISTRY.counter('ocr_cache_hits_total', 'Result cache hits by tier')
+CACHE_MISSES = REGISTRY.counter('ocr_cache_misses_total', 'Result cache misses')
+CACHE_BYTES = REGISTRY.gauge('ocr_cache_memory_bytes', 'Estimated size of the in-memory result cache')
+LINE_CACHE_HITS = REGISTRY.counter('ocr_line_cache_hits_total', 'Text line crops answered by the line cache')
+LINE_CACHE_MISSES = REGISTRY.counter('ocr_line_cache_misses_total', 'Text line crops not found in the line cache')
+LINE_CACHE_ENTRIES = REGISTRY.gauge('ocr_line_cache_entries', 'Entries in the line recognition cache')
+
+# Line crops are normalized to this height before hashing
+LINE_HEIGHT = 32
+LINE_HASH_METHODS = ('exact', 'perceptual')
+
+
+def image_key(img_array, settings):
+    """Hash the decoded pixels, their shape and the OCR settings string"""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr(img_array.shape).encode())
+    digest.update(settings.encode())
+    digest.update(memoryview(img_array).cast('B') if img_array.flags.c_contiguous else img_array.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """LRU + TTL memory cache with an optional on-disk tier"""
+
+    def __init__(self, max_bytes, ttl, disk_dir=None, disk_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> (expires, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        """Return the cached value or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    CACHE_HITS.inc(tier='memory')
+                    return entry[2]
+                self._remove(key)
+
+        value = self._disk_get(key, now)
+        if value is not None:
+            CACHE_HITS.inc(tier='disk')
+            self._memory_put(key, value, json.dumps(value))
+            return value
+        CACHE_MISSES.inc()
+        return None
+
+    def put(self, key, value):
+        encoded = json.dumps(value)
+        self._memory_put(key, value, encoded)
+        if self.disk_dir:
+            self._disk_put(key, encoded)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _memory_put(self, key, value, encoded):
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            CACHE_BYTES.set(self._bytes)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + '.json')
+
+    def _disk_get(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl <= now:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key, encoded):
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(encoded)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Result cache disk write failed: {e}")
+            return
+        self._disk_writes += 1
+        if self.disk_max_bytes and self._disk_writes % 100 == 0:
+            self._disk_prune()
+
+    def _disk_prune(self):
+        """Drop expired files, then the oldest ones until under the size limit"""
+        now = time.time()
+        files = []
+        with os.scandir(self.disk_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if mtime + self.ttl > now and total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class LineCache:
+    """LRU of recognition results keyed by a hash of the normalized line crop
+
+    'exact' hashes the crop converted to grayscale and resized to a fixed
+    height, so only pixel-identical lines hit (e.g. pages rasterized from
+    the same PDF template). 'perceptual' hashes the low frequencies of a
+    16px-high thumbnail, which also matches some scans of the same printed
+    line that were shifted or re-compressed. It can in principle map two
+    lines that differ in one small glyph to the same entry; use it for
+    templates where that is acceptable.
+    """
+
+    def __init__(self, max_entries, method='exact'):
+        if method not in LINE_HASH_METHODS:
+            raise ValueError(f"Unknown line hash '{method}' (choose from {', '.join(LINE_HASH_METHODS)})")
+        self.max_entries = max_entries
+        self.method = method
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, crop, namespace):
+        """Hash of a line crop for one model and pipeline configuration (namespace)"""
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        height, width = gray.shape[:2]
+        digest = hashlib.blake2b(namespace.encode(), digest_size=16)
+        if self.method == 'perceptual':
+            # DCT hash: signs of the low-frequency coefficients against their
+            # median survive JPEG noise and small shifts; width is rounded to
+            # 16px so the coefficient count does not change with a pixel
+            thumb_width = max(16, int(round(width * 16 / height / 16)) * 16)
+            thumb = cv2.resize(gray.astype(np.float32), (thumb_width, 16), interpolation=cv2.INTER_AREA)
+            low = cv2.dct(thumb)[:4, :thumb_width // 4].flatten()[1:]
+            digest.update(repr(thumb_width).encode() + np.packbits(low > np.median(low)).tobytes())
+        else:
+            norm_width = max(1, int(round(width * LINE_HEIGHT / height)))
+            digest.update(repr(norm_width).encode())
+            digest.update(cv2.resize(np.ascontiguousarray(gray), (norm_width, LINE_HEIGHT),
+                                     interpolation=cv2.INTER_AREA).tobytes())
+        return digest.digest()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                LINE_CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+        LINE_CACHE_HITS.inc()
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            LINE_CACHE_ENTRIES.set(len(self._entries))
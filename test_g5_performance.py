@@ -1,75 +1,55 @@
-import boto3
-import json
-import base64
-import time
+import argparse
 
-def test_g5_performance():
+import benchmark
+from ocr_client import OCRClient
+
+def test_g5_performance(endpoint_name='paddleocr-g5-endpoint-1758025210', region='us-east-1',
+                        concurrency=1, duration=20, warmup=5):
     """测试G5.xlarge性能"""
-    
+
     # 读取测试图片
     with open('img.jpg', 'rb') as f:
-        image_data = base64.b64encode(f.read()).decode('utf-8')
-    
-    payload = {'image': image_data}
-    runtime = boto3.client('sagemaker-runtime', region_name='us-east-1')
-    
-    # 新的G5端点
-    endpoint_name = 'paddleocr-g5-endpoint-1758025210'
-    
+        image_bytes = f.read()
+
     print("=" * 70)
     print("🚀 PaddleOCR G5.xlarge 性能测试")
     print("=" * 70)
     print(f"📸 测试图片: img.jpg")
     print(f"🎯 端点: {endpoint_name}")
     print(f"💻 实例: ml.g5.xlarge (NVIDIA A10G)")
+    print(f"🔀 并发: {concurrency}  ⏳ 时长: {duration}秒 (预热 {warmup}秒不计入)")
     print()
-    
-    # 进行多次测试以获得平均性能
-    times = []
-    results = []
-    
-    for i in range(3):
-        print(f"🧪 测试 {i+1}/3...")
-        
-        start_time = time.time()
-        response = runtime.invoke_endpoint(
-            EndpointName=endpoint_name,
-            ContentType='application/json',
-            Body=json.dumps(payload)
-        )
-        end_time = time.time()
-        
-        inference_time = end_time - start_time
-        times.append(inference_time)
-        
-        result = json.loads(response['Body'].read().decode())
-        results.append(result)
-        
-        print(f"   ⏱️ 推理时间: {inference_time:.3f}秒")
-        print(f"   📊 检测区域: {result['count']}个")
-        print()
-    
-    # 计算平均性能
-    avg_time = sum(times) / len(times)
-    min_time = min(times)
-    max_time = max(times)
-    
+
+    # 识别一次以展示结果
+    with OCRClient.for_endpoint(endpoint_name, region) as client:
+        result = client.ocr(image_bytes)
+
+    # 压测 (闭环、固定并发)
+    target = benchmark.EndpointTarget(endpoint_name, region, concurrency)
+    payloads = benchmark.build_payloads([('img.jpg', image_bytes)], 'json')
+    summary = benchmark.run(target, payloads, concurrency=concurrency, duration=duration, warmup=warmup)
+    latency = summary['latency_ms']
+    if latency['p50'] is None:
+        raise RuntimeError(f"没有成功的请求: {summary['status_counts']}")
+
     print("=" * 70)
     print("📊 性能统计")
     print("=" * 70)
-    print(f"⏱️ 平均推理时间: {avg_time:.3f}秒")
-    print(f"🚀 最快推理时间: {min_time:.3f}秒")
-    print(f"🐌 最慢推理时间: {max_time:.3f}秒")
+    print(f"📨 请求数: {summary['requests']} (失败 {summary['errors']})")
+    print(f"🚀 吞吐: {summary['qps']:.2f} QPS")
+    print(f"⏱️ 平均延迟: {latency['mean']:.1f}ms")
+    print(f"⏱️ p50/p90/p99: {latency['p50']:.1f}ms / {latency['p90']:.1f}ms / {latency['p99']:.1f}ms")
+    print(f"🚀 最快延迟: {latency['min']:.1f}ms")
+    print(f"🐌 最慢延迟: {latency['max']:.1f}ms")
     print()
-    
+
     # 显示识别结果
-    result = results[0]  # 使用第一次的结果
     print("📝 识别结果:")
     for i, detection in enumerate(result['detections'], 1):
         text = detection['text']
         confidence = detection['confidence']
         print(f"   {i}. '{text}' (置信度: {confidence:.1%})")
-    
+
     print()
     print("=" * 70)
     print("🎯 G5.xlarge 优势:")
@@ -78,17 +58,28 @@ def test_g5_performance():
     print("   - 更好的AI推理性能")
     print("   - 支持更大的模型和批处理")
     print("=" * 70)
-    
+
     return {
-        'avg_time': avg_time,
-        'min_time': min_time,
-        'max_time': max_time,
+        'avg_time': latency['mean'] / 1000,
+        'min_time': latency['min'] / 1000,
+        'max_time': latency['max'] / 1000,
+        'p50_time': latency['p50'] / 1000,
+        'p99_time': latency['p99'] / 1000,
+        'qps': summary['qps'],
         'detections': result['count']
     }
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PaddleOCR G5 端点性能测试')
+    parser.add_argument('--endpoint-name', default='paddleocr-g5-endpoint-1758025210')
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--concurrency', '-c', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=5)
+    args = parser.parse_args()
     try:
-        performance = test_g5_performance()
+        performance = test_g5_performance(args.endpoint_name, args.region, args.concurrency,
+                                          args.duration, args.warmup)
         print(f"\n✅ G5性能测试完成!")
     except Exception as e:
         print(f"❌ 测试失败: {e}")